@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
+from typing import Any
+
+from fastapi import APIRouter, Body, HTTPException
 
 from app.models import Background
+from app.services.patch_service import apply_patch_logged
+from app.services.storage_service import get_storage
 
 router = APIRouter()
-_backgrounds: dict[str, Background] = {}
+_backgrounds: dict[str, Background] = get_storage().table("backgrounds", Background)
 
 
 @router.get("")
@@ -33,6 +37,15 @@ def update_background(bg_id: str, bg: Background):
     return bg
 
 
+@router.patch("/{bg_id}", status_code=204)
+def patch_background(bg_id: str, patch: Any = Body(...)):
+    if bg_id not in _backgrounds:
+        raise HTTPException(404, "Background not found")
+    new, log = apply_patch_logged(_backgrounds[bg_id], patch)
+    with _backgrounds.patching(bg_id, log):  # WAL には変更ログだけを記録する
+        update_background(bg_id, new)
+
+
 @router.delete("/{bg_id}", status_code=204)
 def delete_background(bg_id: str):
     if bg_id not in _backgrounds:
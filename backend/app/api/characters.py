@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
+from typing import Any
+
+from fastapi import APIRouter, Body, HTTPException
 
 from app.models import Character
+from app.services.patch_service import apply_patch_logged
+from app.services.storage_service import get_storage
 
 router = APIRouter()
-_characters: dict[str, Character] = {}
+_characters: dict[str, Character] = get_storage().table("characters", Character)
 
 
 @router.get("")
@@ -33,6 +37,15 @@ def update_character(character_id: str, c: Character):
     return c
 
 
+@router.patch("/{character_id}", status_code=204)
+def patch_character(character_id: str, patch: Any = Body(...)):
+    if character_id not in _characters:
+        raise HTTPException(404, "Character not found")
+    new, log = apply_patch_logged(_characters[character_id], patch)
+    with _characters.patching(character_id, log):  # WAL には変更ログだけを記録する
+        update_character(character_id, new)
+
+
 @router.delete("/{character_id}", status_code=204)
 def delete_character(character_id: str):
     if character_id not in _characters:
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
+from typing import Any
+
+from fastapi import APIRouter, Body, HTTPException
 
 from app.models import Claim
+from app.services.patch_service import apply_patch_logged
+from app.services.storage_service import get_storage
 
 router = APIRouter()
-_claims: dict[str, Claim] = {}
+_claims: dict[str, Claim] = get_storage().table("claims", Claim)
 
 
 @router.get("")
@@ -33,6 +37,15 @@ def update_claim(claim_id: str, c: Claim):
     return c
 
 
+@router.patch("/{claim_id}", status_code=204)
+def patch_claim(claim_id: str, patch: Any = Body(...)):
+    if claim_id not in _claims:
+        raise HTTPException(404, "Claim not found")
+    new, log = apply_patch_logged(_claims[claim_id], patch)
+    with _claims.patching(claim_id, log):  # WAL には変更ログだけを記録する
+        update_claim(claim_id, new)
+
+
 @router.delete("/{claim_id}", status_code=204)
 def delete_claim(claim_id: str):
     if claim_id not in _claims:
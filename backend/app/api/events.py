@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
+from typing import Any
+
+from fastapi import APIRouter, Body, HTTPException
 
 from app.models import Event
+from app.services.patch_service import apply_patch_logged
+from app.services.storage_service import get_storage
 
 router = APIRouter()
-_events: dict[str, Event] = {}
+_events: dict[str, Event] = get_storage().table("events", Event)
 
 
 @router.get("")
@@ -33,6 +37,15 @@ def update_event(event_id: str, ev: Event):
     return ev
 
 
+@router.patch("/{event_id}", status_code=204)
+def patch_event(event_id: str, patch: Any = Body(...)):
+    if event_id not in _events:
+        raise HTTPException(404, "Event not found")
+    new, log = apply_patch_logged(_events[event_id], patch)
+    with _events.patching(event_id, log):  # WAL には変更ログだけを記録する
+        update_event(event_id, new)
+
+
 @router.delete("/{event_id}", status_code=204)
 def delete_event(event_id: str):
     if event_id not in _events:
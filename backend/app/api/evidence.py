@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
+from typing import Any
+
+from fastapi import APIRouter, Body, HTTPException
 
 from app.models import EvidenceItem
+from app.services.patch_service import apply_patch_logged
+from app.services.storage_service import get_storage
 
 router = APIRouter()
-_evidence: dict[str, EvidenceItem] = {}
+_evidence: dict[str, EvidenceItem] = get_storage().table("evidence", EvidenceItem)
 
 
 @router.get("")
@@ -33,6 +37,15 @@ def update_evidence(item_id: str, item: EvidenceItem):
     return item
 
 
+@router.patch("/{item_id}", status_code=204)
+def patch_evidence(item_id: str, patch: Any = Body(...)):
+    if item_id not in _evidence:
+        raise HTTPException(404, "Evidence not found")
+    new, log = apply_patch_logged(_evidence[item_id], patch)
+    with _evidence.patching(item_id, log):  # WAL には変更ログだけを記録する
+        update_evidence(item_id, new)
+
+
 @router.delete("/{item_id}", status_code=204)
 def delete_evidence(item_id: str):
     if item_id not in _evidence:
@@ -97,6 +97,7 @@ async def import_json(request: Request) -> dict[str, Any]:
         for raw in arr("locations"):
             loc = Location.model_validate(raw)
             locations_api._locations[loc.id] = loc
+        locations_api.reset_travel()
         summary["locations"] = len(locations_api._locations)
 
     def load_events() -> None:
@@ -124,27 +125,31 @@ async def import_json(request: Request) -> dict[str, Any]:
         graph_api._nodes.clear()
         graph_api._edges.clear()
         graph_api._logics.clear()
-        g = body.get("graph")
-        if g is None or not isinstance(g, dict):
-            summary["graph_nodes"] = 0
-            summary["graph_edges"] = 0
-            summary["graph_logics"] = 0
-            return
-        nodes_raw = g.get("nodes")
-        edges_raw = g.get("edges")
-        logics_raw = g.get("logics")
-        if isinstance(nodes_raw, list):
-            for raw in nodes_raw:
-                n = GraphNode.model_validate(raw)
-                graph_api._nodes[n.node_id] = n
-        if isinstance(edges_raw, list):
-            for raw in edges_raw:
-                e = GraphEdge.model_validate(raw)
-                graph_api._edges[e.edge_id] = e
-        if isinstance(logics_raw, list):
-            for raw in logics_raw:
-                l = Logic.model_validate(raw)
-                graph_api._logics[l.logic_id] = l
+        try:
+            g = body.get("graph")
+            if g is None or not isinstance(g, dict):
+                summary["graph_nodes"] = 0
+                summary["graph_edges"] = 0
+                summary["graph_logics"] = 0
+                return
+            nodes_raw = g.get("nodes")
+            edges_raw = g.get("edges")
+            logics_raw = g.get("logics")
+            if isinstance(nodes_raw, list):
+                for raw in nodes_raw:
+                    n = GraphNode.model_validate(raw)
+                    graph_api._nodes[n.node_id] = n
+            if isinstance(edges_raw, list):
+                for raw in edges_raw:
+                    e = GraphEdge.model_validate(raw)
+                    graph_api._edges[e.edge_id] = e
+            if isinstance(logics_raw, list):
+                for raw in logics_raw:
+                    l = Logic.model_validate(raw)
+                    graph_api._logics[l.logic_id] = l
+        finally:
+            # 途中で検証エラーになっても、インデックスは書き換え後の _nodes / _edges に合わせる
+            graph_api.rebuild_indexes()
         summary["graph_nodes"] = len(graph_api._nodes)
         summary["graph_edges"] = len(graph_api._edges)
         summary["graph_logics"] = len(graph_api._logics)
@@ -154,6 +159,7 @@ async def import_json(request: Request) -> dict[str, Any]:
         for raw in arr("timelines"):
             t = CharacterTimeline.model_validate(raw)
             timeline_api._timelines[t.character_id] = t
+        timeline_api.rebuild_indexes()
         summary["timelines"] = len(timeline_api._timelines)
 
     def load_scenarios() -> None:
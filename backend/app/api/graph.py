@@ -1,51 +1,186 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
-from collections import defaultdict
-
-from app.models import GraphNode, GraphEdge, Logic
+import threading
+from typing import Any, Iterable
+
+from fastapi import APIRouter, Body, HTTPException, Query
+
+from app.models import GraphNode, GraphEdge, Logic, NodeType, EdgeType
+from app.services.graph_service import (
+    ConnectedComponents,
+    DerivationIndex,
+    EdgeIndex,
+    ReachabilityIndex,
+    NODE_W,
+    LAYOUT_GAP,
+    event_group_child_position,
+    event_group_size,
+    find_contradictions,
+    hierarchical_layout,
+)
+from app.services.patch_service import apply_patch_logged
+from app.services.storage_service import get_storage
 
 router = APIRouter()
-_nodes: dict[str, GraphNode] = {}
-_edges: dict[str, GraphEdge] = {}
-_logics: dict[str, Logic] = {}
+_nodes: dict[str, GraphNode] = get_storage().table("graph_nodes", GraphNode)
+_edges: dict[str, GraphEdge] = get_storage().table("graph_edges", GraphEdge)
+_logics: dict[str, Logic] = get_storage().table("graph_logics", Logic)
+# 編集をまたいでロジックエンティティ（名前・init_node_id）が付いたラベルを残す
+_components = ConnectedComponents(
+    keep=lambda label: label in _logics,
+    anchor=lambda label: logic.init_node_id if (logic := _logics.get(label)) else None,
+)
+_adjacency = EdgeIndex()
+# 証拠ノードから supports / implies で辿れるか（秘密のバックトラックパス検証用）
+_backtrack = ReachabilityIndex()
+BACKTRACK_EDGE_TYPES = (EdgeType.supports, EdgeType.implies)
+# 公開証拠からの前向き推論（犯人決定可能性の検証用）
+_derivation = DerivationIndex()
+DERIVE_EDGE_TYPES = (EdgeType.supports, EdgeType.implies, EdgeType.rule_applies)
+_lock = threading.RLock()  # ノード・エッジとインデックスを一緒に更新する
+
+# グラフのリビジョン。変更のたびに増え、変更のあったロジックには _logic_revisions に記録する
+_revision = 0
+_logic_revisions: dict[str, int] = {}
+_layout_cache: dict[str, tuple[int, dict]] = {}  # logic_id -> (リビジョン, ロジック内レイアウト)
+_layout_response: dict | None = None  # 直近の GET /layout の結果（revision 付き）
+_contradictions: tuple[int, dict] | None = None  # (リビジョン, find_contradictions の結果)
+
+
+def _derivation_kind(edge_type: EdgeType) -> str | None:
+    if edge_type in DERIVE_EDGE_TYPES:
+        return DerivationIndex.DERIVE
+    if edge_type == EdgeType.refutes:
+        return DerivationIndex.REFUTE
+    return None
+
+
+def rebuild_indexes() -> None:
+    """_nodes / _edges を直接書き換えた後（起動時の復元・JSONインポート）にインデックスを作り直す。"""
+    with _lock:
+        _components.build(
+            _nodes.keys(),
+            ((e.source_node_id, e.target_node_id) for e in _edges.values()),
+        )
+        _adjacency.build((e.edge_id, e.source_node_id, e.target_node_id) for e in _edges.values())
+        _backtrack.build(
+            (n.node_id for n in _nodes.values() if n.node_type == NodeType.evidence),
+            ((e.source_node_id, e.target_node_id) for e in _edges.values() if e.edge_type in BACKTRACK_EDGE_TYPES),
+        )
+        _derivation.build(
+            (e.source_node_id, e.target_node_id, kind)
+            for e in _edges.values()
+            if (kind := _derivation_kind(e.edge_type)) is not None
+        )
+        _logic_revisions.clear()
+        _layout_cache.clear()
+        _touch()
+
+
+def _touch(*node_ids: str, logic_ids: tuple[str, ...] = ()) -> None:
+    """リビジョンを進め、node_ids の属するロジックと logic_ids を変更済みにする。"""
+    global _revision
+    _revision += 1
+    for node_id in node_ids:
+        label = _components.label_of(node_id)
+        if label is not None:
+            _logic_revisions[label] = _revision
+    for logic_id in logic_ids:
+        _logic_revisions[logic_id] = _revision
+
+
+def _drop_dangling(node_id: str) -> None:
+    """ノードが存在せず辺も残っていない頂点をインデックスから外す。"""
+    if node_id not in _nodes:
+        _components.remove_vertex(node_id)
+
+
+def _add_edge_index(e: GraphEdge) -> None:
+    _adjacency.add(e.edge_id, e.source_node_id, e.target_node_id)
+    _components.add_edge(e.source_node_id, e.target_node_id)
+    if e.edge_type in BACKTRACK_EDGE_TYPES:
+        _backtrack.add_edge(e.source_node_id, e.target_node_id)
+    kind = _derivation_kind(e.edge_type)
+    if kind is not None:
+        _derivation.add_edge(e.source_node_id, e.target_node_id, kind)
+
+
+def _remove_edge_index(e: GraphEdge) -> None:
+    _adjacency.remove(e.edge_id, e.source_node_id, e.target_node_id)
+    if e.edge_type in BACKTRACK_EDGE_TYPES:
+        _backtrack.remove_edge(e.source_node_id, e.target_node_id)
+    kind = _derivation_kind(e.edge_type)
+    if kind is not None:
+        _derivation.remove_edge(e.source_node_id, e.target_node_id, kind)
+    _components.remove_edge(e.source_node_id, e.target_node_id)
+    _drop_dangling(e.source_node_id)
+    _drop_dangling(e.target_node_id)
 
 
 def compute_connected_components() -> dict[str, str]:
     """
-    グラフの連結成分を計算し、ノードIDからロジックIDへのマッピングを返す。
+    ノードIDからロジックID（連結成分）へのマッピングを返す。
     ロジックIDは logic_0, logic_1, ... の形式。
+    連結成分は create/delete 時に増分更新済みなので、ここでは参照するだけ。
     """
-    # グラフを構築
-    graph: dict[str, set[str]] = defaultdict(set)
-    for edge in _edges.values():
-        graph[edge.source_node_id].add(edge.target_node_id)
-        graph[edge.target_node_id].add(edge.source_node_id)  # 無向グラフとして扱う
-    
-    # すべてのノードを含める（孤立ノードも）
-    for node_id in _nodes.keys():
-        if node_id not in graph:
-            graph[node_id] = set()
-    
-    # DFSで連結成分を探索
-    visited = set()
-    node_to_logic: dict[str, str] = {}
-    logic_counter = 0
-    
-    def dfs(node_id: str, logic_id: str):
-        if node_id in visited:
-            return
-        visited.add(node_id)
-        node_to_logic[node_id] = logic_id
-        for neighbor in graph[node_id]:
-            dfs(neighbor, logic_id)
-    
-    for node_id in _nodes.keys():
-        if node_id not in visited:
-            logic_id = f"logic_{logic_counter}"
-            dfs(node_id, logic_id)
-            logic_counter += 1
-    
-    return node_to_logic
+    with _lock:
+        return {node_id: _components.label_of(node_id) for node_id in _nodes}
+
+
+def find_unsupported_secrets() -> list[GraphNode]:
+    """証拠ノードから supports / implies のパスで到達できない秘密ノード。"""
+    with _lock:
+        return [
+            n for n in _nodes.values()
+            if n.node_type == NodeType.secret and not _backtrack.is_reached(n.node_id)
+        ]
+
+
+def derive_phases(evidence_phases: dict[str, Any], node_ids: Iterable[str]) -> dict[str, tuple[Any, Any]]:
+    """
+    証拠ノードの公開フェーズを evidence_phases（証拠ID -> フェーズ）に合わせてから、
+    node_ids の (established になる最も早いフェーズ, refuted になる最も早いフェーズ) を返す。
+    公開フェーズが変わった証拠の分だけ差分で再導出する。
+    """
+    with _lock:
+        current: dict[str, Any] = {}
+        for n in _nodes.values():
+            if n.node_type == NodeType.evidence:
+                phase = evidence_phases.get(n.reference_id)
+                if phase is not None:
+                    current[n.node_id] = phase
+        for node_id in _derivation.sources():
+            if node_id not in current:
+                _derivation.set_base(node_id, None)
+        for node_id, phase in current.items():
+            _derivation.set_base(node_id, phase)
+        return {
+            node_id: (_derivation.established(node_id), _derivation.refuted(node_id))
+            for node_id in node_ids
+        }
+
+
+def detect_contradictions() -> dict[str, list[dict[str, Any]]]:
+    """推論グラフの矛盾・循環（find_contradictions）。グラフに変更がなければ前回の結果を返す。"""
+    global _contradictions
+    with _lock:
+        if _contradictions is not None and _contradictions[0] == _revision:
+            return _contradictions[1]
+        derive_succ: dict[str, list[str]] = {}
+        refutes: list[tuple[str, str, str]] = []
+        contradicts: list[tuple[str, str, str]] = []
+        for e in _edges.values():
+            if e.edge_type in DERIVE_EDGE_TYPES:
+                derive_succ.setdefault(e.source_node_id, []).append(e.target_node_id)
+            elif e.edge_type == EdgeType.refutes:
+                refutes.append((e.edge_id, e.source_node_id, e.target_node_id))
+            elif e.edge_type == EdgeType.contradicts:
+                contradicts.append((e.edge_id, e.source_node_id, e.target_node_id))
+        result = find_contradictions(derive_succ, refutes, contradicts)
+        _contradictions = (_revision, result)
+        return result
+
+
+rebuild_indexes()
 
 
 @router.get("/nodes")
@@ -62,7 +197,11 @@ def get_node(node_id: str):
 
 @router.post("/nodes", status_code=201)
 def create_node(n: GraphNode):
-    _nodes[n.node_id] = n
+    with _lock:
+        _nodes[n.node_id] = n
+        _components.add_vertex(n.node_id)
+        _backtrack.set_source(n.node_id, n.node_type == NodeType.evidence)
+        _touch(n.node_id)
     return n
 
 
@@ -70,15 +209,53 @@ def create_node(n: GraphNode):
 def update_node(node_id: str, n: GraphNode):
     if node_id not in _nodes:
         raise HTTPException(404, "Node not found")
-    _nodes[node_id] = n
+    with _lock:
+        _nodes[node_id] = n
+        _backtrack.set_source(node_id, n.node_type == NodeType.evidence)
+        _touch(node_id)  # event_id の変更でイベントグループが変わる
     return n
 
 
+@router.patch("/nodes/{node_id}", status_code=204)
+def patch_node(node_id: str, patch: Any = Body(...)):
+    if node_id not in _nodes:
+        raise HTTPException(404, "Node not found")
+    new, log = apply_patch_logged(_nodes[node_id], patch)
+    with _nodes.patching(node_id, log):  # WAL には変更ログだけを記録する
+        update_node(node_id, new)
+
+
+@router.get("/nodes/{node_id}/edges")
+def list_node_edges(node_id: str, direction: str = Query("both", pattern="^(in|out|both)$")):
+    """ノードに接続するエッジ。direction: in=入エッジ / out=出エッジ / both=両方"""
+    if node_id not in _nodes:
+        raise HTTPException(404, "Node not found")
+    with _lock:
+        if direction == "in":
+            edge_ids = _adjacency.incoming(node_id)
+        elif direction == "out":
+            edge_ids = _adjacency.outgoing(node_id)
+        else:
+            edge_ids = _adjacency.incident(node_id)
+        return [_edges[eid] for eid in edge_ids]
+
+
 @router.delete("/nodes/{node_id}", status_code=204)
-def delete_node(node_id: str):
+def delete_node(node_id: str, cascade: bool = False):
+    """cascade=true なら接続するエッジもまとめて削除する。"""
     if node_id not in _nodes:
         raise HTTPException(404, "Node not found")
-    del _nodes[node_id]
+    with _lock:
+        touched = [node_id]
+        if cascade:
+            for edge_id in list(_adjacency.incident(node_id)):
+                e = _edges.pop(edge_id)
+                _remove_edge_index(e)
+                touched += [e.source_node_id, e.target_node_id]
+        del _nodes[node_id]
+        _backtrack.set_source(node_id, False)
+        _drop_dangling(node_id)
+        _touch(*touched)
 
 
 @router.get("/edges")
@@ -95,7 +272,15 @@ def get_edge(edge_id: str):
 
 @router.post("/edges", status_code=201)
 def create_edge(e: GraphEdge):
-    _edges[e.edge_id] = e
+    with _lock:
+        old = _edges.get(e.edge_id)
+        touched = [e.source_node_id, e.target_node_id]
+        if old is not None:
+            _remove_edge_index(old)
+            touched += [old.source_node_id, old.target_node_id]
+        _edges[e.edge_id] = e
+        _add_edge_index(e)
+        _touch(*touched)
     return e
 
 
@@ -103,7 +288,10 @@ def create_edge(e: GraphEdge):
 def delete_edge(edge_id: str):
     if edge_id not in _edges:
         raise HTTPException(404, "Edge not found")
-    del _edges[edge_id]
+    with _lock:
+        e = _edges.pop(edge_id)
+        _remove_edge_index(e)
+        _touch(e.source_node_id, e.target_node_id)
 
 
 @router.get("/logics")
@@ -120,7 +308,9 @@ def get_logic(logic_id: str):
 
 @router.post("/logics", status_code=201)
 def create_logic(l: Logic):
-    _logics[l.logic_id] = l
+    with _lock:
+        _logics[l.logic_id] = l
+        _touch(logic_ids=(l.logic_id,))
     return l
 
 
@@ -128,15 +318,28 @@ def create_logic(l: Logic):
 def update_logic(logic_id: str, l: Logic):
     if logic_id not in _logics:
         raise HTTPException(404, "Logic not found")
-    _logics[logic_id] = l
+    with _lock:
+        _logics[logic_id] = l
+        _touch(logic_ids=(logic_id,))  # init_node_id の変更で整列の起点が変わる
     return l
 
 
+@router.patch("/logics/{logic_id}", status_code=204)
+def patch_logic(logic_id: str, patch: Any = Body(...)):
+    if logic_id not in _logics:
+        raise HTTPException(404, "Logic not found")
+    new, log = apply_patch_logged(_logics[logic_id], patch)
+    with _logics.patching(logic_id, log):  # WAL には変更ログだけを記録する
+        update_logic(logic_id, new)
+
+
 @router.delete("/logics/{logic_id}", status_code=204)
 def delete_logic(logic_id: str):
     if logic_id not in _logics:
         raise HTTPException(404, "Logic not found")
-    del _logics[logic_id]
+    with _lock:
+        del _logics[logic_id]
+        _touch(logic_ids=(logic_id,))
 
 
 @router.post("/compute-logics")
@@ -167,3 +370,99 @@ def compute_logics():
         "node_to_logic": node_to_logic,
         "logics": list(_logics.values())
     }
+
+
+def _logic_layout(logic_id: str) -> dict:
+    """1ロジック分のレイアウト（ロジック左上を原点とする座標）。リビジョンが変わっていなければキャッシュを返す。"""
+    rev = _logic_revisions.get(logic_id, 0)
+    cached = _layout_cache.get(logic_id)
+    if cached is not None and cached[0] == rev:
+        return cached[1]
+
+    members = sorted(n for n in _components.members(logic_id) if n in _nodes)
+    unit_of: dict[str, str] = {}
+    groups: dict[str, list[str]] = {}
+    for node_id in members:
+        event_id = _nodes[node_id].event_id
+        if event_id:
+            key = f"{event_id}::{logic_id}"
+            unit_of[node_id] = f"event_group_{key}"
+            groups.setdefault(key, []).append(node_id)
+        else:
+            unit_of[node_id] = node_id
+    units = list(dict.fromkeys(unit_of[n] for n in members))
+    edges = [
+        (unit_of[node_id], unit_of[_edges[eid].target_node_id])
+        for node_id in members
+        for eid in _adjacency.outgoing(node_id)
+        if _edges[eid].target_node_id in unit_of
+    ]
+    sizes = {f"event_group_{key}": event_group_size(len(children)) for key, children in groups.items()}
+    logic = _logics.get(logic_id)
+    root = unit_of.get(logic.init_node_id) if logic and logic.init_node_id else None
+
+    positions, width, height = hierarchical_layout(units, edges, sizes, root)
+    nodes: dict[str, dict] = {}
+    event_groups: dict[str, dict] = {}
+    for key, children in groups.items():
+        group_id = f"event_group_{key}"
+        x, y = positions[group_id]
+        w, h = sizes[group_id]
+        event_groups[group_id] = {"x": x, "y": y, "width": w, "height": h}
+        for idx, node_id in enumerate(children):
+            cx, cy = event_group_child_position(idx)
+            nodes[node_id] = {"x": cx, "y": cy, "parent_id": group_id}
+    for node_id in members:
+        if node_id not in nodes:
+            x, y = positions[node_id]
+            nodes[node_id] = {"x": x, "y": y, "parent_id": None}
+
+    layout = {"width": width, "height": height, "nodes": nodes, "event_groups": event_groups}
+    _layout_cache[logic_id] = (rev, layout)
+    return layout
+
+
+def _logic_order(logic_id: str) -> tuple[int, str]:
+    _, _, num = logic_id.rpartition("_")
+    return (int(num) if num.isdigit() else -1, logic_id)
+
+
+@router.get("/layout")
+def get_layout():
+    """
+    ロジックごとの階層整列レイアウト（instruction.md 3. レイアウト・整列）。
+    ロジックは横方向に並べる。イベントグループの子ノード座標は枠内の相対座標（parent_id が枠のID）。
+    変更のなかったロジックは前回の計算結果を再利用する。
+    """
+    global _layout_response
+    with _lock:
+        if _layout_response is not None and _layout_response["revision"] == _revision:
+            return _layout_response
+        stale = [l for l in _layout_cache if l not in _components.labels()]
+        for logic_id in stale:
+            del _layout_cache[logic_id]
+
+        logics: list[dict] = []
+        nodes: dict[str, dict] = {}
+        event_groups: dict[str, dict] = {}
+        base_x = 0
+        for logic_id in sorted(_components.labels(), key=_logic_order):
+            layout = _logic_layout(logic_id)
+            if not layout["nodes"]:
+                continue
+            logics.append({"logic_id": logic_id, "x": base_x, "y": 0, "width": layout["width"], "height": layout["height"]})
+            for node_id, p in layout["nodes"].items():
+                if p["parent_id"] is None:
+                    nodes[node_id] = {"x": base_x + p["x"], "y": p["y"], "parent_id": None}
+                else:
+                    nodes[node_id] = p
+            for group_id, g in layout["event_groups"].items():
+                event_groups[group_id] = {**g, "x": base_x + g["x"]}
+            base_x += max(layout["width"], NODE_W) + LAYOUT_GAP
+        _layout_response = {
+            "revision": _revision,
+            "logics": logics,
+            "nodes": nodes,
+            "event_groups": event_groups,
+        }
+        return _layout_response
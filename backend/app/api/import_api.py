@@ -1,76 +1,317 @@
 # -*- coding: utf-8 -*-
-import json
+import asyncio
+import multiprocessing
 import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from typing import BinaryIO
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 
-from app.services.import_service import parse_bt_contacts_csv
+from app.config import get_settings
+from app.services.contact_index_service import ContactTimelineIndex, parse_time, referenced_ids
+from app.services.copresence_service import CopresenceMatrix, relation_strength
+from app.services.import_service import (
+    CHUNK_SIZE,
+    PairIntervals,
+    build_contact_timeline_from_files,
+    contact_append_cutoff,
+    extract_contact_csv_files,
+    iter_file_chunks,
+    merge_gps_dwells,
+    parse_bt_contact_file,
+    parse_bt_contacts_stream,
+    parse_gps_stream,
+)
+from app.services.storage_service import BackgroundJsonWriter
+from app.services.temporal_contact_service import TemporalConnectivity
 from app.api import characters
+from app.api import locations as locations_api
+from app.api import timeline as timeline_api
 
 router = APIRouter()
 
 # 取り込み後に保持。接触状況タブ用
 _contact_timeline: list[dict] = []
 _name_map: dict[str, str] = {}
+# ブロックの時刻インデックス（GET /contact-timeline の from / to 用）
+_contact_index = ContactTimelineIndex()
+# ペアごとの接触区間と、そこから作る時点ごとのグループ（最初の問い合わせで構築）
+_pair_intervals = PairIntervals()
+_temporal: TemporalConnectivity | None = None
+# ペアごとの同席秒数を数えるための配列（最初の問い合わせで構築）
+_copresence: CopresenceMatrix | None = None
+# 追記モードは直前の _contact_timeline を元に新しいタイムラインを作るので、取り込みを直列化する
+_import_lock = asyncio.Lock()
+
+
+def _apply_contact_result(result: dict, append: bool) -> None:
+    """
+    取り込み結果をキャラクター一覧と接触タイムラインに反映する。
+    キャラクターはまだいない ID だけ登録する（既存のキャラクターの役割・関係などは上書きしない）。
+    追記モードでは result["first_changed"] より前のブロックのインデックスを使い回す。
+    """
+    global _contact_timeline, _name_map, _pair_intervals, _temporal, _copresence
+    for c in result["characters"]:
+        if c.id not in characters._characters:
+            characters._characters[c.id] = c
+
+    _contact_timeline = result.get("contact_timeline") or []
+    names = {c.id: c.name for c in result["characters"]}
+    _name_map = {**_name_map, **names} if append else names
+    _contact_index.rebuild(_contact_timeline, result.get("first_changed", 0) if append else 0)
+    if append:
+        _pair_intervals.merge(result["pair_intervals"])
+    else:
+        _pair_intervals = result["pair_intervals"]
+    _temporal = None
+    _copresence = None
+
+
+def _temporal_index() -> TemporalConnectivity:
+    global _temporal
+    if _temporal is None:
+        _temporal = TemporalConnectivity(_pair_intervals.intervals())
+    return _temporal
+
+
+def _copresence_matrix() -> CopresenceMatrix:
+    global _copresence
+    if _copresence is None:
+        _copresence = CopresenceMatrix(_contact_timeline)
+    return _copresence
+
+
+@lru_cache
+def _contact_data_writer() -> BackgroundJsonWriter:
+    settings = get_settings()
+    # プロジェクトルートを取得（backend/app/api から 3階層上）
+    project_root = Path(__file__).parent.parent.parent.parent
+    name = "contact_data.json.gz" if settings.contact_data_gzip else "contact_data.json"
+    return BackgroundJsonWriter(
+        project_root / name,
+        compress=settings.contact_data_gzip,
+        delay=settings.contact_data_write_delay_ms / 1000,
+    )
+
+
+def _save_contact_data() -> None:
+    """
+    接触枠データを contact_data.json に保存する。書き込みはバックグラウンドで行い、ここでは預けるだけ。
+    タイムラインと name_map は取り込みのたびに丸ごと置き換える（中身は変更しない）ので、そのまま渡せる。
+    """
+    contact_data = {
+        "timeline": _contact_timeline,
+        "name_map": _name_map,
+        "characters": [{"id": cid, "name": name} for cid, name in _name_map.items()],
+        "summary": {
+            "total_blocks": len(_contact_timeline),
+            "total_characters": len(_name_map),
+        }
+    }
+    _contact_data_writer().submit(contact_data)
+
+
+def _import_summary(result: dict, append: bool) -> dict:
+    summary = {
+        "characters": len(result["characters"]),
+        "blocks": len(_contact_timeline),
+    }
+    if append:
+        summary.update(result["append"])
+    if "compaction" in result:
+        summary["compaction"] = result["compaction"]
+    return summary
+
+
+def _compact_gap(compact: bool, compact_gap_seconds: float | None) -> float | None:
+    if not compact:
+        return None
+    return compact_gap_seconds if compact_gap_seconds is not None else get_settings().contact_compact_gap_seconds
 
 
 @router.post("/csv")
-async def import_csv(file: UploadFile = File(...)):
+async def import_csv(
+    file: UploadFile = File(...),
+    append: bool = False,
+    compact: bool = False,
+    compact_gap_seconds: float | None = Query(None, gt=0),
+):
     """
     Bluetooth接触CSV（bt_contacts_1230.csv 等）をアップロード。
     位置情報は無視。user / contacted_user がその時間一緒にいた log として扱う。
     接触ログが gap_minutes 以上空いたら新区間（新枠）。transitive グループを適用しタイムライン生成。
+    アップロードはチャンク単位で読み、デコード・パースしながらタイムライン構築に流す（全体を読み込まない）。
+    append=true なら既存のタイムラインに追記する。再計算するのは最後のブロック以降だけで、
+    それより前は確定済みとして触らない（ライブセッション中の数分ごとのアップロード向け）。
+    compact=true なら、同じグループ構成が compact_gap_seconds 未満の空きで続くブロックを1つにまとめる
+    （元の境界は各ブロックの segments に残る）。圧縮率と時間は summary.compaction に入る。
     """
     try:
-        raw = await file.read()
-        try:
-            text = raw.decode("utf-8")
-        except UnicodeDecodeError:
-            text = raw.decode("cp932", errors="replace")
+        await file.seek(0)
+        async with _import_lock:
+            # 追記はコピーに対して行い、できあがったら _apply_contact_result で差し替える
+            # （スレッドで作っている間も GET は元のタイムラインを読める）
+            timeline = list(_contact_timeline) if append else None
+            result = await run_in_threadpool(
+                parse_bt_contacts_stream,
+                iter_file_chunks(file.file),
+                timeline,
+                _compact_gap(compact, compact_gap_seconds),
+            )
+            _apply_contact_result(result, append)
+        _save_contact_data()
+
+        return {
+            "filename": file.filename,
+            "summary": _import_summary(result, append),
+            "character_ids": [c.id for c in result["characters"]][:20],
+        }
+    except Exception as e:
+        import traceback
+        error_detail = traceback.format_exc()
+        print(f"Import error: {error_detail}")
+        raise HTTPException(status_code=500, detail=f"CSV取り込みエラー: {str(e)}")
 
-        result = parse_bt_contacts_csv(text)
 
-        for c in result["characters"]:
-            try:
-                characters._characters[c.id] = c
-            except Exception as e:
-                print(f"Warning: Failed to register character {c.id}: {e}")
+@router.post("/gps")
+async def import_gps(
+    file: UploadFile = File(...),
+    max_gap_seconds: float | None = Query(None, gt=0),
+    min_dwell_seconds: float | None = Query(None, ge=0),
+):
+    """
+    GPSログCSV（user_id, timestamp, lat, lng[, accuracy]）をアップロード。
+    各測位をジオフェンス（Location.geofence）を持つ場所に割り当て、同じ場所にいた間を滞在にまとめて、
+    presence（source=gps, confidence）付きの TimeBlock として各キャラクターのタイムラインに合流させる。
+    アップロードは /csv と同じくチャンク単位で読み、全体を読み込まない。
+    """
+    locations = list(locations_api._locations.values())
+    if not any(loc.geofence is not None for loc in locations):
+        raise HTTPException(status_code=400, detail="ジオフェンスを持つ場所がありません")
+    options = {}
+    if max_gap_seconds is not None:
+        options["max_gap_seconds"] = max_gap_seconds
+    if min_dwell_seconds is not None:
+        options["min_dwell_seconds"] = min_dwell_seconds
+    try:
+        await file.seek(0)
+        result = await run_in_threadpool(
+            lambda: parse_gps_stream(iter_file_chunks(file.file), locations, **options)
+        )
+    except Exception as e:
+        import traceback
+        print(f"Import error: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"GPS取り込みエラー: {str(e)}")
 
-        global _contact_timeline, _name_map
-        _contact_timeline = result.get("contact_timeline") or []
-        _name_map = {c.id: c.name for c in result["characters"]}
+    for c in result["characters"]:
+        if c.id not in characters._characters:
+            characters._characters[c.id] = c
+    merged = {"added": 0, "updated": 0, "conflicts": 0}
+    dwells_by_character: dict[str, list[dict]] = {}
+    for dwell in result["dwells"]:
+        dwells_by_character.setdefault(dwell["character_id"], []).append(dwell)
+    for character_id, dwells in dwells_by_character.items():
+        tl, stats = merge_gps_dwells(timeline_api._timelines.get(character_id), character_id, dwells)
+        timeline_api._timelines[character_id] = tl
+        timeline_api._touch(character_id)
+        for k, v in stats.items():
+            merged[k] += v
 
-        # 接触枠データを contact_data.json に保存
-        try:
-            # プロジェクトルートを取得（backend/app/api から 3階層上）
-            project_root = Path(__file__).parent.parent.parent.parent
-            contact_data_path = project_root / "contact_data.json"
-            
-            contact_data = {
-                "timeline": _contact_timeline,
-                "name_map": _name_map,
-                "characters": [{"id": c.id, "name": c.name} for c in result["characters"]],
-                "summary": {
-                    "total_blocks": len(_contact_timeline),
-                    "total_characters": len(result["characters"]),
-                }
-            }
-            
-            with open(contact_data_path, "w", encoding="utf-8") as f:
-                json.dump(contact_data, f, ensure_ascii=False, indent=2)
-            
-            print(f"[INFO] Contact data saved to: {contact_data_path}")
-        except Exception as e:
-            print(f"[WARNING] Failed to save contact_data.json: {e}")
+    return {
+        "filename": file.filename,
+        "summary": {**result["stats"], **merged, "characters": len(dwells_by_character)},
+    }
+
+
+@lru_cache
+def _batch_pool() -> ProcessPoolExecutor:
+    """
+    一括取り込みのワーカープール（最初の一括取り込みで作り、以後使い回す）。
+    WAL の書き込みスレッドなどが動いているプロセスから fork しないように spawn で起動する。
+    """
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _spool_upload(src: BinaryIO, filename: str, directory: str, n: int) -> list[tuple[str, str]]:
+    """アップロードを一時ファイルに書き出し、CSV ファイル単位（zip / tar は展開）の (ファイル名, パス) にする。"""
+    path = os.path.join(directory, f"upload{n}")
+    with open(path, "wb") as out:
+        shutil.copyfileobj(src, out, CHUNK_SIZE)
+    try:
+        return extract_contact_csv_files(filename, path, directory)
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise HTTPException(status_code=400, detail=f"アーカイブを展開できません: {e}")
+
+
+@router.post("/csv/batch")
+async def import_csv_batch(
+    files: list[UploadFile] = File(...),
+    append: bool = False,
+    compact: bool = False,
+    compact_gap_seconds: float | None = Query(None, gt=0),
+):
+    """
+    複数の接触CSV（端末ごと・時間ごと）や、それらをまとめた zip / tar を一括で取り込む。
+    アップロードは一時ファイルに書き出し（メモリに読み込まない）、各ファイルを ProcessPoolExecutor の
+    ワーカーで並列にパースして列形式の接触にし、それをつないで NumPy 版エンジンで1本のタイムラインにする。
+    結果は全ファイルを1つの CSV として取り込んだ場合と同じ。append / compact は /csv と同じ。
+    ファイルが1つだけ、または CPU が1つならワーカーを使わずに順にパースする。
+    """
+    try:
+        with tempfile.TemporaryDirectory(prefix="contact_batch_") as directory:
+            csv_files: list[tuple[str, str]] = []
+            for n, f in enumerate(files):
+                await f.seek(0)
+                csv_files += await run_in_threadpool(_spool_upload, f.file, f.filename or "", directory, n)
+            if not csv_files:
+                raise HTTPException(status_code=400, detail="CSVファイルが含まれていません")
+
+            async with _import_lock:
+                timeline = list(_contact_timeline) if append else None
+                since = contact_append_cutoff(timeline) if append else None
+                if len(csv_files) == 1 or (os.cpu_count() or 1) == 1:
+                    parsed = await run_in_threadpool(
+                        lambda: [parse_bt_contact_file(path, since) for _, path in csv_files]
+                    )
+                else:
+                    loop = asyncio.get_running_loop()
+                    pool = _batch_pool()
+                    try:
+                        parsed = await asyncio.gather(
+                            *(loop.run_in_executor(pool, parse_bt_contact_file, path, since) for _, path in csv_files)
+                        )
+                    except BrokenProcessPool:
+                        # ワーカーが落ちたプールは使えないので、次の取り込みで作り直す
+                        _batch_pool.cache_clear()
+                        raise
+                result = await run_in_threadpool(
+                    build_contact_timeline_from_files,
+                    list(parsed),
+                    timeline,
+                    _compact_gap(compact, compact_gap_seconds),
+                )
+                _apply_contact_result(result, append)
+        _save_contact_data()
 
         return {
-            "filename": file.filename,
+            "filenames": [name for name, _ in csv_files],
             "summary": {
-                "characters": len(result["characters"]),
-                "blocks": len(_contact_timeline),
+                **_import_summary(result, append),
+                "files": len(csv_files),
+                "rows": sum(p["rows"] for p in parsed),
             },
             "character_ids": [c.id for c in result["characters"]][:20],
         }
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         error_detail = traceback.format_exc()
@@ -78,13 +319,279 @@ async def import_csv(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"CSV取り込みエラー: {str(e)}")
 
 
+def _parse_query_time(value: str | None, name: str) -> float | None:
+    if value is None:
+        return None
+    try:
+        return parse_time(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} は ISO 8601 の日時で指定してください")
+
+
 @router.get("/contact-timeline")
-def get_contact_timeline():
+def get_contact_timeline(
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    resolution: str | None = Query(None, pattern="^(raw|auto|60|300|900)$"),
+    max_items: int = Query(500, ge=1),
+):
     """
     CSV取り込みで生成した接触タイムラインを返す。
     [ { start, end, groups: [ [id, ...], ... ] }, ... ] と id -> 表示名のマップ。
+    from / to（ISO 8601）を指定するとその区間と重なるブロックだけを返し、
+    name_map もそれらのブロックに出てくるキャラクターだけに絞る。
+    limit 件ずつ返す場合は、続きを next_cursor で指定する（最後のページでは null）。
+    resolution=60 / 300 / 900 なら生のブロックの代わりにその秒数のバケットを返す。各バケットの groups は
+    バケット内で最も長く続いたグループ構成で、coverage（ブロックが占める割合）と dominant_fraction が付く。
+    resolution=auto なら、区間内の件数が max_items 以下になる最も細かい段（raw を含む）を選ぶ。
     """
+    t_from = _parse_query_time(from_, "from")
+    t_to = _parse_query_time(to, "to")
+    if from_ is None and to is None and limit is None and cursor is None and resolution in (None, "raw"):
+        return {
+            "timeline": _contact_timeline,
+            "name_map": _name_map,
+            "next_cursor": None,
+            "resolution": "raw",
+        }
+
+    items: list[dict] = _contact_timeline
+    lo, hi = _contact_index.overlapping(t_from, t_to)
+    chosen = "raw" if resolution in (None, "raw", "auto") else int(resolution)
+    if resolution == "auto" and hi - lo > max_items:
+        for size, level in _contact_index.levels.items():
+            chosen = size
+            lo, hi = level.overlapping(t_from, t_to)
+            if hi - lo <= max_items:
+                break
+    if chosen != "raw":
+        level = _contact_index.levels[chosen]
+        items = level.buckets
+        lo, hi = level.overlapping(t_from, t_to)
+
+    if cursor is not None:
+        try:
+            lo = max(lo, int(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="cursor が不正です")
+    end = hi if limit is None else min(hi, lo + limit)
+    blocks = items[lo:end]
+    ids = referenced_ids(blocks)
     return {
-        "timeline": _contact_timeline,
-        "name_map": _name_map,
+        "timeline": blocks,
+        "name_map": {cid: _name_map.get(cid, cid) for cid in ids},
+        "next_cursor": str(end) if end < hi else None,
+        "resolution": chosen,
     }
+
+
+def _block_summary(index: int, group: int | None = None) -> dict:
+    block = _contact_timeline[index]
+    entry = {"index": index, "start": block["start"], "end": block["end"]}
+    if group is not None:
+        entry["group"] = block["groups"][group]
+    return entry
+
+
+def _require_contact_character(character_id: str) -> None:
+    if character_id not in _contact_index.by_character and character_id not in _name_map:
+        raise HTTPException(status_code=404, detail="Character not found")
+
+
+@router.get("/contact-timeline/characters/{character_id}/presence")
+def get_contact_presence(
+    character_id: str,
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+):
+    """character_id が誰かと一緒にいたブロック（区間内）と、そのときのグループ。"""
+    _require_contact_character(character_id)
+    t_from = _parse_query_time(from_, "from")
+    t_to = _parse_query_time(to, "to")
+    hits = _contact_index.presence(character_id, t_from, t_to)
+    return {
+        "character_id": character_id,
+        "blocks": [_block_summary(b, g) for b, g in hits],
+    }
+
+
+@router.get("/contact-timeline/characters/{character_id}/companions")
+def get_contact_companions(
+    character_id: str,
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+):
+    """区間内で character_id と同じグループにいた相手。一緒にいた秒数の多い順。"""
+    _require_contact_character(character_id)
+    t_from = _parse_query_time(from_, "from")
+    t_to = _parse_query_time(to, "to")
+    companions = _contact_index.companions(character_id, t_from, t_to)
+    ranked = sorted(companions.items(), key=lambda kv: (-kv[1]["seconds"], -kv[1]["blocks"], kv[0]))
+    return {
+        "character_id": character_id,
+        "companions": [
+            {"id": cid, "name": _name_map.get(cid, cid), "blocks": v["blocks"], "seconds": v["seconds"]}
+            for cid, v in ranked
+        ],
+    }
+
+
+@router.get("/contact-timeline/pair")
+def get_contact_pair(
+    a: str,
+    b: str,
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+):
+    """
+    a と b が同じグループにいたブロック（区間内）と合計秒数、
+    および to（未指定なら全体）までで最後に一緒だったブロック。
+    """
+    _require_contact_character(a)
+    _require_contact_character(b)
+    t_from = _parse_query_time(from_, "from")
+    t_to = _parse_query_time(to, "to")
+    blocks = _contact_index.together(a, b, t_from, t_to)
+    last = _contact_index.last_together(a, b, t_to)
+    return {
+        "a": a,
+        "b": b,
+        "blocks": [_block_summary(i) for i in blocks],
+        "seconds": sum(_contact_index.seconds(i, t_from, t_to) for i in blocks),
+        "last_together": _block_summary(last) if last is not None else None,
+    }
+
+
+def _partition_json(groups) -> list[list[str]]:
+    return [list(g) for g in groups]
+
+
+@router.get("/contact-timeline/snapshot")
+def get_contact_snapshot(at: str):
+    """
+    時刻 at（ISO 8601）にその場で一緒にいたグループ。
+    ブロック単位ではなく、その時刻に生きている接触（前後 CONTACT_HOLD_SECONDS 秒）だけで連結成分を取る。
+    """
+    t = _parse_query_time(at, "at")
+    groups = _temporal_index().snapshot(t)
+    ids = {cid for g in groups for cid in g}
+    return {
+        "at": at,
+        "groups": _partition_json(groups),
+        "name_map": {cid: _name_map.get(cid, cid) for cid in ids},
+    }
+
+
+@router.get("/contact-timeline/changes")
+def get_contact_changes(
+    from_: str = Query(..., alias="from"),
+    to: str = Query(...),
+):
+    """
+    [from, to] のグループの移り変わり。from 時点のグループ（initial）と、
+    構成が変わった時刻ごとの { at, groups, formed, dissolved }（at は ISO 8601, UTC）。
+    """
+    t_from = _parse_query_time(from_, "from")
+    t_to = _parse_query_time(to, "to")
+    if t_to < t_from:
+        raise HTTPException(status_code=400, detail="to は from 以降の日時で指定してください")
+    index = _temporal_index()
+    initial = index.snapshot(t_from)
+    changes = index.changes(t_from, t_to)
+    ids = {cid for g in initial for cid in g} | {cid for c in changes for g in c["groups"] for cid in g}
+    return {
+        "from": from_,
+        "to": to,
+        "initial": _partition_json(initial),
+        "changes": [
+            {
+                "at": datetime.fromtimestamp(c["at"], tz=timezone.utc).isoformat(),
+                "groups": _partition_json(c["groups"]),
+                "formed": _partition_json(c["formed"]),
+                "dissolved": _partition_json(c["dissolved"]),
+            }
+            for c in changes
+        ],
+        "name_map": {cid: _name_map.get(cid, cid) for cid in ids},
+    }
+
+
+@router.get("/contact-timeline/copresence")
+def get_contact_copresence(
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+):
+    """
+    区間内で各ペアが同じグループにいた秒数とブロック数の行列（ids の順の N × N）。
+    対角成分はそのキャラクターが誰かと一緒にいた秒数・ブロック数。
+    """
+    t_from = _parse_query_time(from_, "from")
+    t_to = _parse_query_time(to, "to")
+    matrix = _copresence_matrix()
+    seconds, blocks = matrix.compute(t_from, t_to)
+    return {
+        "ids": matrix.ids,
+        "name_map": {cid: _name_map.get(cid, cid) for cid in matrix.ids},
+        "seconds": seconds.round(3).tolist(),
+        "blocks": blocks.tolist(),
+    }
+
+
+def _relation_suggestions(t_from: float | None, t_to: float | None) -> list[dict]:
+    """登録済みキャラクターの relations のうち、両者が接触データに出てくるものの推奨 strength。"""
+    matrix = _copresence_matrix()
+    strength = relation_strength(*matrix.compute(t_from, t_to))
+    code = {cid: i for i, cid in enumerate(matrix.ids)}
+    suggestions = []
+    for c in characters._characters.values():
+        if c.id not in code:
+            continue
+        for r in c.relations:
+            if r.to not in code:
+                continue
+            suggestions.append({
+                "character_id": c.id,
+                "to": r.to,
+                "label": r.label,
+                "strength": r.strength,
+                "suggested": round(float(strength[code[c.id], code[r.to]]), 3),
+            })
+    return suggestions
+
+
+@router.get("/contact-timeline/relation-strength")
+def suggest_relation_strength(
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+):
+    """
+    キャラクターの relations[].strength の推奨値。
+    区間内で一緒にいた秒数 ÷ 2人のうち短い方の在席秒数（0〜1）。
+    """
+    t_from = _parse_query_time(from_, "from")
+    t_to = _parse_query_time(to, "to")
+    return {"relations": _relation_suggestions(t_from, t_to)}
+
+
+@router.post("/contact-timeline/relation-strength")
+def apply_relation_strength(
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+):
+    """GET と同じ推奨値で、キャラクターの relations[].strength を上書きする。"""
+    t_from = _parse_query_time(from_, "from")
+    t_to = _parse_query_time(to, "to")
+    suggestions = _relation_suggestions(t_from, t_to)
+    updates: dict[str, dict[str, float]] = {}
+    for s in suggestions:
+        updates.setdefault(s["character_id"], {})[s["to"]] = s["suggested"]
+    for cid, strengths in updates.items():
+        c = characters._characters[cid]
+        relations = [
+            r.model_copy(update={"strength": strengths[r.to]}) if r.to in strengths else r
+            for r in c.relations
+        ]
+        characters._characters[cid] = c.model_copy(update={"relations": relations})
+    return {"updated": len(suggestions), "relations": suggestions}
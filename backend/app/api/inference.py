@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from fastapi import APIRouter, Query
+
+from app.api import characters as characters_api
+from app.api import timeline as timeline_api
+
+router = APIRouter()
+
+
+@router.get("/suspects")
+def get_suspects(k: int = Query(10, ge=1)):
+    """
+    疑わしさスコアの上位 k 人（被害者を除く）。
+    スコアはタイムライン更新時に更新済みの順位から読むだけで、タイムラインは走査しない。
+    """
+    victim = timeline_api.victim_id()
+    top = timeline_api._ranking.top(k, exclude=[victim] if victim else [])
+    return [
+        {
+            "character_id": cid,
+            "name": c.name if (c := characters_api._characters.get(cid)) else cid,
+            "score": round(score, 3),
+        }
+        for cid, score in top
+    ]
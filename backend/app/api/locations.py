@@ -1,10 +1,38 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
+from typing import Any
+
+from fastapi import APIRouter, Body, HTTPException, Query
 
 from app.models import Location
+from app.services.patch_service import apply_patch_logged
+from app.services.storage_service import get_storage
+from app.services.travel_service import TravelMatrix
 
 router = APIRouter()
-_locations: dict[str, Location] = {}
+_locations: dict[str, Location] = get_storage().table("locations", Location)
+
+# 場所間の最短移動時間。場所のつながり（場所の追加・削除・adjacent の変更）が変わったときだけ作り直す
+_travel: TravelMatrix | None = None
+_travel_revision = 0
+
+
+def reset_travel() -> None:
+    """最短移動時間を捨てる（次に使うときに作り直す）。_locations を直接書き換えた後にも呼ぶ。"""
+    global _travel, _travel_revision
+    _travel = None
+    _travel_revision += 1
+
+
+def travel_matrix() -> TravelMatrix:
+    global _travel
+    if _travel is None:
+        _travel = TravelMatrix(_locations.values())
+    return _travel
+
+
+def travel_revision() -> int:
+    """travel_matrix() の中身が変わるたびに増える値（計算結果のキャッシュのキーに使う）。"""
+    return _travel_revision
 
 
 @router.get("")
@@ -12,6 +40,35 @@ def list_locations():
     return list(_locations.values())
 
 
+@router.get("/travel")
+def get_travel_time(
+    from_: str = Query(..., alias="from"),
+    to: str = Query(...),
+    within: float | None = Query(None, ge=0),
+):
+    """
+    from から to への最短移動秒数。移動できなければ seconds は null で reachable=false。
+    移動時間が分からない（どちらかの場所に adjacent の辺がない）ときは known=false で、seconds / reachable は null。
+    within（秒）を指定すると、その時間で移動できるかを possible で返す（分からなければ null）。
+    """
+    for location_id in (from_, to):
+        if location_id not in _locations:
+            raise HTTPException(404, "Location not found")
+    seconds = travel_matrix().seconds(from_, to)
+    known = seconds is not None
+    reachable = known and seconds != float("inf")
+    result = {
+        "from": from_,
+        "to": to,
+        "seconds": seconds if reachable else None,
+        "known": known,
+        "reachable": reachable if known else None,
+    }
+    if within is not None:
+        result["possible"] = reachable and seconds <= within if known else None
+    return result
+
+
 @router.get("/{location_id}")
 def get_location(location_id: str):
     if location_id not in _locations:
@@ -22,6 +79,7 @@ def get_location(location_id: str):
 @router.post("", status_code=201)
 def create_location(loc: Location):
     _locations[loc.id] = loc
+    reset_travel()
     return loc
 
 
@@ -29,12 +87,25 @@ def create_location(loc: Location):
 def update_location(location_id: str, loc: Location):
     if location_id not in _locations:
         raise HTTPException(404, "Location not found")
+    changed = loc.id != location_id or loc.adjacent != _locations[location_id].adjacent
     _locations[location_id] = loc
+    if changed:
+        reset_travel()
     return loc
 
 
+@router.patch("/{location_id}", status_code=204)
+def patch_location(location_id: str, patch: Any = Body(...)):
+    if location_id not in _locations:
+        raise HTTPException(404, "Location not found")
+    new, log = apply_patch_logged(_locations[location_id], patch)
+    with _locations.patching(location_id, log):  # WAL には変更ログだけを記録する
+        update_location(location_id, new)
+
+
 @router.delete("/{location_id}", status_code=204)
 def delete_location(location_id: str):
     if location_id not in _locations:
         raise HTTPException(404, "Location not found")
     del _locations[location_id]
+    reset_travel()
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
+from typing import Any
+
+from fastapi import APIRouter, Body, HTTPException
 
 from app.models import ScenarioConfig
+from app.services.patch_service import apply_patch_logged
+from app.services.storage_service import get_storage
 
 router = APIRouter()
 
-# 一時的なインメモリ（後でDB/JSON永続化に置換）
-_scenarios: dict[str, ScenarioConfig] = {}
+# インメモリ。STORAGE_DIR 設定時は storage_service で WAL に永続化
+_scenarios: dict[str, ScenarioConfig] = get_storage().table("scenarios", ScenarioConfig)
 
 
 @router.get("")
@@ -36,6 +40,15 @@ def update_scenario(scenario_id: str, config: ScenarioConfig):
     return {"id": scenario_id, "config": config}
 
 
+@router.patch("/{scenario_id}", status_code=204)
+def patch_scenario(scenario_id: str, patch: Any = Body(...)):
+    if scenario_id not in _scenarios:
+        raise HTTPException(404, "Scenario not found")
+    new, log = apply_patch_logged(_scenarios[scenario_id], patch)
+    with _scenarios.patching(scenario_id, log):  # WAL には変更ログだけを記録する
+        update_scenario(scenario_id, new)
+
+
 @router.delete("/{scenario_id}", status_code=204)
 def delete_scenario(scenario_id: str):
     if scenario_id not in _scenarios:
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
+from typing import Any
+
+from fastapi import APIRouter, Body, HTTPException
 
 from app.models import Secret
+from app.services.patch_service import apply_patch_logged
+from app.services.storage_service import get_storage
 
 router = APIRouter()
-_secrets: dict[str, Secret] = {}
+_secrets: dict[str, Secret] = get_storage().table("secrets", Secret)
 
 
 @router.get("")
@@ -33,6 +37,15 @@ def update_secret(secret_id: str, s: Secret):
     return s
 
 
+@router.patch("/{secret_id}", status_code=204)
+def patch_secret(secret_id: str, patch: Any = Body(...)):
+    if secret_id not in _secrets:
+        raise HTTPException(404, "Secret not found")
+    new, log = apply_patch_logged(_secrets[secret_id], patch)
+    with _secrets.patching(secret_id, log):  # WAL には変更ログだけを記録する
+        update_secret(secret_id, new)
+
+
 @router.delete("/{secret_id}", status_code=204)
 def delete_secret(secret_id: str):
     if secret_id not in _secrets:
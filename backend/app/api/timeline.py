@@ -1,10 +1,119 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any
 
-from app.models import CharacterTimeline, TimeBlock
+from fastapi import APIRouter, Body, HTTPException, Query
+
+from app.api import characters as characters_api
+from app.api import locations as locations_api
+from app.models import CharacterRole, CharacterTimeline, TimeBlock
+from app.services.inference_service import DerivedEngine, SuspectRanking, block_score, suspect_score
+from app.services.patch_service import apply_patch_logged
+from app.services.storage_service import get_storage
 
 router = APIRouter()
-_timelines: dict[str, CharacterTimeline] = {}
+_timelines: dict[str, CharacterTimeline] = get_storage().table("timelines", CharacterTimeline)
+
+# タイムラインのリビジョン。変更のたびに増え、変更のあったキャラクターには _revisions に記録する
+_revision = 0
+_revisions: dict[str, int] = {}
+# DerivedStats の一括計算（リビジョンごとに結果を覚えておく）
+_derived = DerivedEngine()
+# 疑わしさの順位（タイムラインが変わった人の分だけ更新する）
+_ranking = SuspectRanking()
+# キャラクターごとの一番長いブロックの秒数。time_blocks は開始時刻順なので、
+# [t0, t1] と重なりうるのは開始が t0 - 最長 〜 t1 のブロックだけ（二分探索2回で範囲が決まる）
+_longest: dict[str, float] = {}
+
+
+def _start_key(block: TimeBlock) -> float:
+    return block.time_range.start.timestamp()
+
+
+def _duration(block: TimeBlock) -> float:
+    return max(block.time_range.end.timestamp() - block.time_range.start.timestamp(), 0.0)
+
+
+def _sort_blocks(tl: CharacterTimeline) -> bool:
+    """time_blocks を開始時刻順にする（同時刻なら元の順）。並べ替えたら True。"""
+    keys = [_start_key(b) for b in tl.time_blocks]
+    if all(a <= b for a, b in zip(keys, keys[1:])):
+        return False
+    tl.time_blocks.sort(key=_start_key)
+    return True
+
+
+def _touch(*character_ids: str, rescore: bool = True) -> None:
+    """
+    リビジョンを進め、character_ids のタイムラインを変更済みにする。
+    rescore=True（タイムラインを丸ごと置き換えた）ならその人たちの疑わしさと最長ブロックを計算し直す。
+    """
+    global _revision
+    _revision += 1
+    for character_id in character_ids:
+        _revisions[character_id] = _revision
+        if not rescore:
+            continue
+        tl = _timelines.get(character_id)
+        if tl is None:
+            _ranking.remove(character_id)
+            _longest.pop(character_id, None)
+        else:
+            _ranking.set(character_id, suspect_score(tl))
+            _longest[character_id] = max(map(_duration, tl.time_blocks), default=0.0)
+
+
+def rebuild_indexes() -> None:
+    """_timelines を直接書き換えた後（JSONインポートなど）に並び順・リビジョン・順位を作り直す。"""
+    for character_id, tl in list(_timelines.items()):
+        if _sort_blocks(tl):
+            _timelines[character_id] = tl
+    _touch(*_timelines, rescore=False)
+    _ranking.rebuild(_timelines)
+    _longest.clear()
+    for character_id, tl in _timelines.items():
+        _longest[character_id] = max(map(_duration, tl.time_blocks), default=0.0)
+
+
+def _blocks_between(character_id: str, t0: float | None, t1: float | None) -> list[TimeBlock]:
+    """character_id のブロックのうち [t0, t1] と重なるもの（開始時刻順）。None は上限・下限なし。"""
+    blocks = _timelines[character_id].time_blocks
+    lo = 0 if t0 is None else bisect_left(blocks, t0 - _longest.get(character_id, 0.0), key=_start_key)
+    hi = len(blocks) if t1 is None else bisect_right(blocks, t1, key=_start_key)
+    if t0 is None:
+        return blocks[lo:hi]
+    return [b for b in blocks[lo:hi] if b.time_range.end.timestamp() >= t0]
+
+
+rebuild_indexes()
+
+
+def victim_id() -> str | None:
+    """被害者（role=victim）のキャラクターID。いなければ None。"""
+    for c in characters_api._characters.values():
+        if c.role == CharacterRole.victim:
+            return c.id
+    return None
+
+
+def _parse_time(value: str, name: str) -> float:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        raise HTTPException(400, f"{name} は ISO 8601 の日時で指定してください")
+
+
+def _parse_window(start: str | None, end: str | None) -> tuple[str, str] | None:
+    if start is None and end is None:
+        return None
+    if start is None or end is None:
+        raise HTTPException(400, "window_start と window_end は両方指定してください")
+    t0 = _parse_time(start, "window_start")
+    t1 = _parse_time(end, "window_end")
+    if t1 < t0:
+        raise HTTPException(400, "window_end は window_start 以降の日時で指定してください")
+    return start, end
 
 
 @router.get("")
@@ -12,6 +121,41 @@ def list_timelines():
     return list(_timelines.values())
 
 
+@router.post("/derived")
+def compute_derived_stats(
+    victim: str | None = None,
+    window_start: str | None = None,
+    window_end: str | None = None,
+):
+    """
+    全キャラクターのタイムラインの derived（DerivedStats）を一括で計算して保存する。
+    victim 未指定なら role=victim のキャラクター。window_start / window_end は犯行時間帯（ISO 8601）。
+    移動の実現可能性は場所の最短移動時間（locations の adjacent）で判定する。
+    前回から本人・被害者・同じ場所にいた人のタイムラインと場所のつながりが変わっていないキャラクターは計算し直さない。
+    """
+    window = _parse_window(window_start, window_end)
+    changed = _derived.compute(
+        _timelines,
+        _revisions,
+        victim or victim_id(),
+        window,
+        travel=locations_api.travel_matrix().matrix,
+        travel_key=locations_api.travel_revision(),
+    )
+    for cid, stats in changed.items():
+        # derived は計算結果なのでリビジョンは進めない（犯行時間帯に近づけたかで疑わしさは変わる）
+        # stats はエンジンが覚えている結果なので書き換えず、スコアを入れたコピーを保存する
+        tl = _timelines[cid].model_copy(update={"derived": stats})
+        score = suspect_score(tl)
+        _ranking.set(cid, score)
+        _timelines[cid] = tl.model_copy(update={"derived": stats.model_copy(update={"suspect_score_total": score})})
+    return {
+        "updated": sorted(changed),
+        "skipped": len(_timelines) - len(changed),
+        "derived": {cid: tl.derived for cid, tl in _timelines.items()},
+    }
+
+
 @router.get("/{character_id}")
 def get_timeline(character_id: str):
     if character_id not in _timelines:
@@ -19,9 +163,30 @@ def get_timeline(character_id: str):
     return _timelines[character_id]
 
 
+@router.get("/{character_id}/blocks")
+def list_time_blocks(
+    character_id: str,
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+):
+    """
+    [from, to]（ISO 8601）と重なるブロックを開始時刻順に返す。どちらも省略可。
+    表示中の範囲だけを取るのに使う（O(log n + 返す件数)）。
+    """
+    if character_id not in _timelines:
+        raise HTTPException(404, "Timeline not found")
+    t0 = None if from_ is None else _parse_time(from_, "from")
+    t1 = None if to is None else _parse_time(to, "to")
+    if t0 is not None and t1 is not None and t1 < t0:
+        raise HTTPException(400, "to は from 以降の日時で指定してください")
+    return _blocks_between(character_id, t0, t1)
+
+
 @router.post("", status_code=201)
 def create_timeline(tl: CharacterTimeline):
+    _sort_blocks(tl)
     _timelines[tl.character_id] = tl
+    _touch(tl.character_id)
     return tl
 
 
@@ -29,20 +194,68 @@ def create_timeline(tl: CharacterTimeline):
 def update_timeline(character_id: str, tl: CharacterTimeline):
     if character_id not in _timelines:
         raise HTTPException(404, "Timeline not found")
+    _sort_blocks(tl)
     _timelines[character_id] = tl
+    _touch(character_id)
     return tl
 
 
+@router.patch("/{character_id}", status_code=204)
+def patch_timeline(character_id: str, patch: Any = Body(...)):
+    """
+    マージパッチ（オブジェクト）または JSON Patch（配列）で部分更新する。
+    レスポンスは本文なし（変更後のタイムライン全体は返さない）。ブロック1つの項目なら
+    [{"op": "replace", "path": "/time_blocks/3/interpretation/alibi_strength", "value": 0.8}]。
+    """
+    if character_id not in _timelines:
+        raise HTTPException(404, "Timeline not found")
+    tl, log = apply_patch_logged(_timelines[character_id], patch)
+    if _sort_blocks(tl):
+        # 並べ替えたら添字で書いた変更ログとずれるので、タイムライン全体を記録する
+        update_timeline(character_id, tl)
+        return
+    with _timelines.patching(character_id, log):
+        update_timeline(character_id, tl)
+
+
 @router.delete("/{character_id}", status_code=204)
 def delete_timeline(character_id: str):
     if character_id not in _timelines:
         raise HTTPException(404, "Timeline not found")
     del _timelines[character_id]
+    _touch(character_id)
 
 
 @router.post("/{character_id}/blocks", status_code=201)
-def add_time_block(character_id: str, block: TimeBlock):
+def add_time_block(character_id: str, block: TimeBlock, allow_overlap: bool = False):
+    """
+    ブロックを開始時刻順の位置に挿入する。
+    同じ時間に別の場所にいるブロックと重なるなら 400（allow_overlap=true なら挿入する）。
+    """
     if character_id not in _timelines:
         raise HTTPException(404, "Timeline not found")
-    _timelines[character_id].time_blocks.append(block)
+    tl = _timelines[character_id]
+    start, end = block.time_range.start.timestamp(), block.time_range.end.timestamp()
+    if not allow_overlap:
+        conflicts = [
+            b.block_id for b in _blocks_between(character_id, start, end)
+            if b.location_id != block.location_id
+            and b.time_range.start.timestamp() < end and start < b.time_range.end.timestamp()
+        ]
+        if conflicts:
+            raise HTTPException(400, f"同じ時間に別の場所にいるブロックと重なります: {', '.join(conflicts)}")
+    # 保存済みのモデルは書き換えない（スナップショットが別スレッドで直列化していることがある）。
+    # WAL には挿入したブロックだけを記録する
+    i = bisect_right(tl.time_blocks, start, key=_start_key)
+    blocks = list(tl.time_blocks)
+    blocks.insert(i, block)
+    _timelines.set_patched(
+        character_id,
+        tl.model_copy(update={"time_blocks": blocks}),
+        [{"op": "insert", "path": f"/time_blocks/{i}", "value": block.model_dump(mode="json")}],
+    )
+    # 足したブロックの分だけ合計と最長ブロックを動かす
+    _touch(character_id, rescore=False)
+    _ranking.add(character_id, block_score(block))
+    _longest[character_id] = max(_longest.get(character_id, 0.0), _duration(block))
     return block
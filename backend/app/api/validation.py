@@ -1,7 +1,20 @@
 # -*- coding: utf-8 -*-
+import re
+import sys
+from typing import Any
+
 from fastapi import APIRouter
 from pydantic import BaseModel
 
+from app.api import characters as characters_api
+from app.api import events as events_api
+from app.api import evidence as evidence_api
+from app.api import graph as graph_api
+from app.api import locations as locations_api
+from app.api import timeline as timeline_api
+from app.models import CharacterRole, NodeType
+from app.services.validation_service import find_timeline_conflicts
+
 router = APIRouter()
 
 
@@ -9,21 +22,154 @@ class ValidationResult(BaseModel):
     valid: bool
     errors: list[str] = []
     warnings: list[str] = []
+    details: list[dict[str, Any]] = []
+
+
+def _phase_key(phase: str) -> tuple[int, str]:
+    """phase1 < phase2 < ... < phase10 の順に並べるためのキー。番号のないフェーズは最後。"""
+    m = re.search(r"(\d+)$", phase)
+    return (int(m.group(1)) if m else sys.maxsize, phase)
+
+
+def _path(node_ids: list[str]) -> str:
+    return " → ".join(node_ids)
 
 
 @router.post("/timeline", response_model=ValidationResult)
 def validate_timeline():
-    """タイムラインの整合性チェック（移動不可能・同一人物重複など）"""
-    return ValidationResult(valid=True, errors=[], warnings=[])
+    """
+    タイムラインの整合性チェック（移動不可能・同一人物重複など）。
+    全キャラクターのブロックとイベントを1回のスイープで調べる（validation_service.find_timeline_conflicts）。
+    場所の移動は locations の adjacent から求めた最短移動時間と比べる。
+    details の各要素は kind と、該当する block_ids / block_id / event_id を持つ。
+    """
+    errors: list[str] = []
+    details = find_timeline_conflicts(
+        timeline_api._timelines.values(),
+        events_api._events.values(),
+        travel=locations_api.travel_matrix().seconds,
+    )
+
+    def name(cid: str) -> str:
+        c = characters_api._characters.get(cid)
+        return c.name if c else cid
+
+    for d in details:
+        if d["kind"] == "location_overlap":
+            a, b = d["block_ids"]
+            errors.append(
+                f"{name(d['character_id'])} が同じ時間（{d['start']} 〜 {d['end']}）に別の場所にいます: "
+                f"{a}（{d['location_ids'][0]}） / {b}（{d['location_ids'][1]}）"
+            )
+        elif d["kind"] == "event_participant_elsewhere":
+            errors.append(
+                f"イベント {d['event_id']} の参加者 {name(d['character_id'])} が、その時間は "
+                f"{d['location_id']} にいます（ブロック {d['block_id']}）"
+            )
+        elif d["kind"] == "impossible_transition":
+            a, b = d["block_ids"]
+            route = f"{d['from_location_id']} から {d['to_location_id']} "
+            if d["required_seconds"] is None:
+                reason = f"{route}への道がありません"
+            else:
+                reason = f"{route}へ {d['gap_seconds']:.0f} 秒では移動できません（最短 {d['required_seconds']:.0f} 秒）"
+            errors.append(f"{name(d['character_id'])} が {reason}: {a} → {b}")
+    return ValidationResult(valid=not errors, errors=errors, warnings=[], details=details)
 
 
 @router.post("/graph", response_model=ValidationResult)
 def validate_graph():
     """グラフ整合性：各秘密に1本以上のバックトラックパス、矛盾なし等"""
-    return ValidationResult(valid=True, errors=[], warnings=[])
+    errors: list[str] = []
+    warnings: list[str] = []
+    details: list[dict[str, Any]] = []
+    for node in graph_api.find_unsupported_secrets():
+        errors.append(
+            f"秘密 {node.reference_id}（ノード {node.node_id}）に証拠からのバックトラックパス（supports / implies）がありません"
+        )
+
+    found = graph_api.detect_contradictions()
+    for w in found["support_refute"]:
+        errors.append(
+            f"ノード {w['node_id']} が {w['target_node_id']} を支持しつつ否定しています: "
+            f"{_path(w['support_path'])} / {_path(w['refute_path'])}（refutes: {w['edge_id']}）"
+        )
+        details.append({"kind": "support_refute", **w})
+    for w in found["contradicts_in_cycle"]:
+        errors.append(
+            f"contradicts {w['edge_id']} の両端が互いに導き合っています: {_path(w['path'])}"
+        )
+        details.append({"kind": "contradicts_in_cycle", **w})
+    for w in found["cycle"]:
+        warnings.append(f"循環した推論があります: {_path(w['path'])}")
+        details.append({"kind": "cycle", **w})
+    return ValidationResult(valid=not errors, errors=errors, warnings=warnings, details=details)
 
 
 @router.post("/culprit", response_model=ValidationResult)
 def validate_culprit():
-    """犯人決定可能性：公開証拠のみで犯人に到達できるか"""
-    return ValidationResult(valid=True, errors=[], warnings=[])
+    """
+    犯人決定可能性：公開証拠のみで犯人に到達できるか。
+    各公開フェーズまでに公開された証拠を起点に supports / implies / rule_applies で成立、
+    refutes で否定を前向きに導き、容疑者（被害者以外の人物）のうち犯人だけが
+    成立して否定されていない状態になるフェーズを調べる。
+    """
+    errors: list[str] = []
+    warnings: list[str] = []
+    details: list[dict[str, Any]] = []
+
+    suspects = {c.id: c for c in characters_api._characters.values() if c.role != CharacterRole.victim}
+    culprit_ids = [cid for cid, c in suspects.items() if c.role == CharacterRole.culprit]
+    if not culprit_ids:
+        errors.append("犯人（role=culprit）のキャラクターがいません")
+        return ValidationResult(valid=False, errors=errors, warnings=warnings)
+    if len(culprit_ids) > 1:
+        warnings.append(f"犯人が複数設定されています: {', '.join(culprit_ids)}")
+
+    nodes_by_character: dict[str, list[str]] = {}
+    for n in graph_api._nodes.values():
+        if n.node_type == NodeType.character and n.reference_id in suspects:
+            nodes_by_character.setdefault(n.reference_id, []).append(n.node_id)
+    for cid in culprit_ids:
+        if cid not in nodes_by_character:
+            errors.append(f"犯人 {suspects[cid].name} の人物ノードがグラフにありません")
+    if errors:
+        return ValidationResult(valid=False, errors=errors, warnings=warnings)
+
+    evidence_phases = {e.id: _phase_key(e.visibility.reveal_phase) for e in evidence_api._evidence.values()}
+    phases = sorted({e.visibility.reveal_phase for e in evidence_api._evidence.values()}, key=_phase_key)
+    status = graph_api.derive_phases(
+        evidence_phases,
+        [node_id for node_ids in nodes_by_character.values() for node_id in node_ids],
+    )
+
+    def earliest(cid: str, which: int) -> Any:
+        phases_ = [status[nid][which] for nid in nodes_by_character.get(cid, []) if status[nid][which] is not None]
+        return min(phases_) if phases_ else None
+
+    est = {cid: earliest(cid, 0) for cid in suspects}
+    ref = {cid: earliest(cid, 1) for cid in suspects}
+    determined_at: str | None = None
+    for phase in phases:
+        key = _phase_key(phase)
+        established = sorted(
+            cid for cid in suspects
+            if est[cid] is not None and est[cid] <= key and not (ref[cid] is not None and ref[cid] <= key)
+        )
+        refuted = sorted(cid for cid in suspects if ref[cid] is not None and ref[cid] <= key)
+        derivable = all(cid in established for cid in culprit_ids)
+        unique = derivable and set(established) == set(culprit_ids)
+        if unique and determined_at is None:
+            determined_at = phase
+        details.append({
+            "phase": phase,
+            "established_character_ids": established,
+            "refuted_character_ids": refuted,
+            "culprit_derivable": derivable,
+            "culprit_unique": unique,
+        })
+
+    if determined_at is None:
+        last = phases[-1] if phases else "（公開証拠なし）"
+        errors.append(f"公開証拠のみでは最終フェーズ {last} までに犯人を一意に導けません")
+    return ValidationResult(valid=not errors, errors=errors, warnings=warnings, details=details)
@@ -6,6 +6,17 @@ from functools import lru_cache
 class Settings(BaseSettings):
     app_name: str = "マーダーミステリーシナリオ生成API"
     debug: bool = False
+    # 永続化先ディレクトリ（未設定ならインメモリのみ）
+    storage_dir: str | None = None
+    storage_fsync_interval_ms: int = 200
+    storage_snapshot_every: int = 5000
+    # 接触タイムライン構築エンジン（"python" / "numpy"）
+    contact_timeline_engine: str = "python"
+    # contact_data.json の保存（gzip なら contact_data.json.gz）。連続した取り込みは待ち時間内で1回の書き込みにまとめる
+    contact_data_gzip: bool = False
+    contact_data_write_delay_ms: int = 500
+    # 接触ブロック圧縮（取り込み時 compact=true）で、同じグループ構成のブロックをまとめる空きの上限（秒）
+    contact_compact_gap_seconds: float = 60.0
     # 後でLLM APIキーなどを追加
     # openai_api_key: str | None = None
 
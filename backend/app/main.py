@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from app.config import get_settings
 from app.api import (
@@ -12,12 +13,14 @@ from app.api import (
     secrets,
     claims,
     timeline,
+    inference,
     graph,
     validation,
     import_api,
     background,
     export_import,
 )
+from app.services.patch_service import PatchError
 
 
 def create_app() -> FastAPI:
@@ -32,6 +35,10 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    @app.exception_handler(PatchError)
+    def patch_error(request: Request, exc: PatchError):
+        return JSONResponse(status_code=400, content={"detail": str(exc)})
+
     app.include_router(scenarios.router, prefix="/api/scenarios", tags=["scenarios"])
     app.include_router(characters.router, prefix="/api/characters", tags=["characters"])
     app.include_router(locations.router, prefix="/api/locations", tags=["locations"])
@@ -40,6 +47,7 @@ def create_app() -> FastAPI:
     app.include_router(secrets.router, prefix="/api/secrets", tags=["secrets"])
     app.include_router(claims.router, prefix="/api/claims", tags=["claims"])
     app.include_router(timeline.router, prefix="/api/timeline", tags=["timeline"])
+    app.include_router(inference.router, prefix="/api/inference", tags=["inference"])
     app.include_router(graph.router, prefix="/api/graph", tags=["graph"])
     app.include_router(validation.router, prefix="/api/validation", tags=["validation"])
     app.include_router(import_api.router, prefix="/api/import", tags=["import"])
@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 from app.models.character import Character, Relation, CharacterRole
-from app.models.location import Location
+from app.models.location import Location, Geofence, LocationEdge
 from app.models.common import TimeRange
 from app.models.event import Event, EventLinks
 from app.models.evidence import EvidenceItem, EvidencePointers, EvidenceEffects, EvidenceVisibility, EvidenceAcquisition, EvidenceAssets
 from app.models.secret import Secret, Claim, Deny
-from app.models.timeline import TimeBlock, Observations, Interpretation, PromptBits, CharacterTimeline, DerivedStats, PromptPack
+from app.models.timeline import TimeBlock, Observations, PresenceObservation, Interpretation, PromptBits, CharacterTimeline, DerivedStats, PromptPack
 from app.models.graph import GraphNode, GraphEdge, NodeType, EdgeType, Logic
 from app.models.scenario import ScenarioConfig
 from app.models.background import Background
@@ -15,6 +15,8 @@ __all__ = [
     "Relation",
     "CharacterRole",
     "Location",
+    "Geofence",
+    "LocationEdge",
     "Event",
     "EventLinks",
     "TimeRange",
@@ -29,6 +31,7 @@ __all__ = [
     "Deny",
     "TimeBlock",
     "Observations",
+    "PresenceObservation",
     "Interpretation",
     "PromptBits",
     "CharacterTimeline",
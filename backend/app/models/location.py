@@ -1,8 +1,24 @@
 # -*- coding: utf-8 -*-
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+
+class Geofence(BaseModel):
+    """場所の範囲（中心と半径の円）。GPS ログの位置をこの場所に割り当てるのに使う。"""
+    lat: float = Field(..., ge=-90.0, le=90.0)
+    lng: float = Field(..., ge=-180.0, le=180.0)
+    radius_m: float = Field(30.0, gt=0.0)
+
+
+class LocationEdge(BaseModel):
+    """隣の場所への移動（通路・ドアなど）と、その移動にかかる秒数。"""
+    to_location_id: str
+    travel_seconds: float = Field(..., ge=0.0)
+    one_way: bool = False  # True なら to_location_id への一方通行
 
 
 class Location(BaseModel):
     id: str
     name: str
     details: str | None = None
+    geofence: Geofence | None = None
+    adjacent: list[LocationEdge] = []
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+接触タイムライン（build_contact_timeline の結果）のインデックス。
+
+ブロックは時刻順に並び互いに重ならないので、start 列と end 列はどちらも昇順になる。
+区間 [from, to] と重なるブロックは「end >= from」かつ「start <= to」の連続した範囲なので、
+二分探索2回で求まる（O(log n + k)）。
+追記モード（extend_contact_timeline）で変わるのは最後のブロック以降だけなので、
+インデックスもそこから先だけを作り直す。
+
+キャラクターごと・ペアごとのポスティングリスト（そのキャラクター／2人が同じグループにいた
+ブロック番号の昇順リスト）も同じ要領で持つ。あるキャラクターのブロックも時刻順で重ならないので、
+「X がいた時間」「X と一緒にいた人」「X と Y が一緒にいた時間・最後に一緒だった時刻」は
+それぞれのリスト上の二分探索で求まる。
+
+ズームアウト表示用に、PYRAMID_LEVELS 秒ごとのバケット（ピラミッド）も持つ。各バケットには
+そのバケット内で最も長く続いたグループ構成（dominant）と、ブロックが占める時間の割合（coverage）を入れる。
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Any
+
+from app.services.import_service import canonical_groups
+
+# ピラミッドの段（バケット幅・秒）: 1分 / 5分 / 15分
+PYRAMID_LEVELS = (60, 300, 900)
+
+
+def parse_time(value: str) -> float:
+    """ISO 8601 文字列 → epoch 秒。タイムライン・クエリの比較キー。"""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class Posting:
+    """ブロック番号と、そのブロック内のグループ番号・時刻（昇順）。"""
+
+    __slots__ = ("blocks", "groups", "starts", "ends")
+
+    def __init__(self) -> None:
+        self.blocks: list[int] = []
+        self.groups: list[int] = []
+        self.starts: list[float] = []
+        self.ends: list[float] = []
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def add(self, block: int, group: int, start: float, end: float) -> None:
+        self.blocks.append(block)
+        self.groups.append(group)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def truncate(self, first_block: int) -> None:
+        """ブロック番号 first_block 以降の要素を落とす。"""
+        cut = bisect_left(self.blocks, first_block)
+        del self.blocks[cut:], self.groups[cut:], self.starts[cut:], self.ends[cut:]
+
+    def overlapping(self, t_from: float | None = None, t_to: float | None = None) -> range:
+        """[t_from, t_to] と重なる要素の位置。"""
+        lo = bisect_left(self.ends, t_from) if t_from is not None else 0
+        hi = bisect_right(self.starts, t_to) if t_to is not None else len(self.blocks)
+        return range(lo, max(lo, hi))
+
+
+class PyramidLevel:
+    """バケット幅 size 秒の段。ブロックのあるバケットだけを、バケット番号（epoch 秒 // size）の昇順で持つ。"""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.keys: list[int] = []
+        self.buckets: list[dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def truncate(self, key: int) -> None:
+        cut = bisect_left(self.keys, key)
+        del self.keys[cut:], self.buckets[cut:]
+
+    def overlapping(self, t_from: float | None = None, t_to: float | None = None) -> tuple[int, int]:
+        lo = bisect_left(self.keys, int(t_from // self.size)) if t_from is not None else 0
+        hi = bisect_right(self.keys, int(t_to // self.size)) if t_to is not None else len(self.keys)
+        return lo, max(lo, hi)
+
+    def rebuild(self, index: "ContactTimelineIndex", from_key: int | None = None) -> None:
+        """バケット from_key 以降（None なら全部）を index のブロックから作り直す。"""
+        size = self.size
+        if from_key is None:
+            self.keys.clear()
+            self.buckets.clear()
+            first_block = 0
+        else:
+            self.truncate(from_key)
+            first_block = bisect_left(index.ends, from_key * size)
+        acc: dict[int, dict[tuple, list[float]]] = {}
+        for b in range(first_block, len(index.starts)):
+            start, end = index.starts[b], index.ends[b]
+            config = tuple(tuple(g) for g in canonical_groups(index.blocks[b]["groups"]))
+            first_key = int(start // size) if from_key is None else max(int(start // size), from_key)
+            for key in range(first_key, int(end // size) + 1):
+                seconds = max(0.0, min(end, (key + 1) * size) - max(start, key * size))
+                entry = acc.setdefault(key, {}).setdefault(config, [0.0, 0])
+                entry[0] += seconds
+                entry[1] += 1
+        for key in sorted(acc):
+            configs = acc[key]
+            covered = sum(v[0] for v in configs.values())
+            count = sum(v[1] for v in configs.values())
+            dominant, (dom_seconds, dom_count) = max(configs.items(), key=lambda kv: (kv[1][0], kv[1][1]))
+            self.keys.append(key)
+            self.buckets.append({
+                "start": datetime.fromtimestamp(key * size, tz=timezone.utc).isoformat(),
+                "end": datetime.fromtimestamp((key + 1) * size, tz=timezone.utc).isoformat(),
+                "groups": [list(g) for g in dominant],
+                "coverage": round(min(covered / size, 1.0), 4),
+                "dominant_fraction": round(dom_seconds / covered if covered > 0 else dom_count / count, 4),
+                "blocks": count,
+            })
+
+
+def pair_key(a: str, b: str) -> tuple[str, str]:
+    return (a, b) if a <= b else (b, a)
+
+
+class ContactTimelineIndex:
+    """ブロックの start / end（epoch 秒）の昇順配列と、キャラクター・ペアごとのポスティングリスト。"""
+
+    def __init__(self) -> None:
+        self.starts: list[float] = []
+        self.ends: list[float] = []
+        self.blocks: list[dict[str, Any]] = []  # 索引済みのブロック（追記で置き換わる前のものを覚えておく）
+        self.by_character: dict[str, Posting] = {}
+        self.by_pair: dict[tuple[str, str], Posting] = {}
+        self.levels: dict[int, PyramidLevel] = {size: PyramidLevel(size) for size in PYRAMID_LEVELS}
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def rebuild(self, timeline: list[dict[str, Any]], first: int = 0) -> None:
+        """timeline[first:] が変わったときに、その範囲だけ作り直す。first=0 で全体。"""
+        if first == 0:
+            self.by_character.clear()
+            self.by_pair.clear()
+        else:
+            # 作り直す範囲に出てきたキャラクター・ペアのリストだけ末尾を落とす
+            for block in self.blocks[first:]:
+                for group in block["groups"]:
+                    for i, a in enumerate(group):
+                        self._truncate(self.by_character, a, first)
+                        for b in group[i + 1:]:
+                            self._truncate(self.by_pair, pair_key(a, b), first)
+        # ピラミッドは、変わる前と後のどちらかのブロックが始まる時刻以降のバケットを作り直す
+        cut_time = self.starts[first] if first < len(self.starts) else None
+        if first < len(timeline):
+            new_start = parse_time(timeline[first]["start"])
+            cut_time = new_start if cut_time is None else min(cut_time, new_start)
+        del self.starts[first:]
+        del self.ends[first:]
+        del self.blocks[first:]
+
+        for index in range(first, len(timeline)):
+            block = timeline[index]
+            start, end = parse_time(block["start"]), parse_time(block["end"])
+            self.starts.append(start)
+            self.ends.append(end)
+            self.blocks.append(block)
+            for g, group in enumerate(block["groups"]):
+                for i, a in enumerate(group):
+                    self.by_character.setdefault(a, Posting()).add(index, g, start, end)
+                    for b in group[i + 1:]:
+                        if a != b:
+                            self.by_pair.setdefault(pair_key(a, b), Posting()).add(index, g, start, end)
+
+        for level in self.levels.values():
+            if first == 0:
+                level.rebuild(self)
+            elif cut_time is not None:
+                level.rebuild(self, int(cut_time // level.size))
+
+    @staticmethod
+    def _truncate(postings: dict, key: Any, first: int) -> None:
+        posting = postings.get(key)
+        if posting is not None:
+            posting.truncate(first)
+            if not posting:
+                del postings[key]
+
+    def overlapping(self, t_from: float | None = None, t_to: float | None = None) -> tuple[int, int]:
+        """[t_from, t_to] と重なるブロックの添字範囲 [lo, hi)。None は無制限。"""
+        lo = bisect_left(self.ends, t_from) if t_from is not None else 0
+        hi = bisect_right(self.starts, t_to) if t_to is not None else len(self.starts)
+        return lo, max(lo, hi)
+
+    # ---- キャラクター単位の問い合わせ ----
+
+    def presence(
+        self, character_id: str, t_from: float | None = None, t_to: float | None = None
+    ) -> list[tuple[int, int]]:
+        """character_id が誰かと一緒にいたブロック (ブロック番号, グループ番号)。O(log n + k)。"""
+        posting = self.by_character.get(character_id)
+        if posting is None:
+            return []
+        return [(posting.blocks[i], posting.groups[i]) for i in posting.overlapping(t_from, t_to)]
+
+    def companions(
+        self, character_id: str, t_from: float | None = None, t_to: float | None = None
+    ) -> dict[str, dict[str, float]]:
+        """character_id と同じグループにいた相手ごとの { blocks: ブロック数, seconds: [t_from, t_to] 内の重なり秒数 }。"""
+        result: dict[str, dict[str, float]] = {}
+        for b, g in self.presence(character_id, t_from, t_to):
+            seconds = self.seconds(b, t_from, t_to)
+            for other in self.blocks[b]["groups"][g]:
+                if other == character_id:
+                    continue
+                entry = result.setdefault(other, {"blocks": 0, "seconds": 0.0})
+                entry["blocks"] += 1
+                entry["seconds"] += seconds
+        return result
+
+    def seconds(self, block: int, t_from: float | None = None, t_to: float | None = None) -> float:
+        """ブロック block のうち [t_from, t_to] に入る秒数。"""
+        lo = self.starts[block] if t_from is None else max(self.starts[block], t_from)
+        hi = self.ends[block] if t_to is None else min(self.ends[block], t_to)
+        return max(0.0, hi - lo)
+
+    def together(
+        self, a: str, b: str, t_from: float | None = None, t_to: float | None = None
+    ) -> list[int]:
+        """a と b が同じグループにいたブロック番号（昇順）。O(log n + k)。"""
+        posting = self.by_pair.get(pair_key(a, b))
+        if posting is None:
+            return []
+        return [posting.blocks[i] for i in posting.overlapping(t_from, t_to)]
+
+    def last_together(self, a: str, b: str, before: float | None = None) -> int | None:
+        """before（含む）までで a と b が最後に一緒だったブロック番号。O(log n)。"""
+        posting = self.by_pair.get(pair_key(a, b))
+        if posting is None:
+            return None
+        hi = bisect_right(posting.starts, before) if before is not None else len(posting)
+        return posting.blocks[hi - 1] if hi else None
+
+
+def referenced_ids(blocks: list[dict[str, Any]]) -> set[str]:
+    """ブロックのグループに出てくるキャラクターID。"""
+    return {cid for block in blocks for group in block["groups"] for cid in group}
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+build_contact_timeline の NumPy 版エンジン（engine="numpy"）。
+
+- 時刻は int64 の epoch マイクロ秒（UTC）、ユーザーIDは出現順の整数コードにして列で持つ。
+- 期間（gap_minutes）とクラスタ（transitive_window_seconds）の分割は、時刻順に並べた差分
+  np.diff が閾値を超える位置で一度に求める。どちらの分割でもブロックが切れるので、
+  ブロック境界は「差分 > min(gap, window)」になる。
+- 各ブロックの連結成分は、(ブロック, ユーザー) を頂点とする配列上の union-find
+  （親配列への min フック + ポインタジャンプ）で全ブロック分まとめて求める。
+
+出力は Python 版と同じ（ブロックの start / end と各グループのメンバー集合が一致）。
+グループは人数の多い順、同数なら先に現れたユーザーを含む順。メンバーは出現順。
+"""
+import gc
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+_tz_cache: dict[int, timezone] = {}
+
+
+def _tz(offset_seconds: int) -> timezone:
+    tz = _tz_cache.get(offset_seconds)
+    if tz is None:
+        tz = _tz_cache[offset_seconds] = timezone(timedelta(seconds=offset_seconds))
+    return tz
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """
+    出力の list / dict を数百万個まとめて作る間は循環 GC を止める。
+    作るのは参照の循環を持たないコンテナだけなので、世代別 GC の走査は無駄になる。
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _parse_one(s: str) -> tuple[int, int, bool] | None:
+    try:
+        dt = datetime.fromisoformat(s)
+    except (ValueError, TypeError):
+        return None
+    local = (dt.replace(tzinfo=None) - _EPOCH) // _US
+    if dt.tzinfo is None:
+        return local, 0, False
+    off = int(dt.utcoffset().total_seconds())
+    return local - off * 1_000_000, off, True
+
+
+# parse_timestamps で一度に配列化する行数（コードポイント配列のメモリを抑える）
+PARSE_CHUNK = 1 << 18
+_DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+_POW10 = np.array([100000, 10000, 1000, 100, 10, 1], dtype=np.int64)
+
+
+def _number(d: np.ndarray, lo: int, hi: int) -> np.ndarray:
+    """桁配列の列 lo..hi-1 を10進数として読む。"""
+    value = np.zeros(len(d), dtype=np.int64)
+    for col in range(lo, hi):
+        value = value * 10 + d[:, col]
+    return value
+
+
+def _parse_chunk(ts_list: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    "YYYY-MM-DDTHH:MM:SS[.f{1,6}][±HH:MM|Z]" をコードポイント配列上の整数演算で解釈する。
+    返り値の最後は「この形として解釈できたか」。できなかった行は呼び出し側で fromisoformat に回す。
+    """
+    n = len(ts_list)
+    text = np.array(ts_list, dtype=str)
+    if text.dtype.itemsize < 32 * 4:
+        text = text.astype("U32")
+    width = text.dtype.itemsize // 4
+    cp = text.view(np.uint32).reshape(n, width)
+    length = np.count_nonzero(cp, axis=1)
+    rows = np.arange(n)
+
+    is_z = cp[rows, np.maximum(length - 1, 0)] == ord("Z")
+    at = np.maximum(length - 6, 0)
+    sign_cp = cp[rows, at]
+    has_off = ~is_z & ((sign_cp == ord("+")) | (sign_cp == ord("-"))) & (cp[rows, at + 3] == ord(":"))
+    od = cp[rows[:, None], at[:, None] + np.array([1, 2, 4, 5])].astype(np.int64) - ord("0")
+    off_h = od[:, 0] * 10 + od[:, 1]
+    off_m = od[:, 2] * 10 + od[:, 3]
+    has_off &= ((od >= 0) & (od <= 9)).all(axis=1) & (off_h < 24) & (off_m < 60)
+    off = np.where(has_off, (off_h * 3600 + off_m * 60) * np.where(sign_cp == ord("-"), -1, 1), 0)
+    base_len = length - np.where(has_off, 6, 0) - is_z
+
+    d = cp[:, :26].astype(np.int32) - ord("0")
+    digit = (d >= 0) & (d <= 9)
+    sep = np.array([ord("-"), ord("-"), ord("T"), ord(":"), ord(":")]) - ord("0")
+    ok = (
+        (base_len >= 19) & (base_len <= 26) & (base_len != 20)
+        & digit[:, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]].all(axis=1)
+        & (d[:, [4, 7, 10, 13, 16]] == sep).all(axis=1)
+        & ((base_len == 19) | (d[:, 19] == ord(".") - ord("0")))
+    )
+    frac_pos = np.arange(20, 26)
+    in_frac = frac_pos[None, :] < base_len[:, None]
+    ok &= (digit[:, 20:26] | ~in_frac).all(axis=1)
+
+    year = _number(d, 0, 4)
+    month = _number(d, 5, 7)
+    day = _number(d, 8, 10)
+    hh = _number(d, 11, 13)
+    mm = _number(d, 14, 16)
+    ss = _number(d, 17, 19)
+    month_ok = (month >= 1) & (month <= 12)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    dim = _DAYS_IN_MONTH[np.where(month_ok, month, 0)] + ((month == 2) & leap)
+    ok &= (year >= 1) & month_ok & (day >= 1) & (day <= dim) & (hh < 24) & (mm < 60) & (ss < 60)
+
+    # 日付 → 1970-01-01 からの日数（proleptic グレゴリオ暦）
+    y = year - (month <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    days = era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+    frac = (np.where(in_frac, d[:, 20:26], 0).astype(np.int64) * _POW10).sum(axis=1)
+    us = (((days * 24 + hh) * 60 + mm) * 60 + ss) * 1_000_000 + frac - off * 1_000_000
+    return us, off, is_z | has_off, ok
+
+
+def parse_timestamps(ts_list: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    ISO 8601 文字列の列を (UTC epoch µs, UTC オフセット秒, タイムゾーン付きか, 解釈できたか) の配列にする。
+    datetime.fromisoformat(ts.replace("Z", "+00:00")) と同じ結果になる。
+    よくある形は _parse_chunk でまとめて、それ以外は1行ずつ fromisoformat で解釈する。
+    """
+    n = len(ts_list)
+    us = np.zeros(n, dtype=np.int64)
+    off = np.zeros(n, dtype=np.int64)
+    aware = np.zeros(n, dtype=bool)
+    valid = np.zeros(n, dtype=bool)
+    for lo in range(0, n, PARSE_CHUNK):
+        hi = min(lo + PARSE_CHUNK, n)
+        us[lo:hi], off[lo:hi], aware[lo:hi], valid[lo:hi] = _parse_chunk(ts_list[lo:hi])
+    for i in np.flatnonzero(~valid).tolist():
+        parsed = _parse_one(ts_list[i].replace("Z", "+00:00"))
+        if parsed is not None:
+            us[i], off[i], aware[i] = parsed
+            valid[i] = True
+    return us, off, aware, valid
+
+
+def format_timestamps(us: np.ndarray, off: np.ndarray, aware: np.ndarray) -> list[str]:
+    """parse_timestamps の逆。各要素について datetime.isoformat() と同じ文字列を返す。"""
+    local = us + off * 1_000_000
+    text = np.datetime_as_string(local.astype("datetime64[us]"), unit="us")
+    whole = local % 1_000_000 == 0  # isoformat はマイクロ秒 0 のとき小数部を省く
+    if whole.any():
+        text[whole] = np.datetime_as_string(local[whole].astype("datetime64[us]"), unit="s")
+    if aware.any():
+        suffix = np.full(len(us), "", dtype="U9")
+        for o in np.unique(off[aware]).tolist():
+            suffix[aware & (off == o)] = datetime(2000, 1, 1, tzinfo=_tz(o)).isoformat()[19:]
+        text = np.char.add(text, suffix)
+    return text.tolist()
+
+
+def union_find_labels(n: int, eu: np.ndarray, ev: np.ndarray) -> np.ndarray:
+    """
+    頂点 0..n-1 と辺 (eu[i], ev[i]) の連結成分。各頂点の根（成分内の最小頂点番号）を返す。
+    親配列に対し、辺の両端の根を小さい方へフックしてからポインタジャンプで平坦化、を収束まで繰り返す。
+    """
+    parent = np.arange(n, dtype=np.int64)
+    if len(eu) == 0:
+        return parent
+    while True:
+        pu = parent[eu]
+        pv = parent[ev]
+        differ = pu != pv
+        if not differ.any():
+            return parent
+        pu, pv = pu[differ], pv[differ]
+        low = np.minimum(pu, pv)
+        np.minimum.at(parent, pu, low)
+        np.minimum.at(parent, pv, low)
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+
+def build_blocks(
+    u: np.ndarray,
+    v: np.ndarray,
+    us: np.ndarray,
+    off: np.ndarray,
+    aware: np.ndarray,
+    names: list[str],
+    gap_minutes: float = 1.0,
+    transitive_window_seconds: float = 10.0,
+) -> list[dict[str, Any]]:
+    """列形式（ユーザーコード u / v、UTC epoch µs など）の接触ログからブロックを作る。"""
+    n = len(us)
+    if n == 0:
+        return []
+    order = np.argsort(us, kind="stable")
+    us, u, v, off, aware = us[order], u[order], v[order], off[order], aware[order]
+
+    gap_us = timedelta(minutes=gap_minutes) // _US
+    window_us = timedelta(seconds=transitive_window_seconds) // _US
+    breaks = np.diff(us) > min(gap_us, window_us)
+    block_of_row = np.concatenate(([0], np.cumsum(breaks)))
+    starts = np.flatnonzero(np.concatenate(([True], breaks)))
+    ends = np.concatenate((starts[1:] - 1, [n - 1]))
+
+    # (ブロック, ユーザー) を1頂点にして全ブロック分の連結成分をまとめて求める
+    n_users = max(len(names), 1)
+    keys, inverse = np.unique(
+        np.concatenate((block_of_row * n_users + u, block_of_row * n_users + v)),
+        return_inverse=True,
+    )
+    inverse = inverse.reshape(-1)
+    root = union_find_labels(len(keys), inverse[:n], inverse[n:])
+    node_block = keys // n_users
+    node_user = keys % n_users
+    size = np.bincount(root, minlength=len(keys))[root]
+    node_order = np.lexsort((node_user, root, -size, node_block))
+
+    sorted_block = node_block[node_order]
+    sorted_root = root[node_order]
+    member_names = np.asarray(names, dtype=object)[node_user[node_order]].tolist()
+    group_starts = np.flatnonzero(
+        np.concatenate(([True], (sorted_root[1:] != sorted_root[:-1]) | (sorted_block[1:] != sorted_block[:-1])))
+    ).tolist()
+    group_bounds = group_starts + [len(member_names)]
+    # 各ブロックの最初のグループ番号（どのブロックにも1つ以上のグループがある）
+    first_group = np.searchsorted(sorted_block[group_starts], np.arange(len(starts) + 1)).tolist()
+    start_text = format_timestamps(us[starts], off[starts], aware[starts])
+    end_text = format_timestamps(us[ends], off[ends], aware[ends])
+
+    with _gc_paused():
+        groups = [member_names[a:b] for a, b in zip(group_bounds, group_bounds[1:])]
+        return [
+            {"start": s, "end": e, "groups": groups[first_group[b]:first_group[b + 1]]}
+            for b, (s, e) in enumerate(zip(start_text, end_text))
+        ]
+
+
+def build_contact_timeline_np(
+    contact_rows: Iterable[dict[str, Any]],
+    gap_minutes: float = 1.0,
+    transitive_window_seconds: float = 10.0,
+) -> list[dict[str, Any]]:
+    """build_contact_timeline と同じ入出力の NumPy 版。"""
+    codes: dict[str, int] = {}
+    names: list[str] = []
+    cu: list[int] = []
+    cv: list[int] = []
+    ts_list: list[str] = []
+    for r in contact_rows:
+        a = (r.get("user_id") or "").strip()
+        b = (r.get("contacted_user_id") or "").strip()
+        ts_str = r.get("timestamp") or ""
+        if not a or not b or not ts_str:
+            continue
+        ca = codes.get(a)
+        if ca is None:
+            ca = codes[a] = len(names)
+            names.append(a)
+        cb = codes.get(b)
+        if cb is None:
+            cb = codes[b] = len(names)
+            names.append(b)
+        cu.append(ca)
+        cv.append(cb)
+        ts_list.append(ts_str)
+    if not ts_list:
+        return []
+
+    us, off, aware, valid = parse_timestamps(ts_list)
+    u = np.asarray(cu, dtype=np.int64)
+    v = np.asarray(cv, dtype=np.int64)
+    if not valid.all():
+        u, v, us, off, aware = u[valid], v[valid], us[valid], off[valid], aware[valid]
+    return build_blocks(u, v, us, off, aware, names, gap_minutes, transitive_window_seconds)
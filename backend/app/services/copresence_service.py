@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+接触ブロックから、キャラクター × キャラクターの「同じグループにいた秒数」行列を作る。
+
+ブロック（圧縮済みなら segments の1区間ずつ）とグループを、ID を整数に置き換えた平らな配列にしておき、
+問い合わせごとに区間 [from, to] で秒数を切り詰めてから、グループ内の全ペア (i, j) について
+np.bincount で i * N + j に秒数を足し込む。対角成分はそのキャラクターが誰かと一緒にいた秒数。
+"""
+from typing import Any
+
+import numpy as np
+
+from app.services.contact_index_service import parse_time
+
+
+class CopresenceMatrix:
+    """タイムラインを (区間, グループ, メンバー) の配列にしたもの。ids[i] が行・列 i のキャラクター。"""
+
+    def __init__(self, timeline: list[dict[str, Any]]) -> None:
+        ids = sorted({cid for block in timeline for group in block["groups"] for cid in group})
+        code = {cid: i for i, cid in enumerate(ids)}
+        starts: list[float] = []
+        ends: list[float] = []
+        group_piece: list[int] = []
+        group_size: list[int] = []
+        members: list[int] = []
+        for block in timeline:
+            for start, end in block.get("segments") or [[block["start"], block["end"]]]:
+                piece = len(starts)
+                starts.append(parse_time(start))
+                ends.append(parse_time(end))
+                for group in block["groups"]:
+                    group_piece.append(piece)
+                    group_size.append(len(group))
+                    members.extend(code[cid] for cid in group)
+        self.ids = ids
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.group_piece = np.asarray(group_piece, dtype=np.int64)
+        self.group_size = np.asarray(group_size, dtype=np.int64)
+        self.group_offset = np.cumsum(self.group_size) - self.group_size
+        self.members = np.asarray(members, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def compute(self, t_from: float | None = None, t_to: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        [t_from, t_to] の (秒数行列, ブロック数行列)。どちらも N × N で対称。
+        区間と重なるブロックだけを数え、秒数は区間内に入る分だけ。
+        """
+        n = len(self.ids)
+        lo = self.starts if t_from is None else np.maximum(self.starts, t_from)
+        hi = self.ends if t_to is None else np.minimum(self.ends, t_to)
+        weight = np.maximum(hi - lo, 0.0)
+        hit = np.ones(len(self.starts), dtype=bool)
+        if t_from is not None:
+            hit &= self.ends >= t_from
+        if t_to is not None:
+            hit &= self.starts <= t_to
+
+        selected = hit[self.group_piece]
+        size = self.group_size[selected]
+        offset = self.group_offset[selected]
+        pairs = size * size
+        total = int(pairs.sum())
+        # グループ g の k 人から k * k 個の (i, j) を作る: 通し番号 - グループの先頭 を k で割った商と余り
+        k = np.repeat(size, pairs)
+        local = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(pairs) - pairs, pairs)
+        base = np.repeat(offset, pairs)
+        left = self.members[base + local // k]
+        right = self.members[base + local % k]
+        cell = left * n + right
+        seconds = np.bincount(cell, weights=np.repeat(weight[self.group_piece[selected]], pairs), minlength=n * n)
+        blocks = np.bincount(cell, minlength=n * n)
+        return seconds.astype(np.float64).reshape(n, n), blocks.reshape(n, n)
+
+
+def relation_strength(seconds: np.ndarray, blocks: np.ndarray) -> np.ndarray:
+    """
+    一緒にいた秒数 ÷ 2人のうち短い方の在席秒数（重なり係数, 0〜1）。
+    在席秒数が 0（接触1回だけのブロックしかない）ならブロック数で同じ比を取る。
+    """
+    presence = np.diag(seconds)
+    presence_blocks = np.diag(blocks).astype(np.float64)
+    by_seconds = np.minimum.outer(presence, presence)
+    by_blocks = np.minimum.outer(presence_blocks, presence_blocks)
+    strength = np.zeros(seconds.shape, dtype=np.float64)
+    np.divide(seconds, by_seconds, out=strength, where=by_seconds > 0)
+    fallback = (by_seconds <= 0) & (by_blocks > 0)
+    np.divide(blocks, by_blocks, out=strength, where=fallback)
+    return np.clip(strength, 0.0, 1.0)
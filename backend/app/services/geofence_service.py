@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+場所のジオフェンス（円）の空間インデックス。
+
+緯度経度を、ジオフェンス中心の平均緯度まわりの正距円筒図法でメートル座標 (x, y) にし、
+一辺 cell_m（= 最大半径）の格子に分けて、各ジオフェンスを中心のセルに入れておく。
+点を含みうるジオフェンスは点のセルと周り8セルにしかないので、1点の割り当ては O(近くのジオフェンス数)。
+"""
+import math
+from typing import Iterable
+
+from app.models import Location
+
+# 緯度1度あたりのメートル（赤道〜中緯度の平均）
+METERS_PER_DEG_LAT = 110_540.0
+# 経度1度あたりのメートル（赤道上。cos(緯度) を掛けて使う）
+METERS_PER_DEG_LNG = 111_320.0
+
+
+class GeofenceIndex:
+    """Location.geofence を持つ場所の格子インデックス。"""
+
+    def __init__(self, locations: Iterable[Location]) -> None:
+        fences = [(loc.id, loc.geofence) for loc in locations if loc.geofence is not None]
+        self.size = len(fences)
+        self.cells: dict[tuple[int, int], list[tuple[str, float, float, float]]] = {}
+        if not fences:
+            self.lng_scale = METERS_PER_DEG_LNG
+            self.cell_m = 1.0
+            return
+        lat0 = sum(f.lat for _, f in fences) / len(fences)
+        self.lng_scale = METERS_PER_DEG_LNG * math.cos(math.radians(lat0))
+        self.cell_m = max(f.radius_m for _, f in fences)
+        for location_id, f in fences:
+            x, y = self.project(f.lat, f.lng)
+            self.cells.setdefault(self._cell(x, y), []).append((location_id, x, y, f.radius_m))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def project(self, lat: float, lng: float) -> tuple[float, float]:
+        return lng * self.lng_scale, lat * METERS_PER_DEG_LAT
+
+    def _cell(self, x: float, y: float) -> tuple[int, int]:
+        return int(x // self.cell_m), int(y // self.cell_m)
+
+    def locate(self, lat: float, lng: float) -> tuple[str, float, float] | None:
+        """
+        (lat, lng) を含むジオフェンスの (location_id, 中心からの距離 m, 半径 m)。
+        複数に含まれるなら距離 / 半径が最小のもの。どこにも含まれなければ None。
+        """
+        if not self.cells:
+            return None
+        x, y = self.project(lat, lng)
+        cx, cy = self._cell(x, y)
+        best: tuple[str, float, float] | None = None
+        best_ratio = 1.0
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for location_id, fx, fy, radius in self.cells.get((cx + dx, cy + dy), ()):
+                    distance = math.hypot(x - fx, y - fy)
+                    if distance <= radius and (best is None or distance / radius < best_ratio):
+                        best = (location_id, distance, radius)
+                        best_ratio = distance / radius
+        return best
@@ -0,0 +1,764 @@
+# -*- coding: utf-8 -*-
+"""
+グラフ（証拠・秘密・場所・人物ノードとエッジ）用のインデックス。
+api/graph.py のノード・エッジ変更時に増分更新し、毎回の全体再計算を避ける。
+"""
+from collections import deque
+from typing import Any, Callable, Iterable
+
+# 整列レイアウトの寸法（instruction.md 3.3）
+NODE_W = 180
+NODE_H = 90
+LAYOUT_GAP = 40
+# イベントグループ枠（GraphTab の toRFNodes と同じ寸法）
+GROUP_PADDING = 20
+GROUP_HEADER = 60
+GROUP_CHILD_W = 150
+GROUP_CHILD_H = 80
+GROUP_CHILD_GAP = 10
+
+
+class ConnectedComponents:
+    """
+    無向グラフの連結成分（ロジック）を増分で保持する。
+
+    頂点は内部の成分番号を持ち、成分番号 -> ラベル（logic_0, logic_1, ...）は別に持つ。
+    併合・分割で頂点を付け替えるのは小さい側だけで、どちらの成分がどのラベルを名乗るかは番号と無関係に決める。
+    - 辺追加: 小さい成分を大きい成分へ併合。残すラベルは keep(ラベル) が真のもの（ロジックエンティティがある）、
+      どちらも同じなら古い（番号の小さい）ラベル。
+    - 辺削除: 両端から交互に BFS し、先に探索し尽くした側を新しい成分として切り出す。
+      まだつながっていれば相手側の探索済み集合に到達した時点で打ち切る。
+      元のラベルは anchor(ラベル)（ロジックの init_node_id）を含む側、なければ大きい側に残す。
+    - そのため辺を消して同じ辺を足し直すと、元のラベルに戻る。
+    """
+
+    def __init__(
+        self,
+        prefix: str = "logic_",
+        keep: Callable[[str], bool] | None = None,
+        anchor: Callable[[str], str | None] | None = None,
+    ):
+        self._prefix = prefix
+        self._keep = keep or (lambda label: False)
+        self._anchor = anchor or (lambda label: None)
+        self._adj: dict[str, dict[str, int]] = {}  # 隣接頂点 -> 多重度
+        self._comp: dict[str, int] = {}  # 頂点 -> 成分番号
+        self._comp_members: dict[int, set[str]] = {}
+        self._name: dict[int, str] = {}  # 成分番号 -> ラベル
+        self._by_name: dict[str, int] = {}
+        self._counter = 0
+        self._next_comp = 0
+
+    def _new_label(self) -> str:
+        label = f"{self._prefix}{self._counter}"
+        self._counter += 1
+        return label
+
+    def _new_comp(self, members: set[str], label: str) -> int:
+        c = self._next_comp
+        self._next_comp += 1
+        for x in members:
+            self._comp[x] = c
+        self._comp_members[c] = members
+        self._name[c] = label
+        self._by_name[label] = c
+        return c
+
+    def _label_age(self, label: str) -> tuple[int, str]:
+        num = label[len(self._prefix):]
+        return (int(num), label) if num.isdigit() else (-1, label)
+
+    def build(self, vertices: Iterable[str], edges: Iterable[tuple[str, str]]) -> None:
+        """全体を作り直す。ラベルは vertices の順に最初に現れた成分から振る。"""
+        self._adj = {}
+        self._comp = {}
+        self._comp_members = {}
+        self._name = {}
+        self._by_name = {}
+        self._counter = 0
+        order = list(vertices)
+        for v in order:
+            self._adj.setdefault(v, {})
+        for u, v in edges:
+            self._link(u, v)
+        for start in list(order) + list(self._adj.keys()):
+            if start in self._comp:
+                continue
+            comp = {start}
+            queue = deque([start])
+            while queue:
+                x = queue.popleft()
+                for w in self._adj[x]:
+                    if w not in comp:
+                        comp.add(w)
+                        queue.append(w)
+            self._new_comp(comp, self._new_label())
+
+    def _link(self, u: str, v: str) -> None:
+        adj_u = self._adj.setdefault(u, {})
+        adj_v = self._adj.setdefault(v, {})
+        adj_u[v] = adj_u.get(v, 0) + 1
+        if u != v:
+            adj_v[u] = adj_v.get(u, 0) + 1
+
+    def __contains__(self, v: str) -> bool:
+        return v in self._comp
+
+    def label_of(self, v: str) -> str | None:
+        c = self._comp.get(v)
+        return None if c is None else self._name[c]
+
+    def members(self, label: str) -> set[str]:
+        c = self._by_name.get(label)
+        return set() if c is None else self._comp_members[c]
+
+    def labels(self) -> Iterable[str]:
+        return self._by_name.keys()
+
+    def add_vertex(self, v: str) -> None:
+        if v in self._comp:
+            return
+        self._adj[v] = {}
+        self._new_comp({v}, self._new_label())
+
+    def remove_vertex(self, v: str) -> None:
+        """孤立した頂点のみ削除する（辺が残っている頂点はそのまま）。"""
+        if v not in self._comp or self._adj[v]:
+            return
+        c = self._comp.pop(v)
+        del self._adj[v]
+        comp = self._comp_members[c]
+        comp.discard(v)
+        if not comp:
+            del self._comp_members[c]
+            del self._by_name[self._name.pop(c)]
+
+    def add_edge(self, u: str, v: str) -> None:
+        self.add_vertex(u)
+        self.add_vertex(v)
+        self._link(u, v)
+        cu, cv = self._comp[u], self._comp[v]
+        if cu == cv:
+            return
+        lu, lv = self._name[cu], self._name[cv]
+        kept = min((lu, lv), key=lambda label: (not self._keep(label), self._label_age(label)))
+        if len(self._comp_members[cu]) < len(self._comp_members[cv]):
+            cu, cv = cv, cu
+        small = self._comp_members.pop(cv)
+        for x in small:
+            self._comp[x] = cu
+        self._comp_members[cu] |= small
+        del self._by_name[self._name.pop(cv)]
+        del self._by_name[self._name[cu]]
+        self._name[cu] = kept
+        self._by_name[kept] = cu
+
+    def remove_edge(self, u: str, v: str) -> None:
+        adj_u = self._adj.get(u)
+        if adj_u is None or v not in adj_u:
+            return
+        adj_u[v] -= 1
+        if u == v:
+            if adj_u[v] == 0:
+                del adj_u[v]
+            return
+        self._adj[v][u] -= 1
+        if adj_u[v] > 0:
+            return  # 多重辺が残っている
+        del adj_u[v]
+        del self._adj[v][u]
+        self._split_if_disconnected(u, v)
+
+    def _split_if_disconnected(self, u: str, v: str) -> None:
+        seen = ({u}, {v})
+        queues = (deque([u]), deque([v]))
+        while True:
+            for i in (0, 1):
+                mine, other, queue = seen[i], seen[1 - i], queues[i]
+                if not queue:
+                    # こちら側を探索し尽くした → 相手に届かないので分離
+                    c = self._comp[u]
+                    old = self._name[c]
+                    self._comp_members[c] -= mine
+                    rest = self._comp_members[c]
+                    anchor = self._anchor(old)
+                    if anchor in mine or (anchor not in rest and len(mine) > len(rest)):
+                        # 切り出した側が元のラベルを名乗る
+                        self._name[c] = self._new_label()
+                        self._by_name[self._name[c]] = c
+                        self._new_comp(mine, old)
+                    else:
+                        self._new_comp(mine, self._new_label())
+                    return
+                x = queue.popleft()
+                for w in self._adj[x]:
+                    if w in other:
+                        return
+                    if w not in mine:
+                        mine.add(w)
+                        queue.append(w)
+
+
+class EdgeIndex:
+    """node_id -> 入/出エッジID の隣接インデックス。ノードの接続辺を O(次数) で引く。"""
+
+    def __init__(self):
+        self._out: dict[str, set[str]] = {}
+        self._in: dict[str, set[str]] = {}
+
+    def build(self, edges: Iterable[tuple[str, str, str]]) -> None:
+        """(edge_id, source_node_id, target_node_id) の列から作り直す。"""
+        self._out = {}
+        self._in = {}
+        for edge_id, source, target in edges:
+            self.add(edge_id, source, target)
+
+    def add(self, edge_id: str, source: str, target: str) -> None:
+        self._out.setdefault(source, set()).add(edge_id)
+        self._in.setdefault(target, set()).add(edge_id)
+
+    def remove(self, edge_id: str, source: str, target: str) -> None:
+        out = self._out.get(source)
+        if out is not None:
+            out.discard(edge_id)
+            if not out:
+                del self._out[source]
+        inc = self._in.get(target)
+        if inc is not None:
+            inc.discard(edge_id)
+            if not inc:
+                del self._in[target]
+
+    def outgoing(self, node_id: str) -> set[str]:
+        return self._out.get(node_id, set())
+
+    def incoming(self, node_id: str) -> set[str]:
+        return self._in.get(node_id, set())
+
+    def incident(self, node_id: str) -> set[str]:
+        return self.outgoing(node_id) | self.incoming(node_id)
+
+
+def event_group_size(n_children: int) -> tuple[int, int]:
+    """イベントグループ枠の (幅, 高さ)。子ノードは3列グリッド。"""
+    cols = min(3, n_children)
+    rows = -(-n_children // 3)
+    width = max(300, GROUP_PADDING * 2 + cols * GROUP_CHILD_W + max(cols - 1, 0) * GROUP_CHILD_GAP)
+    height = max(200, GROUP_HEADER + GROUP_PADDING + rows * GROUP_CHILD_H + max(rows - 1, 0) * GROUP_CHILD_GAP)
+    return width, height
+
+
+def event_group_child_position(idx: int) -> tuple[int, int]:
+    """イベントグループ内 idx 番目の子ノードの枠内座標。"""
+    return (
+        GROUP_PADDING + (idx % 3) * (GROUP_CHILD_W + GROUP_CHILD_GAP),
+        GROUP_HEADER + GROUP_PADDING + (idx // 3) * (GROUP_CHILD_H + GROUP_CHILD_GAP),
+    )
+
+
+def hierarchical_layout(
+    units: list[str],
+    edges: Iterable[tuple[str, str]],
+    sizes: dict[str, tuple[int, int]],
+    root: str | None = None,
+) -> tuple[dict[str, tuple[int, int]], int, int]:
+    """
+    1ロジック分の階層レイアウト。
+
+    - 入エッジのないユニット（root 指定時はそれを先頭）をレベル0とし、エッジに沿って BFS でレベルを決める。
+      どこからも辿れないユニット（閉路のみの部分）は新たな起点としてレベル0から辿る。
+    - 各レベルで出次数 > 1 の分岐ユニットは列0に縦に並べ、それ以外はその右側に横に並べる。
+    - sizes にないユニットは NODE_W x NODE_H として扱う。
+
+    返り値: (ユニット -> (x, y), 全体の幅, 全体の高さ)
+    """
+    out_adj: dict[str, list[str]] = {u: [] for u in units}
+    in_deg: dict[str, int] = {u: 0 for u in units}
+    for a, b in edges:
+        if a == b or a not in out_adj or b not in in_deg:
+            continue
+        out_adj[a].append(b)
+        in_deg[b] += 1
+
+    level: dict[str, int] = {}
+    starts = [root] if root in out_adj else []
+    starts += [u for u in units if in_deg[u] == 0 and u != root]
+    starts += units  # 未到達分の起点候補
+    for start in starts:
+        if start in level:
+            continue
+        level[start] = 0
+        queue = deque([start])
+        while queue:
+            x = queue.popleft()
+            for w in out_adj[x]:
+                if w not in level:
+                    level[w] = level[x] + 1
+                    queue.append(w)
+
+    by_level: dict[int, list[str]] = {}
+    for u in units:
+        by_level.setdefault(level[u], []).append(u)
+
+    positions: dict[str, tuple[int, int]] = {}
+    width = 0
+    y = 0
+    for lv in sorted(by_level):
+        row = by_level[lv]
+        branches = [u for u in row if len(out_adj[u]) > 1]
+        others = [u for u in row if len(out_adj[u]) <= 1]
+        by = y
+        col0_w = 0
+        for u in branches:
+            w, h = sizes.get(u, (NODE_W, NODE_H))
+            positions[u] = (0, by)
+            by += h + LAYOUT_GAP
+            col0_w = max(col0_w, w)
+        level_h = by - y
+        x = col0_w + LAYOUT_GAP if branches else 0
+        for u in others:
+            w, h = sizes.get(u, (NODE_W, NODE_H))
+            positions[u] = (x, y)
+            x += w + LAYOUT_GAP
+            level_h = max(level_h, h + LAYOUT_GAP)
+        width = max(width, x - LAYOUT_GAP if others else col0_w)
+        y += level_h
+    return positions, width, max(y - LAYOUT_GAP, 0)
+
+
+def strongly_connected_components(vertices: Iterable[str], succ: dict[str, Iterable[str]]) -> list[list[str]]:
+    """
+    反復版 Tarjan 法による強連結成分分解（再帰上限に当たらない）。
+    succ にない頂点・vertices 外への辺は無視する。
+    返り値はトポロジカル順の逆（シンク側の成分が先）。
+    """
+    vertex_set = set(vertices)
+    index: dict[str, int] = {}
+    low: dict[str, int] = {}
+    on_stack: set[str] = set()
+    stack: list[str] = []
+    result: list[list[str]] = []
+    counter = 0
+
+    for root in vertex_set:
+        if root in index:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(succ.get(root, ())))]
+        while work:
+            v, it = work[-1]
+            advanced = False
+            for w in it:
+                if w not in vertex_set:
+                    continue
+                if w not in index:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(succ.get(w, ()))))
+                    advanced = True
+                    break
+                if w in on_stack:
+                    low[v] = min(low[v], index[w])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[v])
+            if low[v] == index[v]:
+                comp = []
+                while True:
+                    w = stack.pop()
+                    on_stack.discard(w)
+                    comp.append(w)
+                    if w == v:
+                        break
+                result.append(comp)
+    return result
+
+
+class ReachabilityIndex:
+    """
+    起点ノード（証拠ノード）から有向辺で到達できるかの索引。
+    各頂点に「そこへ到達する起点」のビット集合（int）を持つ＝起点からの推移閉包。
+
+    - 辺・起点の追加: 新しく届いたビットだけを前方へ伝播する。
+    - 辺・起点の削除: 影響を受ける下流（削除辺の終点から到達できる頂点）だけを、
+      その部分グラフを強連結成分で縮約した DAG 上でトポロジカル順に再計算する。
+    """
+
+    def __init__(self):
+        self._succ: dict[str, dict[str, int]] = {}  # 後続頂点 -> 多重度
+        self._pred: dict[str, dict[str, int]] = {}
+        self._sources: set[str] = set()
+        self._bit: dict[str, int] = {}  # 起点 -> ビット位置
+        self._bit_owner: list[str | None] = []
+        self._free_bits: list[int] = []
+        self._reach: dict[str, int] = {}
+
+    def build(self, sources: Iterable[str], edges: Iterable[tuple[str, str]]) -> None:
+        self._succ, self._pred, self._reach = {}, {}, {}
+        self._sources, self._bit = set(), {}
+        self._bit_owner, self._free_bits = [], []
+        for u, v in edges:
+            self._link(u, v)
+        for s in sources:
+            self._vertex(s)
+            self._sources.add(s)
+            self._assign_bit(s)
+        self._recompute(set(self._succ))
+
+    def _vertex(self, v: str) -> None:
+        if v not in self._succ:
+            self._succ[v] = {}
+            self._pred[v] = {}
+            self._reach[v] = 0
+
+    def _link(self, u: str, v: str) -> bool:
+        """辺を追加し、新しい隣接関係なら True。"""
+        self._vertex(u)
+        self._vertex(v)
+        count = self._succ[u].get(v, 0)
+        self._succ[u][v] = count + 1
+        self._pred[v][u] = count + 1
+        return count == 0
+
+    def _assign_bit(self, s: str) -> int:
+        bit = self._free_bits.pop() if self._free_bits else len(self._bit_owner)
+        if bit == len(self._bit_owner):
+            self._bit_owner.append(s)
+        else:
+            self._bit_owner[bit] = s
+        self._bit[s] = bit
+        return bit
+
+    def _own(self, v: str) -> int:
+        return 1 << self._bit[v] if v in self._sources else 0
+
+    def _propagate(self, start: str, bits: int) -> None:
+        work = [(start, bits)]
+        while work:
+            x, b = work.pop()
+            missing = b & ~self._reach[x]
+            if not missing:
+                continue
+            self._reach[x] |= missing
+            for w in self._succ[x]:
+                work.append((w, missing))
+
+    def _descendants(self, start: str) -> set[str]:
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            x = queue.popleft()
+            for w in self._succ[x]:
+                if w not in seen:
+                    seen.add(w)
+                    queue.append(w)
+        return seen
+
+    def _recompute(self, region: set[str]) -> None:
+        for comp in reversed(strongly_connected_components(region, self._succ)):
+            members = set(comp)
+            bits = 0
+            for x in comp:
+                bits |= self._own(x)
+                for p in self._pred[x]:
+                    if p not in members:
+                        bits |= self._reach[p]
+            for x in comp:
+                self._reach[x] = bits
+
+    def set_source(self, v: str, is_source: bool) -> None:
+        self._vertex(v)
+        if is_source == (v in self._sources):
+            return
+        if is_source:
+            self._sources.add(v)
+            self._propagate(v, 1 << self._assign_bit(v))
+        else:
+            self._sources.discard(v)
+            bit = self._bit.pop(v)
+            self._recompute(self._descendants(v))
+            self._bit_owner[bit] = None
+            self._free_bits.append(bit)
+
+    def add_edge(self, u: str, v: str) -> None:
+        if self._link(u, v):
+            self._propagate(v, self._reach[u])
+
+    def remove_edge(self, u: str, v: str) -> None:
+        count = self._succ.get(u, {}).get(v, 0)
+        if count == 0:
+            return
+        if count > 1:
+            self._succ[u][v] = count - 1
+            self._pred[v][u] = count - 1
+            return
+        del self._succ[u][v]
+        del self._pred[v][u]
+        self._recompute(self._descendants(v))
+
+    def is_reached(self, v: str) -> bool:
+        return bool(self._reach.get(v, 0))
+
+    def sources_reaching(self, v: str) -> list[str]:
+        bits = self._reach.get(v, 0)
+        result = []
+        while bits:
+            low = bits & -bits
+            owner = self._bit_owner[low.bit_length() - 1]
+            if owner is not None:
+                result.append(owner)
+            bits ^= low
+        return result
+
+
+class DerivationIndex:
+    """
+    公開フェーズ付きの前向き推論（不動点）を増分で保持する。
+
+    事実は頂点ごとに「成り立つ最も早いフェーズ」で持つ。フェーズは比較可能な値で、小さいほど早い。
+      - established(v): 起点（公開された証拠）は自身の公開フェーズで成立。
+        established(u) かつ u -[derive]-> v なら established(v)（u と同じフェーズ）。
+      - refuted(v): established(u) かつ u -[refute]-> v なら成立。
+    全フェーズ分を1つの不動点にまとめているので、各フェーズの結果は比較だけで読める。
+
+    追加（辺・起点・フェーズの前倒し）は値が下がった頂点だけを伝播する semi-naive 評価。
+    削除・フェーズの後退は、影響しうる下流だけを取り消して再導出する（DRed）。
+    """
+
+    DERIVE = "derive"
+    REFUTE = "refute"
+
+    def __init__(self):
+        self._succ: dict[str, dict[str, dict[str, int]]] = {self.DERIVE: {}, self.REFUTE: {}}
+        self._pred: dict[str, dict[str, dict[str, int]]] = {self.DERIVE: {}, self.REFUTE: {}}
+        self._base: dict[str, Any] = {}
+        self._est: dict[str, Any] = {}
+        self._ref: dict[str, Any] = {}
+
+    def build(self, edges: Iterable[tuple[str, str, str]]) -> None:
+        """(source, target, kind) の列から作り直す。起点は set_base で改めて与える。"""
+        self._succ = {self.DERIVE: {}, self.REFUTE: {}}
+        self._pred = {self.DERIVE: {}, self.REFUTE: {}}
+        self._base, self._est, self._ref = {}, {}, {}
+        for u, v, kind in edges:
+            self._link(u, v, kind, 1)
+
+    def _link(self, u: str, v: str, kind: str, delta: int) -> int:
+        succ = self._succ[kind].setdefault(u, {})
+        pred = self._pred[kind].setdefault(v, {})
+        count = succ.get(v, 0) + delta
+        if count > 0:
+            succ[v] = count
+            pred[u] = count
+        else:
+            succ.pop(v, None)
+            pred.pop(u, None)
+        return count
+
+    def sources(self) -> list[str]:
+        return list(self._base)
+
+    def established(self, v: str) -> Any:
+        return self._est.get(v)
+
+    def refuted(self, v: str) -> Any:
+        return self._ref.get(v)
+
+    def _propagate(self, changed: Iterable[str]) -> None:
+        work = list(changed)
+        while work:
+            u = work.pop()
+            phase = self._est[u]
+            for w in self._succ[self.REFUTE].get(u, ()):
+                if w not in self._ref or phase < self._ref[w]:
+                    self._ref[w] = phase
+            for w in self._succ[self.DERIVE].get(u, ()):
+                if w not in self._est or phase < self._est[w]:
+                    self._est[w] = phase
+                    work.append(w)
+
+    def _lower(self, v: str, phase: Any) -> None:
+        if v not in self._est or phase < self._est[v]:
+            self._est[v] = phase
+            self._propagate([v])
+
+    def _descendants(self, start: str) -> set[str]:
+        succ = self._succ[self.DERIVE]
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            x = queue.popleft()
+            for w in succ.get(x, ()):
+                if w not in seen:
+                    seen.add(w)
+                    queue.append(w)
+        return seen
+
+    def _rederive(self, region: set[str]) -> None:
+        preds = self._pred[self.DERIVE]
+        for x in region:
+            self._est.pop(x, None)
+        seeds = []
+        for x in region:
+            best = self._base.get(x)
+            for p in preds.get(x, ()):
+                if p not in region and p in self._est and (best is None or self._est[p] < best):
+                    best = self._est[p]
+            if best is not None:
+                self._est[x] = best
+                seeds.append(x)
+        self._propagate(seeds)
+        refute = self._succ[self.REFUTE]
+        self._recompute_refuted({w for x in region for w in refute.get(x, ())})
+
+    def _recompute_refuted(self, targets: Iterable[str]) -> None:
+        preds = self._pred[self.REFUTE]
+        for w in targets:
+            phases = [self._est[p] for p in preds.get(w, ()) if p in self._est]
+            if phases:
+                self._ref[w] = min(phases)
+            else:
+                self._ref.pop(w, None)
+
+    def set_base(self, v: str, phase: Any) -> None:
+        """起点 v の公開フェーズを設定する。None で起点から外す。"""
+        old = self._base.get(v)
+        if phase == old:
+            return
+        if phase is None:
+            del self._base[v]
+        else:
+            self._base[v] = phase
+        if phase is not None and (old is None or phase < old):
+            self._lower(v, phase)
+        else:
+            self._rederive(self._descendants(v))
+
+    def add_edge(self, u: str, v: str, kind: str) -> None:
+        self._link(u, v, kind, 1)
+        if u not in self._est:
+            return
+        if kind == self.DERIVE:
+            self._lower(v, self._est[u])
+        elif v not in self._ref or self._est[u] < self._ref[v]:
+            self._ref[v] = self._est[u]
+
+    def remove_edge(self, u: str, v: str, kind: str) -> None:
+        if v not in self._succ[kind].get(u, {}):
+            return
+        if self._link(u, v, kind, -1) > 0:
+            return
+        if kind == self.DERIVE:
+            self._rederive(self._descendants(v))
+        else:
+            self._recompute_refuted([v])
+
+
+def _bfs_path(succ: dict[str, list[str]], start: str, goal: str, allowed: set[str] | None = None) -> list[str]:
+    """start から goal への最短路（頂点列）。start == goal なら [start]。届かなければ []。"""
+    if start == goal:
+        return [start]
+    parent: dict[str, str] = {start: start}
+    queue = deque([start])
+    while queue:
+        x = queue.popleft()
+        for w in succ.get(x, ()):
+            if w in parent or (allowed is not None and w not in allowed):
+                continue
+            parent[w] = x
+            if w == goal:
+                path = [w]
+                while path[-1] != start:
+                    path.append(parent[path[-1]])
+                return path[::-1]
+            queue.append(w)
+    return []
+
+
+def find_contradictions(
+    derive_succ: dict[str, list[str]],
+    refutes: Iterable[tuple[str, str, str]],
+    contradicts: Iterable[tuple[str, str, str]],
+) -> dict[str, list[dict[str, Any]]]:
+    """
+    推論グラフの矛盾・循環を検出し、問題のあるパスを証拠（witness）として返す。
+
+    - derive_succ: supports / implies / rule_applies の隣接（u -> [v, ...]）
+    - refutes / contradicts: (edge_id, source, target)
+
+    derive 辺で強連結成分分解し、縮約 DAG 上で各成分の祖先集合（自身を含む）をビット集合で持つ。
+      - support_refute: ある X が a にも y にも derive で到達し、a -refutes-> y がある
+        （X は y を支持しつつ否定している）。a と y の祖先集合の共通部分で判定。
+      - contradicts_in_cycle: contradicts 辺の両端が同じ強連結成分（互いに導き合う）にある。
+      - cycle: 2頂点以上の強連結成分、または自己ループ（循環論法）。
+    """
+    refutes = list(refutes)
+    contradicts = list(contradicts)
+    vertices: set[str] = set(derive_succ)
+    for targets in derive_succ.values():
+        vertices.update(targets)
+    for _, a, b in refutes + contradicts:
+        vertices.add(a)
+        vertices.add(b)
+
+    comps = strongly_connected_components(vertices, derive_succ)
+    comps.reverse()  # トポロジカル順
+    comp_of: dict[str, int] = {}
+    for i, comp in enumerate(comps):
+        for v in comp:
+            comp_of[v] = i
+    ancestors = [1 << i for i in range(len(comps))]
+    for i, comp in enumerate(comps):
+        for v in comp:
+            for w in derive_succ.get(v, ()):
+                j = comp_of[w]
+                if j != i:
+                    ancestors[j] |= ancestors[i]
+
+    result: dict[str, list[dict[str, Any]]] = {"support_refute": [], "contradicts_in_cycle": [], "cycle": []}
+
+    for edge_id, a, y in refutes:
+        common = ancestors[comp_of[a]] & ancestors[comp_of[y]]
+        if not common:
+            continue
+        # トポロジカル順で最も後ろ（a, y に最も近い）共通祖先を選ぶとパスが短い
+        x = comps[common.bit_length() - 1][0]
+        result["support_refute"].append({
+            "edge_id": edge_id,
+            "node_id": x,
+            "target_node_id": y,
+            "support_path": _bfs_path(derive_succ, x, y),
+            "refute_path": _bfs_path(derive_succ, x, a) + [y],
+        })
+
+    for edge_id, a, b in contradicts:
+        if a == b or comp_of[a] != comp_of[b]:
+            continue
+        members = set(comps[comp_of[a]])
+        result["contradicts_in_cycle"].append({
+            "edge_id": edge_id,
+            "source_node_id": a,
+            "target_node_id": b,
+            "path": _bfs_path(derive_succ, a, b, members) + _bfs_path(derive_succ, b, a, members)[1:],
+        })
+
+    for comp in comps:
+        v = comp[0]
+        if len(comp) > 1:
+            members = set(comp)
+            w = next(w for w in derive_succ.get(v, ()) if w in members)
+            path = [v] + _bfs_path(derive_succ, w, v, members)
+        elif v in derive_succ.get(v, ()):
+            path = [v, v]
+        else:
+            continue
+        result["cycle"].append({"node_ids": sorted(comp), "path": path})
+    return result
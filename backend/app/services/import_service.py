@@ -3,13 +3,48 @@
 Bluetooth接触ログの取り込み。
 位置情報は無視。user / contacted_user がその時間一緒にいた log として扱う。
 """
+import codecs
 import csv
+import heapq
 import io
+import logging
+import math
+import os
+import shutil
+import tarfile
+import time
+import zipfile
 from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import Any
+from datetime import datetime, timedelta, timezone
+from operator import itemgetter
+from typing import Any, BinaryIO, Iterable, Iterator
 
-from app.models import Character, CharacterRole
+import numpy as np
+
+from app.config import get_settings
+from app.models import (
+    Character,
+    CharacterRole,
+    CharacterTimeline,
+    Location,
+    Observations,
+    PresenceObservation,
+    TimeBlock,
+    TimeRange,
+)
+from app.services.geofence_service import GeofenceIndex
+
+logger = logging.getLogger(__name__)
+
+# ストリーミング取り込みで一度に読むバイト数
+CHUNK_SIZE = 1 << 20
+# 空き時間がこの分数以上なら新区間。1分にするとこのCSVは1枠のままなので 0.5（30秒）で分割。
+CONTACT_GAP_MINUTES = 0.5
+# 接触1回で前後この秒数は一緒にいたとみなす（時点ごとの連結判定用。transitive_window_seconds の半分）
+CONTACT_HOLD_SECONDS = 5.0
+# GPS: 同じ場所の測位がこの秒数以内で続く間は1つの滞在。この秒数未満の滞在は通過とみなして捨てる
+GPS_MAX_GAP_SECONDS = 120.0
+GPS_MIN_DWELL_SECONDS = 60.0
 
 
 def _connected_components(edges: list[tuple[str, str]]) -> list[frozenset[str]]:
@@ -45,10 +80,140 @@ def _connected_components(edges: list[tuple[str, str]]) -> list[frozenset[str]]:
     return components
 
 
+def _parse_contact_row(r: dict[str, Any]) -> tuple[str, str, datetime] | None:
+    """接触行 → (u, v, 時刻)。ID 欠落・時刻不正の行は None。"""
+    u = (r.get("user_id") or "").strip()
+    v = (r.get("contacted_user_id") or "").strip()
+    ts_str = r.get("timestamp") or ""
+    if not u or not v or not ts_str:
+        return None
+    try:
+        return u, v, datetime.fromisoformat(ts_str.replace("Z", "+00:00"))
+    except (ValueError, TypeError):
+        return None
+
+
+class ContactTimelineBuilder:
+    """
+    接触 (u, v, 時刻) を1件ずつ受け取り、build_contact_timeline と同じブロックを作る。
+
+    ブロックの境目は「時刻順に並べた接触の差 > min(gap_minutes, transitive_window_seconds)」
+    （期間の分割はクラスタの分割にもなるため）。時刻順に来た接触は開いているブロックに足し、
+    差が閾値を超えたらブロックを閉じて blocks に出力する。閉じたブロックの接触行は捨て、
+    開いているブロックのグループは union-find（メンバーだけ）で持つ。
+
+    開いているブロックの開始より前の接触・ブロック（順序の乱れ）だけは取っておき、finish で
+    出力済みのブロック（グループはメンバーを結ぶスターの辺に置き換えても連結成分は同じ）と
+    開始時刻順に合わせてもう一度同じ走査をする。全件を並べ直して作った結果と一致する。
+
+    メモリ: 出力ブロック + 開いているブロックの人数 + 順序の乱れた接触の数。
+    時刻順の CSV（エクスポートの既定）ならファイルの行数によらない。
+    """
+
+    def __init__(self, gap_minutes: float = 1.0, transitive_window_seconds: float = 10.0) -> None:
+        self.threshold = min(timedelta(minutes=gap_minutes), timedelta(seconds=transitive_window_seconds))
+        self.blocks: list[dict[str, Any]] = []
+        # 出力ブロックごとの接触数（add_block で足したブロックの分は数えない）
+        self.row_counts: list[int] = []
+        self._late: list[tuple[datetime, datetime, list[tuple[str, str]], int]] = []
+        self._start: datetime | None = None
+        self._end: datetime | None = None
+        self._parent: dict[str, str] = {}
+        self._rows = 0
+
+    def add(self, u: str, v: str, ts: datetime) -> None:
+        self._add_item(ts, ts, [(u, v)], 1)
+
+    def add_block(self, block: dict[str, Any]) -> None:
+        """
+        できあがったブロック（追記モードの最後のブロック）を、元の接触の代わりに足す（接触数は 0 と数える）。
+        ブロック内の接触の間隔は閾値以下なので、元の接触を全部足した場合と結果は同じ。
+        """
+        self._add_item(
+            datetime.fromisoformat(block["start"]),
+            datetime.fromisoformat(block["end"]),
+            _star_edges(block["groups"]),
+            0,
+        )
+
+    def _add_item(self, start: datetime, end: datetime, edges: list[tuple[str, str]], rows: int) -> None:
+        if self._start is not None and start < self._start:
+            self._late.append((start, end, edges, rows))
+            return
+        self._push(start, end, edges, rows)
+
+    def _find(self, x: str) -> str:
+        parent = self._parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def _push(self, start: datetime, end: datetime, edges: list[tuple[str, str]], rows: int) -> None:
+        if self._start is not None and start - self._end > self.threshold:
+            self._close()
+        if self._start is None:
+            self._start, self._end = start, end
+        elif end > self._end:
+            self._end = end
+        self._rows += rows
+        parent = self._parent
+        for u, v in edges:
+            parent.setdefault(u, u)
+            parent.setdefault(v, v)
+            ru, rv = self._find(u), self._find(v)
+            if ru != rv:
+                parent[rv] = ru
+
+    def _close(self) -> None:
+        if self._start is None:
+            return
+        comps: dict[str, list[str]] = {}
+        for x in self._parent:
+            comps.setdefault(self._find(x), []).append(x)
+        self.blocks.append({
+            "start": self._start.isoformat(),
+            "end": self._end.isoformat(),
+            "groups": sorted(comps.values(), key=lambda g: -len(g)),
+        })
+        self.row_counts.append(self._rows)
+        self._start = self._end = None
+        self._parent = {}
+        self._rows = 0
+
+    def finish(self) -> list[dict[str, Any]]:
+        """開いているブロックを閉じ、順序の乱れた接触があれば合わせ直して、ブロック列を返す。"""
+        self._close()
+        if self._late:
+            late = sorted(self._late, key=itemgetter(0))
+            blocks, counts = self.blocks, self.row_counts
+            self.blocks, self.row_counts, self._late = [], [], []
+            items = heapq.merge(
+                (
+                    (datetime.fromisoformat(b["start"]), datetime.fromisoformat(b["end"]), _star_edges(b["groups"]), n)
+                    for b, n in zip(blocks, counts)
+                ),
+                late,
+                key=itemgetter(0),
+            )
+            for start, end, edges, rows in items:
+                self._push(start, end, edges, rows)
+            self._close()
+        return self.blocks
+
+
+def _star_edges(groups: list[list[str]]) -> list[tuple[str, str]]:
+    """グループ（連結成分）を、先頭のメンバーと他のメンバーを結ぶ辺にする（1人なら自己ループ）。"""
+    return [(g[0], m) for g in groups for m in (g[1:] or g[:1])]
+
+
 def build_contact_timeline(
-    contact_rows: list[dict[str, Any]],
+    contact_rows: Iterable[dict[str, Any]],
     gap_minutes: float = 1.0,
     transitive_window_seconds: float = 10.0,
+    engine: str | None = None,
 ) -> list[dict[str, Any]]:
     """
     接触ログからタイムラインを構築。
@@ -61,97 +226,295 @@ def build_contact_timeline(
     - transitive: クラスタ内では「隣接する接触同士」が高々10秒なので、
       A-B, B-C がともにクラスタ内にあれば A,B,C は同一グループ。
 
+    contact_rows はジェネレータでもよい。
+    engine: "python"（既定）または "numpy"。未指定なら設定 CONTACT_TIMELINE_ENGINE に従う。
+    "python" は ContactTimelineBuilder で1行ずつ処理し、閉じたブロックの行は捨てる（時刻順の入力なら
+    メモリは出力ブロック分）。"numpy" は contact_timeline_np の配列版で、全行を配列にしてから一度に処理する
+    （メモリは行数に比例するが速い）。ブロックとグループの中身はどちらも同じ。
+
     返り値: [ { "start": iso, "end": iso, "groups": [ [id, ...], ... ] }, ... ]
     """
-    if not contact_rows:
-        return []
+    engine = engine or get_settings().contact_timeline_engine
+    if engine == "numpy":
+        from app.services.contact_timeline_np import build_contact_timeline_np
+
+        return build_contact_timeline_np(contact_rows, gap_minutes, transitive_window_seconds)
+    if engine != "python":
+        raise ValueError(f"Unknown contact timeline engine: {engine}")
 
-    sorted_rows: list[tuple[str, str, datetime]] = []
+    builder = ContactTimelineBuilder(gap_minutes, transitive_window_seconds)
     for r in contact_rows:
-        u = (r.get("user_id") or "").strip()
-        v = (r.get("contacted_user_id") or "").strip()
-        ts_str = r.get("timestamp") or ""
-        if not u or not v or not ts_str:
-            continue
-        try:
-            ts = datetime.fromisoformat(ts_str.replace("Z", "+00:00"))
-            sorted_rows.append((u, v, ts))
-        except (ValueError, TypeError):
-            continue
+        edge = _parse_contact_row(r)
+        if edge is not None:
+            builder.add(*edge)
+    return builder.finish()
 
-    if not sorted_rows:
-        return []
 
-    sorted_rows.sort(key=lambda x: x[2])
-    gap_delta = timedelta(minutes=gap_minutes)
-    window_delta = timedelta(seconds=transitive_window_seconds)
+def extend_contact_timeline(
+    timeline: list[dict[str, Any]],
+    contact_rows: Iterable[dict[str, Any]],
+    gap_minutes: float = 1.0,
+    transitive_window_seconds: float = 10.0,
+    engine: str | None = None,
+    stats: dict[str, int] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    追記モード。build_contact_timeline の結果 timeline に新しい接触ログを足す（timeline をその場で更新して返す）。
 
-    # 1. gap_minutes ルールで「期間」に分割
-    periods: list[tuple[datetime, datetime, list[tuple[str, str, datetime]]]] = []
-    period_start: datetime | None = None
-    period_end: datetime | None = None
-    period_edges: list[tuple[str, str, datetime]] = []
+    ブロックは「連続する接触の差 > min(gap_minutes, transitive_window_seconds)」で切れるので、
+    新しい行で変わりうるのは最後のブロック（開いている期間の末尾クラスタ）だけ。
+    - 最後のブロックの start 以降で、その end から閾値以内に連鎖する行 → 最後のブロックに合流し、グループを再計算
+    - それより後の行 → 新しいブロックにして末尾に追加
+    - 最後のブロックの start より前の行 → 確定済みの区間なので取り込まない（stats["late_rows"] に数える）
+    最後のブロックのグループは連結成分なので、メンバーを結ぶ辺（スター）に置き換えても成分は変わらない。
+    そのため元の接触行を保持しなくてよく、コストは新しい行数（＋最後のブロックの人数）に比例する。
+    "python" では最後のブロックを ContactTimelineBuilder の開いているブロックとして続きを流すので、
+    メモリも build_contact_timeline と同じく新しい行数によらない（"numpy" は新しい行を全部持つ）。
+    全体を作り直した結果とブロック・グループの中身は一致する。
+    """
+    engine = engine or get_settings().contact_timeline_engine
+    tail = timeline[-1] if timeline else None
+    tail_start = datetime.fromisoformat(tail["start"]) if tail else None
 
-    for u, v, ts in sorted_rows:
-        if period_start is None:
-            period_start = ts
-            period_end = ts
-            period_edges = [(u, v, ts)]
-            continue
-        if (ts - period_end) > gap_delta:
-            if period_start is not None and period_end is not None:
-                periods.append((period_start, period_end, period_edges))
-            period_start = ts
-            period_end = ts
-            period_edges = [(u, v, ts)]
-        else:
-            period_end = ts
-            period_edges.append((u, v, ts))
+    def fresh() -> Iterator[tuple[str, str, datetime, dict[str, Any]]]:
+        nonlocal late
+        for r in contact_rows:
+            edge = _parse_contact_row(r)
+            if edge is None:
+                continue
+            if tail_start is not None and edge[2] < tail_start:
+                late += 1
+                continue
+            yield (*edge, r)
 
-    if period_start is not None and period_end is not None:
-        periods.append((period_start, period_end, period_edges))
+    late = 0
+    if engine == "python":
+        builder = ContactTimelineBuilder(gap_minutes, transitive_window_seconds)
+        if tail is not None:
+            builder.add_block(tail)
+        for u, v, ts, _ in fresh():
+            builder.add(u, v, ts)
+        joined, new_blocks = _finish_extend(timeline, builder)
+    else:
+        joined, new_blocks = _extend_batch(timeline, list(fresh()), gap_minutes, transitive_window_seconds, engine)
+        timeline.extend(new_blocks)
 
-    # 2. 各期間内で「連続差 ≤ 10秒」のクラスタに分割 → 1クラスタ = 1ブロック
-    blocks: list[dict[str, Any]] = []
-    for _start, _end, edges_with_ts in periods:
-        edges_with_ts = sorted(edges_with_ts, key=lambda x: x[2])
+    if stats is not None:
+        stats["late_rows"] = late
+        stats["reopened_rows"] = joined
+        stats["new_blocks"] = len(new_blocks)
+    return timeline
 
-        clusters: list[list[tuple[str, str, datetime]]] = []
-        cluster: list[tuple[str, str, datetime]] = []
-        last_ts: datetime | None = None
 
-        for u, v, ts in edges_with_ts:
-            if last_ts is None:
-                cluster = [(u, v, ts)]
-                last_ts = ts
-                continue
-            if (ts - last_ts) > window_delta:
-                if cluster:
-                    clusters.append(cluster)
-                cluster = [(u, v, ts)]
-                last_ts = ts
+def _finish_extend(timeline: list[dict[str, Any]], builder: ContactTimelineBuilder) -> tuple[int, list[dict[str, Any]]]:
+    """
+    最後のブロックを add_block してから行を足した builder を閉じて timeline に反映する。
+    返り値: (最後のブロックに合流した行数, 新しいブロック)
+    """
+    blocks = builder.finish()
+    joined = 0
+    if timeline:
+        joined = builder.row_counts[0]
+        # 行が合流していなければ最後のブロックはそのまま（グループの並びも変えない）
+        if joined:
+            timeline[-1] = blocks[0]
+        blocks = blocks[1:]
+    timeline.extend(blocks)
+    return joined, blocks
+
+
+def _extend_batch(
+    timeline: list[dict[str, Any]],
+    rows: list[tuple[str, str, datetime, dict[str, Any]]],
+    gap_minutes: float,
+    transitive_window_seconds: float,
+    engine: str,
+) -> tuple[int, list[dict[str, Any]]]:
+    """extend_contact_timeline の配列版（最後のブロックを更新し、(合流した行数, 新しいブロック) を返す）。"""
+    threshold = min(timedelta(minutes=gap_minutes), timedelta(seconds=transitive_window_seconds))
+    rows.sort(key=itemgetter(2))
+    joined: list[tuple[str, str]] = []
+    i = 0
+    if timeline:
+        tail = timeline[-1]
+        tail_end = last = datetime.fromisoformat(tail["end"])
+        while i < len(rows) and rows[i][2] - last <= threshold:
+            joined.append((rows[i][0], rows[i][1]))
+            last = max(last, rows[i][2])
+            i += 1
+        if joined:
+            comps = sorted(_connected_components(_star_edges(tail["groups"]) + joined), key=lambda x: -len(x))
+            timeline[-1] = {
+                "start": tail["start"],
+                "end": last.isoformat() if last > tail_end else tail["end"],
+                "groups": [list(g) for g in comps],
+            }
+    new_blocks = build_contact_timeline(
+        (r for _, _, _, r in rows[i:]), gap_minutes, transitive_window_seconds, engine=engine
+    ) if i < len(rows) else []
+    return len(joined), new_blocks
+
+
+def canonical_groups(groups: list[list[str]]) -> list[list[str]]:
+    """グループのメンバーを ID 順、グループを人数の多い順（同数なら ID 順）に並べ直す。"""
+    return sorted((sorted(g) for g in groups), key=lambda g: (-len(g), g))
+
+
+def compact_contact_timeline(
+    timeline: list[dict[str, Any]],
+    gap_seconds: float,
+    first: int = 0,
+) -> dict[str, Any]:
+    """
+    連続するブロックのうちグループ構成が同じで、間の空きが gap_seconds 未満のものを1ブロックにまとめる
+    （timeline[first:] をその場で置き換える）。グループは canonical_groups の順に揃える。
+    まとめたブロックには元の境界を "segments": [[start, end], ...] として残す（expand_compacted_block で戻せる）。
+    返り値: { blocks_before, blocks_after, ratio, ms }
+    """
+    t0 = time.perf_counter()
+    compacted: list[dict[str, Any]] = []
+    before = 0
+    for block in timeline[first:]:
+        for part in expand_compacted_block(block):
+            before += 1
+            groups = canonical_groups(part["groups"])
+            last = compacted[-1] if compacted else None
+            if (
+                last is not None
+                and last["groups"] == groups
+                and (datetime.fromisoformat(part["start"]) - datetime.fromisoformat(last["end"])).total_seconds()
+                < gap_seconds
+            ):
+                segments = last.get("segments") or [[last["start"], last["end"]]]
+                compacted[-1] = {
+                    "start": last["start"],
+                    "end": part["end"],
+                    "groups": groups,
+                    "segments": segments + [[part["start"], part["end"]]],
+                }
             else:
-                cluster.append((u, v, ts))
-                last_ts = ts
+                compacted.append({"start": part["start"], "end": part["end"], "groups": groups})
+    del timeline[first:]
+    timeline.extend(compacted)
+    return {
+        "blocks_before": before,
+        "blocks_after": len(compacted),
+        "ratio": round(before / len(compacted), 3) if compacted else 1.0,
+        "ms": round((time.perf_counter() - t0) * 1000, 3),
+    }
 
-        if cluster:
-            clusters.append(cluster)
 
-        for cl in clusters:
-            if not cl:
-                continue
-            edges_only = [(u, v) for u, v, _ in cl]
-            comps = _connected_components(edges_only)
-            gs = sorted(comps, key=lambda x: -len(x))
-            block_start = cl[0][2]
-            block_end = cl[-1][2]
-            blocks.append({
-                "start": block_start.isoformat(),
-                "end": block_end.isoformat(),
-                "groups": [list(g) for g in gs],
-            })
+def expand_compacted_block(block: dict[str, Any]) -> list[dict[str, Any]]:
+    """compact_contact_timeline でまとめたブロックを元のブロックに戻す。まとめていないブロックはそのまま。"""
+    segments = block.get("segments")
+    if not segments:
+        return [block]
+    return [{"start": start, "end": end, "groups": block["groups"]} for start, end in segments]
+
+
+def _reopen_tail(timeline: list[dict[str, Any]] | None) -> tuple[list[dict[str, Any]], int]:
+    """
+    追記の準備。最後のブロックが圧縮済みなら元のブロックに戻す（timeline をその場で更新）。
+    再計算でグループが変わると1つ前のブロックとまとめられることがあるので、圧縮はその1つ前からやり直す。
+    返り値: (timeline（None なら新しい空リスト）, 変わりうる最初のブロック番号)
+    """
+    if timeline is None:
+        return [], 0
+    first = max(len(timeline) - 2, 0)
+    if timeline:
+        timeline[-1:] = expand_compacted_block(timeline[-1])
+    return timeline, first
+
+
+def _build_or_extend(
+    rows: Iterable[dict[str, Any]],
+    timeline: list[dict[str, Any]] | None,
+    stats: dict[str, Any],
+    compact_gap_seconds: float | None,
+) -> tuple[list[dict[str, Any]], int]:
+    """
+    取り込みの共通部分。timeline が None なら新規構築、あれば追記。
+    compact_gap_seconds を指定するとその後に compact_contact_timeline をかけ、stats["compaction"] に結果を入れる。
+    返り値: (タイムライン, 変わった最初のブロック番号)
+    """
+    if timeline is None:
+        contact_timeline = build_contact_timeline(rows, gap_minutes=CONTACT_GAP_MINUTES)
+        first = 0
+    else:
+        contact_timeline, first = _reopen_tail(timeline)
+        extend_contact_timeline(contact_timeline, rows, gap_minutes=CONTACT_GAP_MINUTES, stats=stats)
+    if compact_gap_seconds is not None:
+        stats["compaction"] = compact_contact_timeline(contact_timeline, compact_gap_seconds, first)
+    return contact_timeline, first
+
+
+class PairIntervals:
+    """
+    ペアごとの「一緒にいた区間」（epoch 秒の半開区間 [start, end)）。時点ごとの連結判定（temporal_contact_service）用。
+    接触1回につき前後 hold_seconds を一緒にいたとみなし、重なる・接する区間は1つにまとめる。
+    行がほぼ時刻順なら末尾の区間を伸ばすだけで済む。順序が乱れていても normalize で並べ直してまとめる。
+    時刻順の入力なら、メモリはペアごとの区間数（途切れずに続く接触は1区間）に比例し、行数には比例しない。
+    """
+
+    def __init__(self, hold_seconds: float = CONTACT_HOLD_SECONDS) -> None:
+        self.hold_seconds = hold_seconds
+        self.pairs: dict[tuple[str, str], list[list[float]]] = {}
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self.pairs.values())
+
+    def add(self, u: str, v: str, ts: datetime) -> None:
+        if u == v:
+            return
+        key = (u, v) if u <= v else (v, u)
+        t = ts.timestamp()
+        start, end = t - self.hold_seconds, t + self.hold_seconds
+        spans = self.pairs.get(key)
+        if spans is None:
+            self.pairs[key] = [[start, end]]
+            return
+        last = spans[-1]
+        if start <= last[1] and end >= last[0]:
+            last[0] = min(last[0], start)
+            last[1] = max(last[1], end)
+        else:
+            if start < last[0]:
+                self._dirty = True
+            spans.append([start, end])
+
+    def merge(self, other: "PairIntervals") -> None:
+        """other の区間を取り込む（追記モード・一括取り込み用）。区間はコピーせずに引き取るので、other はその後使わないこと。"""
+        for key, spans in other.pairs.items():
+            mine = self.pairs.get(key)
+            if mine is None:
+                self.pairs[key] = spans
+            else:
+                mine.extend(spans)
+        other.pairs = {}
+        self._dirty = True
+
+    def normalize(self) -> None:
+        """各ペアの区間を開始時刻順に並べ、重なる・接するものをまとめる。"""
+        if not self._dirty:
+            return
+        for key, spans in self.pairs.items():
+            spans.sort()
+            merged = [spans[0]]
+            for start, end in spans[1:]:
+                if start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.pairs[key] = merged
+        self._dirty = False
 
-    return blocks
+    def intervals(self) -> Iterator[tuple[str, str, float, float]]:
+        """(a, b, start, end) を返す。"""
+        self.normalize()
+        for (a, b), spans in self.pairs.items():
+            for start, end in spans:
+                yield a, b, start, end
 
 
 def _row_val(row: dict, *keys: str) -> str:
@@ -166,6 +529,146 @@ def _row_val(row: dict, *keys: str) -> str:
     return ""
 
 
+def _sniff_encoding(head: bytes) -> str:
+    """先頭チャンクから文字コードを判定（BOM付きUTF-8 / UTF-8 / cp932）。"""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False なので末尾で切れたマルチバイト文字はエラーにならない
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp932"
+
+
+def iter_decoded_chunks(chunks: Iterable[bytes], sniff_size: int = 64 * 1024) -> Iterator[str]:
+    """
+    バイト列チャンクをインクリメンタルデコーダで逐次デコードする。
+    文字コードは先頭 sniff_size バイトで判定し、以降の不正バイトは置換文字にする。
+    """
+    decoder = None
+    head = b""
+    for chunk in chunks:
+        if decoder is None:
+            head += chunk
+            if len(head) < sniff_size:
+                continue
+            decoder = codecs.getincrementaldecoder(_sniff_encoding(head))(errors="replace")
+            chunk, head = head, b""
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    if decoder is None:
+        if not head:
+            return
+        decoder = codecs.getincrementaldecoder(_sniff_encoding(head))(errors="replace")
+    tail = decoder.decode(head, final=True)
+    if tail:
+        yield tail
+
+
+def iter_lines(text_chunks: Iterable[str]) -> Iterator[str]:
+    """テキストチャンクを行単位（改行付き）に切り直す。csv.reader にそのまま渡せる。"""
+    pending = ""
+    for text in text_chunks:
+        pending += text
+        cut = pending.rfind("\n")
+        if cut < 0:
+            continue
+        block, pending = pending[: cut + 1], pending[cut + 1 :]
+        yield from io.StringIO(block, newline="")
+    if pending:
+        yield from io.StringIO(pending, newline="")
+
+
+def iter_file_chunks(f: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """バイナリファイルを chunk_size ごとに読む。"""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_bt_contact_rows(
+    lines: Iterable[str],
+    characters_map: dict[str, Character],
+    stats: dict[str, int] | None = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    CSV の行を1行ずつ読み、接触あり（is_contacted=True）の行だけを
+    { user_id, contacted_user_id, timestamp } として yield する。
+    出現したユーザーは characters_map に登録する。stats["rows"] に総行数を数える。
+    """
+    reader = csv.DictReader(lines)
+    total = 0
+    for row in reader:
+        total += 1
+        user_id = _row_val(row, "user_id")
+        contacted_id = _row_val(row, "contacted_user_id")
+
+        if user_id and user_id not in characters_map:
+            user_name = _row_val(row, "user_id_display_name") or user_id
+            characters_map[user_id] = Character(id=user_id, name=user_name, role=CharacterRole.player)
+        if contacted_id and contacted_id not in characters_map:
+            contacted_name = _row_val(row, "contacted_user_id_display_name") or contacted_id
+            characters_map[contacted_id] = Character(id=contacted_id, name=contacted_name, role=CharacterRole.player)
+
+        ts = _row_val(row, "timestamp")
+        if not user_id or not contacted_id or not ts:
+            continue
+        if _row_val(row, "is_contacted").lower() not in ("true", "1", "yes"):
+            continue
+        yield {"user_id": user_id, "contacted_user_id": contacted_id, "timestamp": ts}
+    if stats is not None:
+        stats["rows"] = total
+
+
+def _parse_bt_contact_lines(
+    lines: Iterable[str],
+    keep_rows: bool,
+    timeline: list[dict[str, Any]] | None = None,
+    compact_gap_seconds: float | None = None,
+) -> dict[str, Any]:
+    characters_map: dict[str, Character] = {}
+    stats: dict[str, Any] = {"rows": 0, "contacts": 0}
+    contact_rows: list[dict[str, Any]] = []
+    pair_intervals = PairIntervals()
+    # 追記モードで extend_contact_timeline が落とす行（late_rows）は、区間にも入れない
+    since = contact_append_cutoff(timeline) if timeline is not None else None
+    cutoff = datetime.fromisoformat(since) if since else None
+
+    def counted(rows: Iterator[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+        for r in rows:
+            stats["contacts"] += 1
+            if keep_rows:
+                contact_rows.append(r)
+            edge = _parse_contact_row(r)
+            if edge is not None and (cutoff is None or edge[2] >= cutoff):
+                pair_intervals.add(*edge)
+            yield r
+
+    rows = counted(iter_bt_contact_rows(lines, characters_map, stats))
+    contact_timeline, first_changed = _build_or_extend(rows, timeline, stats, compact_gap_seconds)
+
+    logger.debug("Total rows: %d, Contact rows (is_contacted=True): %d", stats["rows"], stats["contacts"])
+    logger.debug("Contact timeline blocks: %d", len(contact_timeline))
+
+    result: dict[str, Any] = {
+        "characters": list(characters_map.values()),
+        "contact_timeline": contact_timeline,
+        "first_changed": first_changed,
+        "pair_intervals": pair_intervals,
+    }
+    if keep_rows:
+        result["contact_rows"] = contact_rows
+    if timeline is not None:
+        result["append"] = {k: stats[k] for k in ("late_rows", "reopened_rows", "new_blocks")}
+    if "compaction" in stats:
+        result["compaction"] = stats["compaction"]
+    return result
+
+
 def parse_bt_contacts_csv(content: str | bytes) -> dict[str, Any]:
     """
     位置情報は無視。
@@ -182,46 +685,454 @@ def parse_bt_contacts_csv(content: str | bytes) -> dict[str, Any]:
         text = content
     if text.startswith("\ufeff"):
         text = text[1:]
+    return _parse_bt_contact_lines(io.StringIO(text, newline=""), keep_rows=True)
+
+
+def parse_bt_contacts_stream(
+    chunks: Iterable[bytes],
+    timeline: list[dict[str, Any]] | None = None,
+    compact_gap_seconds: float | None = None,
+) -> dict[str, Any]:
+    """
+    parse_bt_contacts_csv のストリーミング版。バイト列チャンクを逐次デコード・パースし、
+    行をそのままタイムライン構築に流す。ファイル全体も行リストも保持しない。
+    メモリは結果のブロック + PairIntervals（ペアごとの一緒にいた区間。連続する接触は1区間にまとまる）+
+    時刻順から外れた接触行の分（engine="python" の場合。"numpy" は接触行をすべて配列で持つ）。
+    返り値は contact_rows を含まない以外 parse_bt_contacts_csv と同じ。
+    timeline を渡すと追記モード（extend_contact_timeline）。timeline はその場で更新され、
+    返り値に "append": { late_rows, reopened_rows, new_blocks } が付く。
+    compact_gap_seconds を渡すと compact_contact_timeline で圧縮し、返り値に "compaction" が付く。
+    返り値の "first_changed" は変わった最初のブロック番号（新規構築なら 0）、
+    "pair_intervals" は今回の行（追記モードで取り込まなかった行を除く）から作った PairIntervals。
+    """
+    return _parse_bt_contact_lines(
+        iter_lines(iter_decoded_chunks(chunks)),
+        keep_rows=False,
+        timeline=timeline,
+        compact_gap_seconds=compact_gap_seconds,
+    )
+
+
+# ---- 複数ファイルの一括取り込み ----
+
+def extract_contact_csv_files(filename: str, path: str, directory: str) -> list[tuple[str, str]]:
+    """
+    一時ファイルに書き出したアップロード1件（path）を CSV ファイル単位に展開する。
+    zip / tar（.tar.gz, .tgz 含む）は中の .csv を directory に1つずつ書き出し、
+    それ以外はそのまま1ファイルとして返す。返り値: [(ファイル名, パス), ...]
+    """
+    name = (filename or "").lower()
+    files: list[tuple[str, str]] = []
+
+    def spool(member_name: str, src: BinaryIO) -> None:
+        dest = os.path.join(directory, f"{os.path.basename(path)}.{len(files)}.csv")
+        with open(dest, "wb") as out:
+            shutil.copyfileobj(src, out, CHUNK_SIZE)
+        files.append((member_name, dest))
+
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(".csv"):
+                    with zf.open(info) as src:
+                        spool(info.filename, src)
+    elif name.endswith((".tar", ".tar.gz", ".tgz")):
+        with tarfile.open(path) as tf:
+            for member in tf:
+                if member.isfile() and member.name.lower().endswith(".csv"):
+                    src = tf.extractfile(member)
+                    if src is not None:
+                        spool(member.name, src)
+    else:
+        files.append((filename, path))
+    return files
+
+
+def contact_append_cutoff(timeline: list[dict[str, Any]]) -> str | None:
+    """
+    追記モードで取り込まない行の境目（最後のブロックの start。圧縮済みなら最後の元ブロックの start）。
+    一括取り込みのワーカーに渡し、extend_contact_timeline と同じ行を late_rows として落とす。
+    """
+    if not timeline:
+        return None
+    return expand_compacted_block(timeline[-1])[-1]["start"]
+
 
-    reader = csv.DictReader(io.StringIO(text))
-    rows = list(reader)
+def parse_bt_contact_file(path: str, since: str | None = None) -> dict[str, Any]:
+    """
+    一括取り込みのワーカー（ProcessPoolExecutor で1ファイル1プロセス）。
+    parse_bt_contacts_csv と同じ行の解釈で、ファイルを少しずつ読みながら接触を列形式
+    （ユーザー番号 u / v、UTC epoch µs、UTC オフセット秒、タイムゾーン付きか）に集め、ペアごとの区間も作る。
+    親に返すのは numpy 配列（1接触あたり 17 バイト）と区間なので、行の tuple や dict を pickle するより小さい。
+    since（追記モードの contact_append_cutoff）より前の行は取り込まずに late_rows に数える。
+    返り値: { "characters": [Character, ...], "names": [ID, ...], "u", "v", "us", "off", "aware": 配列,
+              "pair_intervals": PairIntervals, "rows": 総行数, "late_rows": 落とした行数 }
+    """
+    from app.services.contact_timeline_np import parse_timestamps
 
+    cutoff = datetime.fromisoformat(since) if since else None
     characters_map: dict[str, Character] = {}
-    contact_rows: list[dict[str, Any]] = []
+    stats: dict[str, int] = {"rows": 0}
+    pair_intervals = PairIntervals()
+    codes: dict[str, int] = {}
+    cu: list[int] = []
+    cv: list[int] = []
+    ts_list: list[str] = []
+    late = 0
+    with open(path, "rb") as f:
+        for r in iter_bt_contact_rows(iter_lines(iter_decoded_chunks(iter_file_chunks(f))), characters_map, stats):
+            edge = _parse_contact_row(r)
+            if edge is None:
+                continue
+            u, v, ts = edge
+            if cutoff is not None and ts < cutoff:
+                late += 1
+                continue
+            pair_intervals.add(u, v, ts)
+            cu.append(codes.setdefault(u, len(codes)))
+            cv.append(codes.setdefault(v, len(codes)))
+            ts_list.append(r["timestamp"])
+    us, off, aware, _valid = parse_timestamps(ts_list)
+    pair_intervals.normalize()
+    return {
+        "characters": list(characters_map.values()),
+        "names": list(codes),
+        "u": np.asarray(cu, dtype=np.int32),
+        "v": np.asarray(cv, dtype=np.int32),
+        "us": us,
+        "off": off.astype(np.int32),
+        "aware": aware,
+        "pair_intervals": pair_intervals,
+        "rows": stats["rows"],
+        "late_rows": late,
+    }
 
-    for row in rows:
-        user_id = _row_val(row, "user_id")
-        user_name = _row_val(row, "user_id_display_name") or user_id
-        contacted_id = _row_val(row, "contacted_user_id")
-        contacted_name = _row_val(row, "contacted_user_id_display_name") or contacted_id
-        ts = _row_val(row, "timestamp")
-        is_contacted_val = _row_val(row, "is_contacted")
 
-        if user_id and user_id not in characters_map:
-            characters_map[user_id] = Character(id=user_id, name=user_name, role=CharacterRole.player)
-        if contacted_id and contacted_id not in characters_map:
-            characters_map[contacted_id] = Character(id=contacted_id, name=contacted_name, role=CharacterRole.player)
+def build_contact_timeline_from_files(
+    parsed_files: list[dict[str, Any]],
+    timeline: list[dict[str, Any]] | None = None,
+    compact_gap_seconds: float | None = None,
+) -> dict[str, Any]:
+    """
+    parse_bt_contact_file の結果（ファイルごと）をまとめて1本のタイムラインにする。
+    各ファイルの列をつないで contact_timeline_np.build_blocks に1回だけ通すので、結果は全ファイルを
+    1つの CSV として取り込んだ場合と同じ。追記モードでは、最後のブロックの end から閾値以内に連鎖する
+    先頭の行だけを ContactTimelineBuilder で最後のブロックに合流させ、残りを新しいブロックにする。
+    キャラクターは最初に現れたファイルの表示名を採用。timeline / compact_gap_seconds は
+    parse_bt_contacts_stream と同じ（追記モードならワーカーに contact_append_cutoff を渡しておくこと）。
+    返り値も parse_bt_contacts_stream と同じ形。
+    """
+    from app.services.contact_timeline_np import build_blocks, parse_timestamps
 
-        if not user_id or not contacted_id or not ts:
+    characters_map: dict[str, Character] = {}
+    pair_intervals = PairIntervals()
+    codes: dict[str, int] = {}
+    columns: dict[str, list[np.ndarray]] = {"u": [], "v": [], "us": [], "off": [], "aware": []}
+    for parsed in parsed_files:
+        for c in parsed["characters"]:
+            characters_map.setdefault(c.id, c)
+        pair_intervals.merge(parsed["pair_intervals"])
+        # ファイルごとのユーザー番号を全体の番号に付け替える
+        recode = np.asarray([codes.setdefault(name, len(codes)) for name in parsed["names"]], dtype=np.int64)
+        columns["u"].append(recode[parsed["u"]])
+        columns["v"].append(recode[parsed["v"]])
+        for key in ("us", "off", "aware"):
+            columns[key].append(parsed[key])
+    names = list(codes)
+    u, v, us, off, aware = (np.concatenate(columns[k]) for k in ("u", "v", "us", "off", "aware"))
+    order = np.argsort(us, kind="stable")
+    u, v, us, off, aware = u[order], v[order], us[order], off[order].astype(np.int64), aware[order]
+
+    contact_timeline, first = _reopen_tail(timeline)
+    joined = 0
+    if contact_timeline and len(us):
+        tail = contact_timeline[-1]
+        builder = ContactTimelineBuilder(gap_minutes=CONTACT_GAP_MINUTES)
+        threshold = builder.threshold // timedelta(microseconds=1)
+        tail_end = int(parse_timestamps([tail["end"]])[0][0])
+        previous = np.maximum(np.concatenate(([tail_end], us[:-1])), tail_end)
+        breaks = np.flatnonzero(us - previous > threshold)
+        joined = int(breaks[0]) if len(breaks) else len(us)
+        if joined:
+            builder.add_block(tail)
+            for i in range(joined):
+                builder.add(names[u[i]], names[v[i]], _from_epoch_us(int(us[i]), int(off[i]), bool(aware[i])))
+            contact_timeline[-1] = builder.finish()[0]
+    new_blocks = build_blocks(
+        u[joined:], v[joined:], us[joined:], off[joined:], aware[joined:], names, gap_minutes=CONTACT_GAP_MINUTES,
+    )
+    contact_timeline.extend(new_blocks)
+
+    stats: dict[str, Any] = {}
+    if compact_gap_seconds is not None:
+        stats["compaction"] = compact_contact_timeline(contact_timeline, compact_gap_seconds, first)
+    result: dict[str, Any] = {
+        "characters": list(characters_map.values()),
+        "contact_timeline": contact_timeline,
+        "first_changed": first,
+        "pair_intervals": pair_intervals,
+    }
+    if timeline is not None:
+        result["append"] = {
+            "late_rows": sum(parsed["late_rows"] for parsed in parsed_files),
+            "reopened_rows": joined,
+            "new_blocks": len(new_blocks),
+        }
+    if "compaction" in stats:
+        result["compaction"] = stats["compaction"]
+    return result
+
+
+def _from_epoch_us(us: int, off: int, aware: bool) -> datetime:
+    """contact_timeline_np の列形式の時刻を datetime に戻す（元の文字列を fromisoformat したものと同じ）。"""
+    local = datetime(1970, 1, 1) + timedelta(microseconds=us + off * 1_000_000)
+    return local.replace(tzinfo=timezone(timedelta(seconds=off))) if aware else local
+
+
+# ---- GPS ログ ----
+
+def iter_gps_fixes(
+    lines: Iterable[str],
+    characters_map: dict[str, Character],
+    stats: dict[str, int] | None = None,
+) -> Iterator[tuple[str, datetime, float, float, float | None]]:
+    """
+    GPS CSV（user_id, timestamp, lat, lng[, accuracy, user_id_display_name]）を1行ずつ読み、
+    (user_id, 時刻, lat, lng, accuracy) を yield する。ID・時刻・座標が読めない行（座標が nan / inf も）は飛ばす。
+    出現したユーザーは characters_map に登録する。stats["rows"] に総行数を数える。
+    """
+    reader = csv.reader(lines)
+    header = [h.strip().lstrip("\ufeff").lower() for h in next(reader, [])]
+
+    def column(*names: str) -> int | None:
+        for name in names:
+            if name in header:
+                return header.index(name)
+        return None
+
+    c_user, c_name, c_ts = column("user_id"), column("user_id_display_name"), column("timestamp")
+    c_lat, c_lng, c_acc = column("lat", "latitude"), column("lng", "lon", "longitude"), column("accuracy")
+    total = 0
+    if c_user is None or c_ts is None or c_lat is None or c_lng is None:
+        # 必要な列がなければ測位は0件（行数だけ数える）
+        if stats is not None:
+            stats["rows"] = sum(1 for _ in reader)
+        return
+    width = max(c for c in (c_user, c_name, c_ts, c_lat, c_lng, c_acc) if c is not None) + 1
+    for row in reader:
+        total += 1
+        if len(row) < width:
+            row = row + [""] * (width - len(row))
+        user_id = row[c_user].strip()
+        if not user_id:
             continue
-        if is_contacted_val.lower() not in ("true", "1", "yes"):
+        if user_id not in characters_map:
+            user_name = (row[c_name].strip() if c_name is not None else "") or user_id
+            characters_map[user_id] = Character(id=user_id, name=user_name, role=CharacterRole.player)
+        try:
+            ts = datetime.fromisoformat(row[c_ts].strip().replace("Z", "+00:00"))
+            lat = float(row[c_lat])
+            lng = float(row[c_lng])
+        except ValueError:
+            continue
+        # nan / inf はセルの計算（int(x // cell)）で例外になるので、読めない行と同じく飛ばす
+        if not (math.isfinite(lat) and math.isfinite(lng)):
             continue
-        contact_rows.append({"user_id": user_id, "contacted_user_id": contacted_id, "timestamp": ts})
+        try:
+            accuracy = float(row[c_acc]) if c_acc is not None and row[c_acc].strip() else None
+        except ValueError:
+            accuracy = None
+        if accuracy is not None and not math.isfinite(accuracy):
+            accuracy = None
+        yield user_id, ts, lat, lng, accuracy
+    if stats is not None:
+        stats["rows"] = total
+
 
-    print(f"[DEBUG] Total rows: {len(rows)}, Contact rows (is_contacted=True): {len(contact_rows)}")
-    
-    # 空き時間がこの分数以上なら新区間。1分にするとこのCSVは1枠のままなので 0.5（30秒）で分割。
-    contact_timeline = build_contact_timeline(contact_rows, gap_minutes=0.5)
-    
-    print(f"[DEBUG] Contact timeline blocks: {len(contact_timeline)}")
+def _parse_gps_lines(
+    lines: Iterable[str],
+    locations: Iterable[Location],
+    max_gap_seconds: float = GPS_MAX_GAP_SECONDS,
+    min_dwell_seconds: float = GPS_MIN_DWELL_SECONDS,
+) -> dict[str, Any]:
+    index = GeofenceIndex(locations)
+    characters_map: dict[str, Character] = {}
+    stats: dict[str, int] = {"rows": 0, "fixes": 0, "snapped": 0, "out_of_order": 0}
+    max_gap = timedelta(seconds=max_gap_seconds)
+    # ユーザーごとの最後の時刻と、開いている滞在 [location_id, start, end, fixes, confidence 合計]
+    last_seen: dict[str, datetime] = {}
+    open_dwell: dict[str, list[Any]] = {}
+    dwells: dict[str, list[dict[str, Any]]] = defaultdict(list)
 
+    def close(user_id: str) -> None:
+        dwell = open_dwell.pop(user_id, None)
+        if dwell is None:
+            return
+        location_id, start, end, fixes, confidence = dwell
+        if (end - start).total_seconds() >= min_dwell_seconds:
+            dwells[user_id].append({
+                "character_id": user_id,
+                "location_id": location_id,
+                "start": start,
+                "end": end,
+                "fixes": fixes,
+                "confidence": round(confidence / fixes, 3),
+            })
+
+    for user_id, ts, lat, lng, accuracy in iter_gps_fixes(lines, characters_map, stats):
+        stats["fixes"] += 1
+        last = last_seen.get(user_id)
+        if last is not None and ts < last:
+            stats["out_of_order"] += 1
+            continue
+        last_seen[user_id] = ts
+        hit = index.locate(lat, lng)
+        if hit is None:
+            close(user_id)
+            continue
+        stats["snapped"] += 1
+        location_id, distance, radius = hit
+        # 中心で 1.0、境界で 0.5。精度（誤差半径 m）が分かれば 半径 / (半径 + 誤差) を掛けて割り引く
+        confidence = 1.0 - 0.5 * distance / radius
+        if accuracy is not None and accuracy > 0:
+            confidence *= radius / (radius + accuracy)
+        dwell = open_dwell.get(user_id)
+        if dwell is not None and dwell[0] == location_id and ts - dwell[2] <= max_gap:
+            dwell[2] = ts
+            dwell[3] += 1
+            dwell[4] += confidence
+        else:
+            close(user_id)
+            open_dwell[user_id] = [location_id, ts, ts, 1, confidence]
+    for user_id in list(open_dwell):
+        close(user_id)
+
+    logger.debug("GPS rows: %d, fixes: %d, snapped: %d", stats["rows"], stats["fixes"], stats["snapped"])
     return {
         "characters": list(characters_map.values()),
-        "contact_timeline": contact_timeline,
-        "contact_rows": contact_rows,
+        "dwells": [d for user_id in sorted(dwells) for d in dwells[user_id]],
+        "stats": {**stats, "dwells": sum(len(v) for v in dwells.values())},
     }
 
 
-def parse_gps_log(content: str | bytes) -> list[dict[str, Any]]:
-    """GPSログをパース。場所・時間範囲を返す。"""
-    return []
+def parse_gps_log(
+    content: str | bytes,
+    locations: Iterable[Location],
+    max_gap_seconds: float = GPS_MAX_GAP_SECONDS,
+    min_dwell_seconds: float = GPS_MIN_DWELL_SECONDS,
+) -> dict[str, Any]:
+    """
+    GPSログをパース。場所・時間範囲を返す。
+    各測位を locations のジオフェンス（GeofenceIndex）に割り当て、同じ場所の測位が max_gap_seconds 以内で
+    続く間を1つの滞在にまとめる（min_dwell_seconds 未満は通過として捨てる）。
+    測位は端末ごとに時刻順である前提で、ユーザーごとに開いている滞在だけを持って流す。
+    前の測位より古い測位は stats["out_of_order"] に数えて飛ばす。
+    返り値: {
+        "characters": [Character, ...],
+        "dwells": [ { character_id, location_id, start, end, fixes, confidence }, ... ]（character_id, start 順）,
+        "stats": { rows, fixes, snapped, out_of_order, dwells }
+    }
+    """
+    if isinstance(content, bytes):
+        content = content.decode("utf-8")
+    if content.startswith("\ufeff"):
+        content = content[1:]
+    return _parse_gps_lines(io.StringIO(content, newline=""), locations, max_gap_seconds, min_dwell_seconds)
+
+
+def parse_gps_stream(
+    chunks: Iterable[bytes],
+    locations: Iterable[Location],
+    max_gap_seconds: float = GPS_MAX_GAP_SECONDS,
+    min_dwell_seconds: float = GPS_MIN_DWELL_SECONDS,
+) -> dict[str, Any]:
+    """parse_gps_log のストリーミング版（バイト列チャンクを逐次デコード・パースする）。"""
+    return _parse_gps_lines(
+        iter_lines(iter_decoded_chunks(chunks)), locations, max_gap_seconds, min_dwell_seconds
+    )
+
+
+def gps_block_id(character_id: str, start: datetime) -> str:
+    """GPS 滞在から作る TimeBlock の block_id。同じログを取り込み直すと同じ ID になる。"""
+    return f"gps-{character_id}-{int(start.timestamp())}"
+
+
+def merge_gps_dwells(
+    timeline: CharacterTimeline | None,
+    character_id: str,
+    dwells: list[dict[str, Any]],
+) -> tuple[CharacterTimeline, dict[str, int]]:
+    """
+    1人分の滞在（start 順）をその人の CharacterTimeline に合流させる。
+    既存ブロックを start 順に並べ、滞在と start 順に突き合わせる（ソート済みマージ結合。滞在ごとに見るのは重なるブロックだけ）:
+    - 時間が重なる既存ブロックに同じ場所のものがあれば、その presence を GPS の信頼度で更新（高くなるときだけ）
+    - 同じ block_id（前回の GPS 取り込み）のブロックがあれば置き換え
+    - それ以外は新しい TimeBlock として追加。場所の違うブロックと重なるものは conflicts に数える
+    結果の time_blocks は start 順。timeline と既存のブロックは書き換えず、変わったものだけ model_copy で作り直す。
+    返り値: (新しいタイムライン, { added, updated, conflicts })
+    """
+    if timeline is None:
+        timeline = CharacterTimeline(character_id=character_id)
+    existing = sorted(timeline.time_blocks, key=lambda b: b.time_range.start.timestamp())
+    by_id = {b.block_id: i for i, b in enumerate(existing)}
+    stats = {"added": 0, "updated": 0, "conflicts": 0}
+    added: list[TimeBlock] = []
+    # 滞在の start 時点で始まっていて終わっていない既存ブロック（添字順）と、その終わりのヒープ。
+    # 長いブロックがあっても、終わったブロックは外れるので見直さない（見るのは滞在と重なるブロックだけ）
+    active: dict[int, None] = {}
+    ends: list[tuple[float, int]] = []
+    i = 0
+    for dwell in dwells:
+        start, end = dwell["start"].timestamp(), dwell["end"].timestamp()
+        presence = PresenceObservation(confidence=dwell["confidence"], source="gps")
+        block_id = gps_block_id(character_id, dwell["start"])
+        while i < len(existing) and existing[i].time_range.start.timestamp() <= start:
+            active[i] = None
+            heapq.heappush(ends, (existing[i].time_range.end.timestamp(), i))
+            i += 1
+        while ends and ends[0][0] < start:
+            block_end, j = heapq.heappop(ends)
+            if existing[j].time_range.end.timestamp() == block_end:  # 置き換えで終わりが変わったものは新しい項目で外す
+                active.pop(j, None)
+        same_place: int | None = None
+        conflict = False
+        hi = i  # 滞在の途中で始まるブロックは existing[i:hi]
+        while hi < len(existing) and existing[hi].time_range.start.timestamp() <= end:
+            hi += 1
+        for j in [*active, *range(i, hi)]:
+            block = existing[j]
+            if block.block_id != block_id:
+                if block.location_id == dwell["location_id"]:
+                    same_place = j if same_place is None else same_place
+                else:
+                    conflict = True
+        if block_id in by_id:
+            k = by_id[block_id]
+            old = existing[k]
+            existing[k] = old.model_copy(update={
+                "time_range": TimeRange(start=dwell["start"], end=dwell["end"]),
+                "location_id": dwell["location_id"],
+                "observations": old.observations.model_copy(update={"presence": presence}),
+            })
+            if k in active:
+                heapq.heappush(ends, (dwell["end"].timestamp(), k))
+            stats["updated"] += 1
+        elif same_place is not None:
+            old = existing[same_place]
+            current = old.observations.presence
+            if current is None or current.confidence < presence.confidence:
+                existing[same_place] = old.model_copy(update={
+                    "observations": old.observations.model_copy(update={"presence": presence}),
+                })
+                stats["updated"] += 1
+        else:
+            added.append(TimeBlock(
+                block_id=block_id,
+                time_range=TimeRange(start=dwell["start"], end=dwell["end"]),
+                location_id=dwell["location_id"],
+                observations=Observations(presence=presence),
+            ))
+            stats["added"] += 1
+            stats["conflicts"] += conflict
+    blocks = list(heapq.merge(existing, added, key=lambda b: b.time_range.start.timestamp()))
+    return timeline.model_copy(update={"time_blocks": blocks}), stats
@@ -1,20 +1,358 @@
 # -*- coding: utf-8 -*-
 """
 犯人推論: alone_minutes_total, murder_window_accessible, suspect_score 等を計算。
+
+DerivedEngine は全キャラクターのタイムラインのブロックを列（start, end, 場所コード, キャラクターコード）に
+並べ、NumPy で一度に DerivedStats を計算する。
+- 同じキャラクター・同じ場所で重なるブロックはまとめてから、場所ごとに時刻順のイベント（入る +1 / 出る -1）に
+  並べて人数の累積和を取る。「人数 × 時間」と「1人だけの時間」の累積積分を各イベントで持っておけば、
+  区間 [s, e] の値はその両端のイベントの差で求まる。
+- 被害者と同じ場所・同じ時間にいたブロックは、被害者の区間（場所ごとに時刻順）への searchsorted で調べる。
+キャラクターごとの列はタイムラインのリビジョンごとに使い回し、結果は
+「本人・被害者・同じ場所にいたことのあるキャラクター」のリビジョンが変わらない限り計算し直さない。
+計算し直すときも、列に入れるのは変わったキャラクターの全ブロックと、その人たちが行った場所の他の人のブロックだけ
+（変わったキャラクターの値はそれだけで決まる）。コストは全ブロック数ではなく、それらのブロック数に比例する。
 """
-from app.models import CharacterTimeline, Character, Event
+import heapq
+from datetime import datetime
+from typing import Any, Callable, Iterable
+
+import numpy as np
+
+from app.models import CharacterTimeline, Character, DerivedStats, Event, TimeBlock
+
+# 疑わしさスコア: ブロックごとに suspicion_delta - ALIBI_WEIGHT * alibi_strength を足し、
+# 犯行時間帯に被害者に近づけた（derived.murder_window_accessible）なら WINDOW_ACCESS_SCORE を足す
+ALIBI_WEIGHT = 1.0
+WINDOW_ACCESS_SCORE = 1.0
+
+
+def _parse_time(value: str | datetime) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _to_ms(t: np.ndarray, base: float) -> np.ndarray:
+    return np.round((t - base) * 1000.0).astype(np.int64)
+
+
+def _merge_intervals(
+    group: np.ndarray, start: np.ndarray, end: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """group ごとに重なる・接する区間をまとめる。(group, start, end) を group, start の順で返す。"""
+    if len(start) == 0:
+        return group, start, end
+    order = np.lexsort((start, group))
+    g, s, e = group[order], start[order], end[order]
+    # group ごとの end の累積最大（ミリ秒の整数）。group ごとに下駄を履かせて、境界で前の group を持ち越さない
+    base = float(s.min())
+    s_ms, e_ms = _to_ms(s, base), _to_ms(e, base)
+    lift = g.astype(np.int64) * (int(e_ms.max()) + 1)
+    running = np.maximum.accumulate(lift + e_ms) - lift
+    new = np.ones(len(s), dtype=bool)
+    new[1:] = (g[1:] != g[:-1]) | (s_ms[1:] > running[:-1])
+    first = np.flatnonzero(new)
+    return g[first], s[first], np.maximum.reduceat(e, first)
+
+
+def _overlapping(
+    loc: np.ndarray, start: np.ndarray, end: np.ndarray,
+    v_loc: np.ndarray, v_start: np.ndarray, v_end: np.ndarray,
+) -> np.ndarray:
+    """
+    各区間 (loc, start, end) が、同じ場所の区間 (v_loc, v_start, v_end) のどれかと重なるか。
+    v_* は場所ごとに時刻順で互いに重ならないこと（_merge_intervals の結果）。
+    """
+    if len(v_start) == 0 or len(start) == 0:
+        return np.zeros(len(start), dtype=bool)
+    base = min(float(start.min()), float(v_start.min()))
+    width = int(max(_to_ms(end, base).max(), _to_ms(v_end, base).max())) + 1
+    v_key = v_loc.astype(np.int64) * width + _to_ms(v_end, base)
+    # 同じ場所で end > start となる最初の区間
+    idx = np.searchsorted(v_key, loc.astype(np.int64) * width + _to_ms(start, base), side="right")
+    found = idx < len(v_key)
+    idx = np.minimum(idx, len(v_key) - 1)
+    return found & (v_loc[idx] == loc) & (v_start[idx] < end) & (v_end[idx] > start)
+
+
+class _Columns:
+    """1人分のブロックの列。タイムラインのリビジョンごとに作る。"""
+
+    __slots__ = ("revision", "start", "end", "loc", "block_ids", "contacts")
+
+    def __init__(self, revision: int, timeline: CharacterTimeline, loc_code: dict[str, int]) -> None:
+        blocks = timeline.time_blocks
+        self.revision = revision
+        self.start = np.array([b.time_range.start.timestamp() for b in blocks], dtype=np.float64)
+        self.end = np.array([b.time_range.end.timestamp() for b in blocks], dtype=np.float64)
+        self.loc = np.array([loc_code.setdefault(b.location_id, len(loc_code)) for b in blocks], dtype=np.int64)
+        self.block_ids = [b.block_id for b in blocks]
+        # 観測（Bluetooth 接触など）で一緒にいた相手
+        self.contacts = [{c.with_character_id for c in b.observations.contacts} for b in blocks]
+
+
+class DerivedEngine:
+    """全タイムラインの DerivedStats を一括で計算し、リビジョンごとに覚えておく。"""
+
+    def __init__(self) -> None:
+        self.loc_code: dict[str, int] = {}
+        self._columns: dict[str, _Columns] = {}
+        self._results: dict[str, tuple[Any, DerivedStats]] = {}
+
+    def location_ids(self) -> list[str]:
+        """場所コード順の location_id。"""
+        return sorted(self.loc_code, key=self.loc_code.__getitem__)
+
+    def compute(
+        self,
+        timelines: dict[str, CharacterTimeline],
+        revisions: dict[str, int],
+        victim_id: str | None,
+        murder_window: tuple[str, str] | None = None,
+        travel: Callable[[list[str]], np.ndarray] | None = None,
+        travel_key: Any = None,
+    ) -> dict[str, DerivedStats]:
+        """
+        timelines の全キャラクターの DerivedStats。前回から入力が変わったキャラクターの分だけを返す
+        （変わっていなければ空）。revisions はキャラクターごとのタイムラインのリビジョン（全体で単調に増える値）。
+        travel は場所コード順の location_id から移動に必要な秒数の行列を返す関数（なければ 0 秒）。
+        travel_key は travel の中身が変わったことを知らせるための値。
+        """
+        for cid in list(self._columns):
+            if cid not in timelines:
+                del self._columns[cid]
+                self._results.pop(cid, None)
+        for cid, tl in timelines.items():
+            rev = revisions.get(cid, 0)
+            cols = self._columns.get(cid)
+            if cols is None or cols.revision != rev:
+                self._columns[cid] = _Columns(rev, tl, self.loc_code)
+
+        # 結果が依存するのは本人・被害者・同じ場所にいたことのあるキャラクター。
+        # リビジョンは全体で単調に増えるので、場所ごとの (人数, 最大リビジョン) が同じなら、その場所の誰も変わっていない
+        by_loc: dict[int, list[int]] = {}
+        for cols in self._columns.values():
+            for loc in set(cols.loc.tolist()):
+                entry = by_loc.setdefault(loc, [0, 0])
+                entry[0] += 1
+                entry[1] = max(entry[1], cols.revision)
+        victim_cols = self._columns.get(victim_id) if victim_id is not None else None
+        params = (victim_id, victim_cols.revision if victim_cols else None, murder_window, travel_key)
+        keys: dict[str, Any] = {}
+        dirty: list[str] = []
+        for cid, cols in self._columns.items():
+            key = (params, cols.revision, tuple(tuple(by_loc[loc]) for loc in sorted(set(cols.loc.tolist()))))
+            keys[cid] = key
+            cached = self._results.get(cid)
+            if cached is None or cached[0] != key:
+                dirty.append(cid)
+        if not dirty:
+            return {}
+
+        stats = self._compute_all(timelines, victim_id, murder_window, travel, dirty)
+        changed: dict[str, DerivedStats] = {}
+        for cid in dirty:
+            self._results[cid] = (keys[cid], stats[cid])
+            changed[cid] = stats[cid]
+        return changed
+
+    def _compute_all(
+        self,
+        timelines: dict[str, CharacterTimeline],
+        victim_id: str | None,
+        murder_window: tuple[str, str] | None,
+        travel: Callable[[list[str]], np.ndarray] | None,
+        targets: list[str],
+    ) -> dict[str, DerivedStats]:
+        """
+        targets のキャラクターの DerivedStats。列に入れるのは targets の全ブロックと、targets が行った場所の
+        他のキャラクター（被害者を含む）のブロックだけ。それ以外のキャラクターの値はこの列では正しくないので返さない。
+        """
+        ids = list(self._columns)
+        n = len(ids)
+        if n == 0 or not targets:
+            return {}
+        wanted = set(targets)
+        places = np.unique(np.concatenate([self._columns[cid].loc for cid in targets]))
+        # キャラクターごとに列に入れるブロック（targets は全部、それ以外は places にあるものだけ）
+        picks = [
+            slice(None) if cid in wanted else np.isin(self._columns[cid].loc, places)
+            for cid in ids
+        ]
+        cols = [self._columns[cid] for cid in ids]
+        start = np.concatenate([c.start[k] for c, k in zip(cols, picks)])
+        end = np.concatenate([c.end[k] for c, k in zip(cols, picks)])
+        loc = np.concatenate([c.loc[k] for c, k in zip(cols, picks)])
+        sizes = np.array([len(c.start) if isinstance(k, slice) else int(k.sum()) for c, k in zip(cols, picks)],
+                         dtype=np.int64)
+        char = np.repeat(np.arange(n, dtype=np.int64), sizes)
+        end = np.maximum(end, start)
+        victim = ids.index(victim_id) if victim_id in self._columns else -1
+
+        # 1. キャラクター × 場所ごとに重なるブロックをまとめる
+        key, m_start, m_end = _merge_intervals(loc * n + char, start, end)
+        m_loc, m_char = key // n, key % n
+        m = len(m_start)
+
+        # 2. 場所ごとのイベント列で、人数の累積和と「人数 × 時間」「1人だけの時間」の累積積分
+        times = np.concatenate([m_start, m_end])
+        kind = np.concatenate([np.ones(m, dtype=np.int64), -np.ones(m, dtype=np.int64)])
+        ev_loc = np.concatenate([m_loc, m_loc])
+        order = np.lexsort((kind, times, ev_loc))  # 同時刻なら出る（-1）が先
+        count = np.cumsum(kind[order])
+        t_sorted, loc_sorted = times[order], ev_loc[order]
+        dur = np.zeros(len(order))
+        if len(order) > 1:
+            same = loc_sorted[1:] == loc_sorted[:-1]
+            dur[:-1] = np.where(same, t_sorted[1:] - t_sorted[:-1], 0.0)
+        people = np.concatenate([[0.0], np.cumsum(count * dur)])
+        alone = np.concatenate([[0.0], np.cumsum((count == 1) * dur)])
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        p_start, p_end = position[:m], position[m:]
+        present = m_end - m_start
+        alone_s = np.bincount(m_char, weights=alone[p_end] - alone[p_start], minlength=n)
+        witness_s = np.bincount(m_char, weights=people[p_end] - people[p_start] - present, minlength=n)
+        present_s = np.bincount(m_char, weights=present, minlength=n)
+
+        # 3. 被害者と同じ場所・同じ時間にいたブロック
+        is_victim = m_char == victim
+        v_loc, v_start, v_end = m_loc[is_victim], m_start[is_victim], m_end[is_victim]
+        meets_victim = _overlapping(loc, start, end, v_loc, v_start, v_end) & (char != victim)
+
+        # 4. 移動の実現可能性: 同じ人の連続するブロックで場所が変わるとき、間の時間が移動時間以上か
+        by_time = np.lexsort((start, char))
+        c_sorted, l_sorted = char[by_time], loc[by_time]
+        s_sorted, e_sorted = start[by_time], end[by_time]
+        moves = (c_sorted[1:] == c_sorted[:-1]) & (l_sorted[1:] != l_sorted[:-1])
+        required = np.zeros(len(moves))
+        if travel is not None and moves.any():
+            matrix = np.asarray(travel(self.location_ids()), dtype=np.float64)
+            required = matrix[l_sorted[:-1], l_sorted[1:]]
+        feasible = moves & (s_sorted[1:] - e_sorted[:-1] >= required)
+        transitions = np.bincount(c_sorted[:-1][moves], minlength=n) if len(moves) else np.zeros(n)
+        feasible_n = np.bincount(c_sorted[:-1][feasible], minlength=n) if len(moves) else np.zeros(n)
+
+        # 5. 犯行時間帯: 被害者と同じ場所にいた、または所在の分からない時間がある
+        accessible = np.zeros(n, dtype=bool)
+        if murder_window is not None:
+            w0, w1 = _parse_time(murder_window[0]), _parse_time(murder_window[1])
+            a_char, a_start, a_end = _merge_intervals(char, start, end)
+            covered = np.bincount(
+                a_char, weights=np.maximum(np.minimum(a_end, w1) - np.maximum(a_start, w0), 0.0), minlength=n
+            )
+            unaccounted = covered < (w1 - w0)
+            in_window = (m_end >= w0) & (m_start <= w1)
+            vw = is_victim & in_window
+            meets_in_window = _overlapping(
+                m_loc, np.maximum(m_start, w0), np.minimum(m_end, w1),
+                m_loc[vw], np.maximum(m_start[vw], w0), np.minimum(m_end[vw], w1),
+            ) & in_window & ~is_victim
+            accessible = unaccounted | (np.bincount(m_char[meets_in_window], minlength=n) > 0)
+            if victim >= 0:
+                accessible[victim] = False
+
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        result: dict[str, DerivedStats] = {}
+        for i, cid in enumerate(ids):
+            if cid not in wanted:
+                continue
+            c = cols[i]
+            hits = meets_victim[offsets[i]:offsets[i + 1]]
+            victim_blocks = [
+                bid for bid, hit, contacts in zip(c.block_ids, hits, c.contacts)
+                if cid != victim_id and (hit or victim_id in contacts)
+            ]
+            previous = timelines[cid].derived
+            result[cid] = DerivedStats(
+                alone_minutes_total=round(float(alone_s[i]) / 60, 2),
+                victim_contact_blocks=victim_blocks,
+                witness_density_score=round(float(witness_s[i] / present_s[i]), 3) if present_s[i] > 0 else 0.0,
+                movement_feasibility_score=(
+                    round(float(feasible_n[i] / transitions[i]), 3) if transitions[i] > 0 else 1.0
+                ),
+                murder_window_accessible=bool(accessible[i]),
+                suspect_score_total=previous.suspect_score_total,
+            )
+        return result
 
 
 def compute_derived(timeline: CharacterTimeline, victim_id: str, murder_window: tuple[str, str]) -> dict:
-    """CharacterTimeline.derived を計算。"""
-    return {
-        "alone_minutes_total": 0.0,
-        "victim_contact_blocks": [],
-        "witness_density_score": 0.0,
-        "movement_feasibility_score": 0.0,
-        "murder_window_accessible": False,
-        "suspect_score_total": 0.0,
-    }
+    """
+    CharacterTimeline.derived を計算（このタイムラインだけを入力にした DerivedEngine）。
+    他のキャラクターと合わせて計算するときは DerivedEngine.compute を使う。
+    """
+    stats = DerivedEngine().compute({timeline.character_id: timeline}, {}, victim_id, murder_window)
+    return stats[timeline.character_id].model_dump()
+
+
+def block_score(block: TimeBlock) -> float:
+    """1ブロック分の疑わしさ。"""
+    return block.interpretation.suspicion_delta - ALIBI_WEIGHT * block.interpretation.alibi_strength
+
+
+def suspect_score(timeline: CharacterTimeline) -> float:
+    """タイムライン全体の疑わしさ（ブロックの合計 + 犯行時間帯に近づけたか）。"""
+    score = sum(block_score(b) for b in timeline.time_blocks)
+    if timeline.derived.murder_window_accessible:
+        score += WINDOW_ACCESS_SCORE
+    return score
+
+
+class SuspectRanking:
+    """
+    キャラクターごとの疑わしさの合計と、(−スコア, character_id) のヒープ。
+    更新・削除はヒープに積むだけで古い項目は残しておき（遅延削除）、取り出すときに scores と違うものを捨てる。
+    1人分の更新は O(log n)、上位 k 人は O((k + 除外数 + 捨てる古い項目) log n)。
+    """
+
+    def __init__(self) -> None:
+        self.scores: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def rebuild(self, timelines: dict[str, CharacterTimeline]) -> None:
+        self.scores = {cid: suspect_score(tl) for cid, tl in timelines.items()}
+        self._compact()
+
+    def _compact(self) -> None:
+        self._heap = [(-score, cid) for cid, score in self.scores.items()]
+        heapq.heapify(self._heap)
+
+    def set(self, character_id: str, score: float) -> None:
+        self.scores[character_id] = score
+        heapq.heappush(self._heap, (-score, character_id))
+        if len(self._heap) > 2 * len(self.scores) + 64:
+            # 古い項目が増えすぎたら作り直す（更新 n 回に 1 回の O(n) なので償却 O(1)）
+            self._compact()
+
+    def add(self, character_id: str, delta: float) -> None:
+        """ブロックを1つ足したときなど、合計に delta を足す。"""
+        self.set(character_id, self.scores.get(character_id, 0.0) + delta)
+
+    def remove(self, character_id: str) -> None:
+        self.scores.pop(character_id, None)
+
+    def top(self, k: int, exclude: Iterable[str] = ()) -> list[tuple[str, float]]:
+        """スコアの高い順に k 人（exclude は飛ばす）。同点は character_id 順。"""
+        skip = set(exclude)
+        result: list[tuple[str, float]] = []
+        kept: list[tuple[float, str]] = []
+        seen: set[str] = set()
+        while self._heap and len(result) < k:
+            neg, cid = heapq.heappop(self._heap)
+            if cid in seen or self.scores.get(cid) != -neg:
+                continue  # 古い項目（同じスコアで積み直したものも含む）は捨てる
+            seen.add(cid)
+            kept.append((neg, cid))
+            if cid not in skip:
+                result.append((cid, -neg))
+        for item in kept:
+            heapq.heappush(self._heap, item)
+        return result
 
 
 def rank_suspects(
@@ -22,5 +360,10 @@ def rank_suspects(
     timelines: dict[str, CharacterTimeline],
     victim_id: str,
 ) -> list[tuple[str, float]]:
-    """疑わしさスコアでソートした (character_id, score) のリスト。"""
-    return []
+    """疑わしさスコアでソートした (character_id, score) のリスト。被害者は含めない。"""
+    ranking = SuspectRanking()
+    for c in characters:
+        if c.id != victim_id:
+            tl = timelines.get(c.id)
+            ranking.set(c.id, suspect_score(tl) if tl is not None else 0.0)
+    return ranking.top(len(ranking))
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+部分更新（PATCH）。
+
+- オブジェクトのボディは RFC 7396 JSON Merge Patch（null はその項目を既定値に戻す）
+- 配列のボディは RFC 6902 JSON Patch（add / remove / replace / move / copy / test。パスは RFC 6901 の JSON Pointer）
+
+apply_patch_logged は、当てた変更を storage_service の変更ログ（値を入れたパスと検証済みの値（JSON））としても返す。
+ストレージの WAL はドキュメント全体の代わりにこのログを記録する（大きさはドキュメントではなく変更の大きさに比例する）。
+モデルの項目の削除は既定値の set、move / copy は remove と insert / set に直して記録し、test は記録しない。
+
+どちらも元のモデルは書き換えず、パスの途中のモデル・リスト・辞書だけを作り直し（model_copy / 浅いコピー）、
+それ以外の部分は元のオブジェクトをそのまま共有する。Pydantic の検証はパッチで値を入れた位置の型（フィールドの型と
+その制約（ge / le など）、リストの要素型など）に対してだけ行うので、大きなタイムラインのブロック1つの項目を変えても検証するのはその値だけ。
+"""
+import types
+from typing import Annotated, Any, Callable, Union, get_args, get_origin
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic.fields import FieldInfo
+
+_adapters: dict[Any, TypeAdapter] = {}
+
+
+class PatchError(ValueError):
+    """パッチを当てられない（パスがない・型が合わない・test が一致しないなど）。"""
+
+
+def apply_patch(obj: BaseModel, patch: Any) -> BaseModel:
+    """patch が配列なら JSON Patch、オブジェクトならマージパッチとして obj に当てた新しいモデルを返す。"""
+    return apply_patch_logged(obj, patch)[0]
+
+
+def apply_patch_logged(obj: BaseModel, patch: Any) -> tuple[BaseModel, list[dict[str, Any]]]:
+    """apply_patch と同じ。(新しいモデル, 変更ログ) を返す。"""
+    log: list[dict[str, Any]] = []
+    if isinstance(patch, list):
+        return apply_json_patch(obj, patch, log), log
+    if isinstance(patch, dict):
+        return apply_merge_patch(obj, patch, log), log
+    raise PatchError("パッチはオブジェクト（マージパッチ）か配列（JSON Patch）で指定してください")
+
+
+# ---- 型 ----
+
+def _adapter(tp: Any) -> TypeAdapter:
+    adapter = _adapters.get(tp)
+    if adapter is None:
+        adapter = _adapters[tp] = TypeAdapter(tp)
+    return adapter
+
+
+def _dump(tp: Any, value: Any) -> Any:
+    return _adapter(tp).dump_python(value, mode="json")
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _sibling(path: str, token: str) -> str:
+    """path と同じ親の下の token のパス（配列の添字を解決したパスを作る）。"""
+    return f"{path.rpartition('/')[0]}/{token}"
+
+
+def _validate(tp: Any, value: Any, path: str) -> Any:
+    try:
+        return _adapter(tp).validate_python(value)
+    except ValidationError as e:
+        err = e.errors()[0]
+        where = "/".join(str(x) for x in err["loc"])
+        raise PatchError(f"{path or '/'}{'/' + where if where else ''}: {err['msg']}") from e
+
+
+def _field_type(field: FieldInfo) -> Any:
+    """フィールドに入れる値の型。Field(ge=...) などの制約も付けて、PUT と同じ値だけを通す。"""
+    if not field.metadata:
+        return field.annotation
+    return Annotated[(field.annotation, *field.metadata)]
+
+
+def _unwrap_optional(tp: Any) -> Any:
+    if get_origin(tp) is Annotated:
+        tp = get_args(tp)[0]
+    if get_origin(tp) in (Union, types.UnionType):
+        args = [a for a in get_args(tp) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return tp
+
+
+def _child_type(container: Any, tp: Any, token: str, path: str) -> Any:
+    if isinstance(container, BaseModel):
+        field = type(container).model_fields.get(token)
+        if field is None:
+            raise PatchError(f"{path}: 項目 {token} はありません")
+        return _field_type(field)
+    args = get_args(_unwrap_optional(tp))
+    if isinstance(container, list):
+        return args[0] if args else Any
+    if isinstance(container, dict):
+        return args[1] if len(args) == 2 else Any
+    raise PatchError(f"{path}: オブジェクトでも配列でもない値の中は指定できません")
+
+
+# ---- RFC 7396 ----
+
+def apply_merge_patch(obj: BaseModel, patch: dict[str, Any], log: list[dict[str, Any]] | None = None) -> BaseModel:
+    return _merge(obj, type(obj), patch, "", [] if log is None else log)
+
+
+def _strip_nulls(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _strip_nulls(v) for k, v in value.items() if v is not None}
+    return value
+
+
+def _merge(obj: Any, tp: Any, patch: Any, path: str, log: list[dict[str, Any]]) -> Any:
+    if not isinstance(patch, dict):
+        value = _validate(tp, patch, path)
+        log.append({"op": "set", "path": path, "value": _dump(tp, value)})
+        return value
+    if isinstance(obj, BaseModel):
+        fields = type(obj).model_fields
+        update: dict[str, Any] = {}
+        for key, value in patch.items():
+            child_path = f"{path}/{_escape(key)}"
+            field = fields.get(key)
+            if field is None:
+                raise PatchError(f"{child_path}: 項目 {key} はありません")
+            if value is None:
+                if field.is_required():
+                    raise PatchError(f"{child_path}: 必須の項目は削除できません")
+                update[key] = field.get_default(call_default_factory=True)
+                log.append({"op": "set", "path": child_path, "value": _dump(_field_type(field), update[key])})
+            else:
+                update[key] = _merge(getattr(obj, key), _field_type(field), value, child_path, log)
+        return obj.model_copy(update=update)
+    if isinstance(obj, dict):
+        value_tp = _child_type(obj, tp, "", path)
+        result = dict(obj)
+        for key, value in patch.items():
+            child_path = f"{path}/{_escape(key)}"
+            if value is None:
+                if key in result:
+                    del result[key]
+                    log.append({"op": "remove", "path": child_path})
+            else:
+                result[key] = _merge(obj.get(key), value_tp, value, child_path, log)
+        return result
+    # 対象がオブジェクトでなければ（未設定・配列・値）、空のオブジェクトにパッチを当てたものに置き換える
+    value = _validate(tp, _strip_nulls(patch), path)
+    log.append({"op": "set", "path": path, "value": _dump(tp, value)})
+    return value
+
+
+# ---- RFC 6902 ----
+
+def _parse_pointer(pointer: Any) -> list[str]:
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith("/")):
+        raise PatchError(f"JSON Pointer が不正です: {pointer!r}")
+    if not pointer:
+        return []
+    return [t.replace("~1", "/").replace("~0", "~") for t in pointer[1:].split("/")]
+
+
+def _index(container: list[Any], token: str, path: str, allow_end: bool) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise PatchError(f"{path}: 配列の添字が不正です")
+    i = int(token)
+    if i > len(container) or (i == len(container) and not allow_end):
+        raise PatchError(f"{path}: 配列の範囲外です")
+    return i
+
+
+def _get(obj: Any, tokens: list[str], path: str) -> Any:
+    for token in tokens:
+        if isinstance(obj, BaseModel):
+            if token not in type(obj).model_fields:
+                raise PatchError(f"{path}: 項目 {token} はありません")
+            obj = getattr(obj, token)
+        elif isinstance(obj, list):
+            obj = obj[_index(obj, token, path, allow_end=False)]
+        elif isinstance(obj, dict):
+            if token not in obj:
+                raise PatchError(f"{path}: キー {token} はありません")
+            obj = obj[token]
+        else:
+            raise PatchError(f"{path}: パスがありません")
+    return obj
+
+
+def _set_child(container: Any, token: str, value: Any) -> Any:
+    if isinstance(container, BaseModel):
+        return container.model_copy(update={token: value})
+    if isinstance(container, list):
+        result = list(container)
+        result[int(token)] = value
+        return result
+    result = dict(container)
+    result[token] = value
+    return result
+
+
+def _edit(
+    obj: Any,
+    tp: Any,
+    tokens: list[str],
+    path: str,
+    leaf: Callable[[Any, Any, str, str], Any],
+) -> Any:
+    """tokens の最後の親 container で leaf(container, 型, 最後のトークン, パス) を呼び、その結果を途中の親に入れ直す。"""
+    token = tokens[0]
+    if len(tokens) == 1:
+        return leaf(obj, tp, token, path)
+    if isinstance(obj, list):
+        token = str(_index(obj, token, path, allow_end=False))
+    child = _get(obj, [token], path)
+    child_tp = _child_type(obj, tp, token, path)
+    return _set_child(obj, token, _edit(child, child_tp, tokens[1:], path, leaf))
+
+
+def _add(value: Any, log: list[dict[str, Any]]) -> Callable[[Any, Any, str, str], Any]:
+    def leaf(container: Any, tp: Any, token: str, path: str) -> Any:
+        item_tp = _child_type(container, tp, token, path)
+        validated = _validate(item_tp, value, path)
+        if isinstance(container, list):
+            i = _index(container, token, path, allow_end=True)
+            result = list(container)
+            result.insert(i, validated)
+            log.append({"op": "insert", "path": _sibling(path, str(i)), "value": _dump(item_tp, validated)})
+            return result
+        log.append({"op": "set", "path": path, "value": _dump(item_tp, validated)})
+        return _set_child(container, token, validated)
+    return leaf
+
+
+def _replace(value: Any, log: list[dict[str, Any]]) -> Callable[[Any, Any, str, str], Any]:
+    def leaf(container: Any, tp: Any, token: str, path: str) -> Any:
+        if isinstance(container, list):
+            token = str(_index(container, token, path, allow_end=False))
+        _get(container, [token], path)
+        item_tp = _child_type(container, tp, token, path)
+        validated = _validate(item_tp, value, path)
+        log.append({"op": "set", "path": _sibling(path, _escape(token)), "value": _dump(item_tp, validated)})
+        return _set_child(container, token, validated)
+    return leaf
+
+
+def _remove(log: list[dict[str, Any]]) -> Callable[[Any, Any, str, str], Any]:
+    def leaf(container: Any, tp: Any, token: str, path: str) -> Any:
+        if isinstance(container, BaseModel):
+            field = type(container).model_fields.get(token)
+            if field is None:
+                raise PatchError(f"{path}: 項目 {token} はありません")
+            if field.is_required():
+                raise PatchError(f"{path}: 必須の項目は削除できません")
+            default = field.get_default(call_default_factory=True)
+            log.append({"op": "set", "path": path, "value": _dump(_field_type(field), default)})
+            return container.model_copy(update={token: default})
+        if isinstance(container, list):
+            i = _index(container, token, path, allow_end=False)
+            result = list(container)
+            del result[i]
+            log.append({"op": "remove", "path": _sibling(path, str(i))})
+            return result
+        if isinstance(container, dict):
+            if token not in container:
+                raise PatchError(f"{path}: キー {token} はありません")
+            result = dict(container)
+            del result[token]
+            log.append({"op": "remove", "path": path})
+            return result
+        raise PatchError(f"{path}: パスがありません")
+    return leaf
+
+
+def apply_json_patch(obj: BaseModel, operations: list[Any], log: list[dict[str, Any]] | None = None) -> BaseModel:
+    """操作を順に当てる。1つでも失敗したら PatchError（元の obj は変わらない）。"""
+    log = [] if log is None else log
+    root_tp = type(obj)
+    for n, op in enumerate(operations):
+        if not isinstance(op, dict) or "op" not in op or "path" not in op:
+            raise PatchError(f"操作 {n}: op と path が必要です")
+        name, path = op["op"], op["path"]
+        tokens = _parse_pointer(path)
+        if name in ("add", "replace", "test") and "value" not in op:
+            raise PatchError(f"操作 {n}: value が必要です")
+        if name in ("move", "copy"):
+            if "from" not in op:
+                raise PatchError(f"操作 {n}: from が必要です")
+            from_tokens = _parse_pointer(op["from"])
+            value = _get(obj, from_tokens, op["from"])
+            if name == "move":
+                if tokens[:len(from_tokens)] == from_tokens and len(tokens) > len(from_tokens):
+                    raise PatchError(f"操作 {n}: 自分の中へは移動できません")
+                if tokens == from_tokens:
+                    continue
+                if not from_tokens:
+                    raise PatchError(f"操作 {n}: ドキュメント全体は移動できません")
+                obj = _edit(obj, root_tp, from_tokens, op["from"], _remove(log))
+            name, op = "add", {**op, "value": value}
+        if name == "test":
+            current = _get(obj, tokens, path)
+            tp = root_tp
+            for i in range(len(tokens)):
+                parent = _get(obj, tokens[:i], path)
+                tp = _child_type(parent, tp, tokens[i], path)
+            if _validate(tp, op["value"], path) != current:
+                raise PatchError(f"操作 {n}: {path or '/'} の値が一致しません")
+            continue
+        if not tokens:
+            if name in ("add", "replace"):
+                obj = _validate(root_tp, op["value"], path)
+                log.append({"op": "set", "path": "", "value": _dump(root_tp, obj)})
+                continue
+            raise PatchError(f"操作 {n}: ドキュメント全体は削除できません")
+        if name == "add":
+            obj = _edit(obj, root_tp, tokens, path, _add(op["value"], log))
+        elif name == "replace":
+            obj = _edit(obj, root_tp, tokens, path, _replace(op["value"], log))
+        elif name == "remove":
+            obj = _edit(obj, root_tp, tokens, path, _remove(log))
+        else:
+            raise PatchError(f"操作 {n}: op {name!r} には対応していません")
+    return obj
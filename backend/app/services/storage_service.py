@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+インメモリ dict の永続化。
+各ルーターの `_characters` / `_nodes` などを PersistentTable に置き換え、
+変更（set / delete / clear）を追記型 WAL に記録する。
+大きなドキュメントの一部だけを変えたとき（PATCH・ブロックの追加など）は、値全体の代わりに変更ログ（patch）を記録し、
+復元時に replay_patch_log で当て直す。変更ログの操作（パスは RFC 6901 の JSON Pointer）:
+- {"op": "set", "path": p, "value": v}: オブジェクトの項目・配列の要素を v にする（p が "" ならドキュメント全体）
+- {"op": "insert", "path": p, "value": v}: 配列の位置 p（末尾の添字）に v を挿入する
+- {"op": "remove", "path": p}: オブジェクトのキー・配列の要素を削除する
+
+- WAL はセグメント（wal-<開始seq>.log）単位。スナップショット作成時に新セグメントへ切り替え、
+  スナップショットに含まれた古いセグメントは削除する（コンパクション）。
+- fsync はバックグラウンドスレッドが fsync_interval ごとにまとめて行う（グループコミット）。
+  自動保存（500ms デバウンス）の書き込み1回ごとにディスク同期は発生しない。
+- 起動時は snapshot.json を読み、seq がそれより新しい WAL レコードだけを再適用する。
+  検証はテーブル単位で TypeAdapter に一括で渡す。
+
+BackgroundJsonWriter は単一の JSON ファイル（contact_data.json など）を
+バックグラウンドでまとめて・アトミックに書き出す。
+"""
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel, TypeAdapter
+
+from app.config import get_settings
+
+SNAPSHOT_NAME = "snapshot.json"
+SEGMENT_PREFIX = "wal-"
+SEGMENT_SUFFIX = ".log"
+
+
+def _dump_value(value: Any) -> str:
+    if isinstance(value, BaseModel):
+        return value.model_dump_json()
+    return json.dumps(value, ensure_ascii=False)
+
+
+def replay_patch_log(doc: Any, log: list[dict[str, Any]]) -> Any:
+    """変更ログを JSON（model_dump(mode="json") の形）に当てた結果。doc はその場で書き換える。"""
+    for op in log:
+        path = op["path"]
+        if not path:
+            doc = op["value"]
+            continue
+        tokens = [t.replace("~1", "/").replace("~0", "~") for t in path[1:].split("/")]
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        token = tokens[-1]
+        if op["op"] == "insert":
+            parent.insert(int(token), op["value"])
+        elif op["op"] == "remove":
+            if isinstance(parent, list):
+                del parent[int(token)]
+            else:
+                parent.pop(token, None)
+        elif isinstance(parent, list):
+            parent[int(token)] = op["value"]
+        else:
+            parent[token] = op["value"]
+    return doc
+
+
+def _fsync_dir(directory: Path) -> None:
+    """rename を確定させるためにディレクトリを fsync する（対応 OS のみ）。"""
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class PersistentTable(dict):
+    """変更をストレージエンジンに通知する dict。読み取りは通常の dict と同じ。"""
+
+    def __init__(self, engine: "StorageEngine", name: str):
+        super().__init__()
+        self._engine = engine
+        self.name = name
+        self._patching = threading.local()  # patching() 中のキー -> 変更ログ（スレッドごと）
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        super().__setitem__(key, value)
+        logs = getattr(self._patching, "logs", None)
+        if logs and key in logs:
+            self._engine.record_patch(self.name, key, logs.pop(key))
+        else:
+            self._engine.record_set(self.name, key, value)
+
+    def set_patched(self, key: str, value: Any, log: list[dict[str, Any]]) -> None:
+        """
+        key を value にする。value は今の値に log（patch_service の変更ログ）を当てたものであること。
+        WAL には値全体ではなく log を記録する。
+        """
+        super().__setitem__(key, value)
+        self._engine.record_patch(self.name, key, log)
+
+    @contextmanager
+    def patching(self, key: str, log: list[dict[str, Any]]):
+        """この中での key への次の代入を set_patched として記録する（update_* をそのまま使う PATCH 用）。"""
+        logs = getattr(self._patching, "logs", None)
+        if logs is None:
+            logs = self._patching.logs = {}
+        logs[key] = log
+        try:
+            yield
+        finally:
+            logs.pop(key, None)
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self._engine.record_delete(self.name, key)
+
+    def pop(self, key: str, *default: Any) -> Any:
+        if key in self:
+            value = super().pop(key)
+            self._engine.record_delete(self.name, key)
+            return value
+        return super().pop(key, *default)
+
+    def popitem(self) -> tuple[str, Any]:
+        key, value = super().popitem()
+        self._engine.record_delete(self.name, key)
+        return key, value
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return super().__getitem__(key)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self) -> None:
+        super().clear()
+        self._engine.record_clear(self.name)
+
+    def _load(self, items: dict[str, Any]) -> None:
+        """復元用。WAL には記録しない。"""
+        super().update(items)
+
+
+class StorageEngine:
+    """保存先を持たないエンジン。従来どおりプロセス終了でデータは消える。"""
+
+    def table(self, name: str, model: type[BaseModel]) -> PersistentTable:
+        return PersistentTable(self, name)
+
+    def record_set(self, table: str, key: str, value: Any) -> None:
+        pass
+
+    def record_delete(self, table: str, key: str) -> None:
+        pass
+
+    def record_patch(self, table: str, key: str, log: list[dict[str, Any]]) -> None:
+        pass
+
+    def record_clear(self, table: str) -> None:
+        pass
+
+    def sync(self) -> None:
+        pass
+
+    def snapshot(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class WalStorage(StorageEngine):
+    """追記型 WAL + 定期スナップショットによるストレージエンジン。"""
+
+    def __init__(self, directory: str | Path, fsync_interval: float = 0.2, snapshot_every: int = 5000):
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._fsync_interval = fsync_interval
+        self._snapshot_every = snapshot_every
+
+        self._lock = threading.Lock()  # WAL 追記とテーブル一覧
+        self._maint_lock = threading.Lock()  # sync / snapshot / close の直列化
+        self._tables: dict[str, PersistentTable] = {}
+        self._pending: dict[str, dict[str, Any]] = {}  # 未登録テーブルの生データ
+        self._seq = 0
+        self._since_snapshot = 0
+        self._dirty = False
+        self._closed = False
+
+        self._replay()
+        self._segment_start = self._seq + 1
+        self._wal = self._open_segment(self._segment_start)
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="wal-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # ---- 復元 ----
+
+    def _segment_path(self, start_seq: int) -> Path:
+        return self._dir / f"{SEGMENT_PREFIX}{start_seq:012d}{SEGMENT_SUFFIX}"
+
+    def _segments(self) -> list[Path]:
+        return sorted(self._dir.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+
+    def _replay(self) -> None:
+        base = 0
+        snap = self._dir / SNAPSHOT_NAME
+        if snap.exists():
+            with open(snap, encoding="utf-8") as f:
+                data = json.load(f)
+            base = int(data.get("seq", 0))
+            self._pending = {name: dict(items) for name, items in (data.get("tables") or {}).items()}
+        self._seq = base
+
+        for path in self._segments():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # 書き込み途中でクラッシュした末尾行
+                    seq = rec["s"]
+                    if seq <= base:
+                        continue
+                    items = self._pending.setdefault(rec["t"], {})
+                    op = rec["o"]
+                    if op == "set":
+                        items[rec["k"]] = rec["v"]
+                    elif op == "del":
+                        items.pop(rec["k"], None)
+                    elif op == "patch":
+                        if rec["k"] in items:
+                            items[rec["k"]] = replay_patch_log(items[rec["k"]], rec["v"])
+                    elif op == "clear":
+                        items.clear()
+                    self._seq = max(self._seq, seq)
+                    self._since_snapshot += 1
+
+    def _open_segment(self, start_seq: int):
+        path = self._segment_path(start_seq)
+        if path.exists():
+            # 末尾の不完全な行を切り詰めてから追記する
+            with open(path, "rb+") as f:
+                data = f.read()
+                cut = data.rfind(b"\n") + 1
+                if cut != len(data):
+                    f.truncate(cut)
+        return open(path, "a", encoding="utf-8")
+
+    def table(self, name: str, model: type[BaseModel]) -> PersistentTable:
+        t = PersistentTable(self, name)
+        with self._lock:
+            raw = self._pending.pop(name, None)
+            if raw:
+                t._load(TypeAdapter(dict[str, model]).validate_python(raw))
+            self._tables[name] = t
+        return t
+
+    # ---- 書き込み ----
+
+    def _append(self, table: str, op: str, key: str | None = None, payload: str | None = None) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._seq += 1
+            line = json.dumps({"s": self._seq, "t": table, "o": op, "k": key}, ensure_ascii=False)
+            if payload is not None:
+                line = line[:-1] + ',"v":' + payload + "}"
+            self._wal.write(line + "\n")
+            self._dirty = True
+            self._since_snapshot += 1
+
+    def record_set(self, table: str, key: str, value: Any) -> None:
+        self._append(table, "set", key, _dump_value(value))
+
+    def record_delete(self, table: str, key: str) -> None:
+        self._append(table, "del", key)
+
+    def record_patch(self, table: str, key: str, log: list[dict[str, Any]]) -> None:
+        self._append(table, "patch", key, json.dumps(log, ensure_ascii=False))
+
+    def record_clear(self, table: str) -> None:
+        self._append(table, "clear")
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self._fsync_interval):
+            try:
+                self.sync()
+                if self._since_snapshot >= self._snapshot_every:
+                    self.snapshot()
+            except Exception as e:
+                print(f"[WARNING] Storage flush failed: {e}")
+
+    def sync(self) -> None:
+        """バッファ済みの WAL をディスクへ同期する。"""
+        with self._maint_lock:
+            with self._lock:
+                if not self._dirty or self._closed:
+                    return
+                self._wal.flush()
+                fd = self._wal.fileno()
+                self._dirty = False
+            os.fsync(fd)
+
+    # ---- コンパクション ----
+
+    def snapshot(self) -> None:
+        """全テーブルをスナップショットに書き出し、取り込み済みの WAL セグメントを削除する。"""
+        with self._maint_lock:
+            with self._lock:
+                if self._closed:
+                    return
+                self._wal.flush()
+                os.fsync(self._wal.fileno())
+                self._wal.close()
+                upto = self._seq
+                tables = {name: dict(t) for name, t in self._tables.items()}
+                pending = {name: dict(items) for name, items in self._pending.items()}
+                self._since_snapshot = 0
+                self._dirty = False
+                self._segment_start = upto + 1
+                self._wal = self._open_segment(self._segment_start)
+
+            # 直列化はロック外で行い、リクエスト側の書き込みを止めない。
+            # 各ルーターは保存済みのモデルをその場で書き換えず新しいモデルを代入するので、
+            # ここで写したテーブルの中身は upto 時点の状態のまま（patch は冪等でないのでこれが前提）。
+            tmp = self._dir / (SNAPSHOT_NAME + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write('{"version":1,"seq":%d,"tables":{' % upto)
+                first_table = True
+                for name, items in list(tables.items()) + list(pending.items()):
+                    if not first_table:
+                        f.write(",")
+                    first_table = False
+                    f.write(json.dumps(name) + ":{")
+                    f.write(",".join(
+                        json.dumps(k, ensure_ascii=False) + ":" + _dump_value(v) for k, v in items.items()
+                    ))
+                    f.write("}")
+                f.write("}}")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._dir / SNAPSHOT_NAME)
+            _fsync_dir(self._dir)
+
+            for path in self._segments():
+                if path != self._segment_path(self._segment_start):
+                    path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._stop.set()
+        if self._flusher.is_alive() and threading.current_thread() is not self._flusher:
+            self._flusher.join()
+        self.sync()
+        with self._maint_lock, self._lock:
+            self._closed = True
+            self._wal.close()
+
+
+class BackgroundJsonWriter:
+    """
+    JSON ファイルをバックグラウンドスレッドで書き出す。
+    - submit() はデータを預けるだけで、ディスク I/O はしない（リクエストはすぐ返せる）。
+    - 最後の submit から delay 秒待ってから書くので、連続した submit は最新の1回にまとまる。
+    - 一時ファイルに書いて fsync してから os.replace で置き換えるので、途中でクラッシュしても
+      既存のファイルは壊れない。
+    - インデントなしの JSON。compress=True なら gzip。
+    submit に渡すデータは書き込みまで変更しないこと（呼び出し側でコピーを渡す）。
+    """
+
+    MAX_DEFER_FACTOR = 10
+
+    def __init__(self, path: str | Path, compress: bool = False, delay: float = 0.5):
+        self.path = Path(path)
+        self._compress = compress
+        self._delay = delay
+        self._lock = threading.Lock()  # _pending と起動
+        self._write_lock = threading.Lock()  # 書き込みの直列化
+        self._pending: Any = None
+        self._has_pending = False
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        atexit.register(self.flush)
+
+    def submit(self, data: Any) -> None:
+        with self._lock:
+            self._pending = data
+            self._has_pending = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"writer-{self.path.name}", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            # submit が続く間は待ち、落ち着いてから最新のデータだけを書く。
+            # submit が途切れなくても delay * MAX_DEFER_FACTOR 秒で一度は書く。
+            deadline = time.monotonic() + self._delay * self.MAX_DEFER_FACTOR
+            while True:
+                self._wake.clear()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._wake.wait(min(self._delay, remaining)):
+                    break
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[WARNING] Failed to write {self.path}: {e}")
+
+    def flush(self) -> None:
+        """預かっているデータがあれば今すぐ書く。"""
+        with self._write_lock:
+            with self._lock:
+                if not self._has_pending:
+                    return
+                data, self._pending, self._has_pending = self._pending, None, False
+            payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            if self._compress:
+                payload = gzip.compress(payload, mtime=0)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            _fsync_dir(self.path.parent)
+
+
+@lru_cache
+def get_storage() -> StorageEngine:
+    settings = get_settings()
+    if not settings.storage_dir:
+        return StorageEngine()
+    return WalStorage(
+        settings.storage_dir,
+        fsync_interval=settings.storage_fsync_interval_ms / 1000,
+        snapshot_every=settings.storage_snapshot_every,
+    )
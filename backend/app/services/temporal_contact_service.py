@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+時点ごとのグループ（時間付き連結成分）。
+
+build_contact_timeline はクラスタ（transitive_window_seconds で連鎖する接触のまとまり）単位で
+連結成分を取るので、長いクラスタの前半に A-B、後半に B-C があると、ブロック全体で A,B,C が1グループになる。
+ここでは接触1回を「ペアが [ts - hold, ts + hold) の間つながっている」辺とみなし（PairIntervals）、
+各時刻に生きている辺だけで連結成分を取る。
+
+構築はオフライン動的連結性（辺の生存区間のセグメント木 + ロールバック付き union-find）:
+- 区間の端点で時間軸を素区間に分け、各辺をそれが覆う O(log n) 個の木ノードに置く
+- 木を DFS し、ノードに入るときにその辺を union、出るときにロールバック
+- 葉（素区間）に着いた時点の union-find がその区間のグループ。前の葉から union / ロールバックで触れた根の
+  成分だけを前の区間のグループと比べ（成分のメンバーは根ごとのリストで持ち、union で連結・ロールバックで切り詰める）、
+  同じなら区間を伸ばし、違えば変わったグループだけを入れ替える
+構築のコストは union / ロールバック O(辺数 · log(端点数) · log n) と、触れた成分の並べ直し、
+構成が変わった区間ごとのグループ一覧のコピー（O(その時点のグループ数)）。TemporalConnectivity は
+取り込みのたびではなく最初の問い合わせで作るので、このコストはその問い合わせが払う（build_ms）。
+結果は「グループ構成が一定の区間」の昇順リストなので、時点 t のグループは二分探索1回、
+[t1, t2] の変化はその範囲の区間を並べるだけで求まる。
+"""
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, Iterable
+
+Partition = tuple[tuple[str, ...], ...]
+
+
+class TemporalConnectivity:
+    """グループ構成が一定の区間 [starts[i], ends[i]) と、その間のグループ partitions[i]。"""
+
+    def __init__(self, intervals: Iterable[tuple[str, str, float, float]]) -> None:
+        t0 = time.perf_counter()
+        self.starts: list[float] = []
+        self.ends: list[float] = []
+        self.partitions: list[Partition] = []
+        self._build(list(intervals))
+        self.build_ms = round((time.perf_counter() - t0) * 1000, 3)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _build(self, intervals: list[tuple[str, str, float, float]]) -> None:
+        if not intervals:
+            return
+        # ID 順に番号を振る（番号の順 = ID の順なので、番号のままグループを正規化して比較できる）
+        names = sorted({x for a, b, _, _ in intervals for x in (a, b)})
+        code = {name: i for i, name in enumerate(names)}
+        coords = sorted({t for _, _, s, e in intervals for t in (s, e)})
+        pos = {t: i for i, t in enumerate(coords)}
+        leaves = len(coords) - 1
+
+        tree: dict[int, list[tuple[int, int]]] = {}
+
+        def insert(node: int, lo: int, hi: int, left: int, right: int, edge: tuple[int, int]) -> None:
+            if right <= lo or hi <= left:
+                return
+            if left <= lo and hi <= right:
+                tree.setdefault(node, []).append(edge)
+                return
+            mid = (lo + hi) // 2
+            insert(2 * node, lo, mid, left, right, edge)
+            insert(2 * node + 1, mid, hi, left, right, edge)
+
+        for a, b, s, e in intervals:
+            insert(1, 0, leaves, pos[s], pos[e], (code[a], code[b]))
+
+        parent = list(range(len(names)))
+        # 根ごとの成分のメンバー（union で小さい方を後ろに足し、ロールバックで切り詰める）
+        members = [[x] for x in range(len(names))]
+        history: list[int] = []  # union で親を付け替えた根（ロールバック用）
+        touched: set[int] = set()  # 前の葉から後に union / ロールバックした根
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                x = parent[x]
+            return x
+
+        def union(a: int, b: int) -> None:
+            ra, rb = find(a), find(b)
+            if ra == rb:
+                return
+            if len(members[ra]) < len(members[rb]):
+                ra, rb = rb, ra
+            parent[rb] = ra
+            members[ra].extend(members[rb])
+            history.append(rb)
+            touched.add(ra)
+            touched.add(rb)
+
+        def rollback(mark: int) -> None:
+            while len(history) > mark:
+                rb = history.pop()
+                ra = parent[rb]
+                del members[ra][len(members[ra]) - len(members[rb]):]
+                parent[rb] = rb
+                touched.add(ra)
+                touched.add(rb)
+
+        # 直前に出力した区間のグループ（2人以上の成分。頂点番号の昇順のタプル）を出力の順
+        # （人数の多い順、同数なら番号順）に並べたキーと、同じ位置のメンバー名のタプル。頂点 → そのグループ
+        order: list[tuple[int, tuple[int, ...]]] = []
+        order_names: list[tuple[str, ...]] = []
+        group_of: dict[int, tuple[int, ...]] = {}
+
+        def emit(leaf: int) -> None:
+            # 構成が変わりうるのは、touched の頂点を含む成分だけ（それらが前と同じなら他の成分も同じ）
+            start, end = coords[leaf], coords[leaf + 1]
+            changed: dict[int, tuple[int, ...] | None] = {}
+            by_root: dict[int, tuple[int, ...] | None] = {}
+            for x in touched:
+                root = find(x)
+                if root not in by_root:
+                    comp = members[root]
+                    by_root[root] = tuple(sorted(comp)) if len(comp) > 1 else None
+                if group_of.get(x) != by_root[root]:
+                    changed[x] = by_root[root]
+            touched.clear()
+            if not changed and self.ends and self.ends[-1] == start:
+                self.ends[-1] = end
+                return
+            for x in changed:
+                old = group_of.get(x)
+                if old is None:
+                    continue
+                i = bisect_left(order, (-len(old), old))
+                if i < len(order) and order[i][1] == old:
+                    del order[i]
+                    del order_names[i]
+                    for y in old:
+                        if group_of.get(y) is old:
+                            del group_of[y]
+            for group in changed.values():
+                if group is None:
+                    continue
+                key = (-len(group), group)
+                i = bisect_left(order, key)
+                if i < len(order) and order[i] == key:
+                    continue
+                order.insert(i, key)
+                order_names.insert(i, tuple(names[x] for x in group))
+                for y in group:
+                    group_of[y] = group
+            self.starts.append(start)
+            self.ends.append(end)
+            self.partitions.append(tuple(order_names))
+
+        def visit(node: int, lo: int, hi: int) -> None:
+            mark = len(history)
+            for a, b in tree.get(node, ()):
+                union(a, b)
+            if hi - lo == 1:
+                emit(lo)
+            else:
+                mid = (lo + hi) // 2
+                visit(2 * node, lo, mid)
+                visit(2 * node + 1, mid, hi)
+            rollback(mark)
+
+        visit(1, 0, leaves)
+
+    # ---- 問い合わせ ----
+
+    def snapshot(self, t: float) -> Partition:
+        """時刻 t（epoch 秒）のグループ。誰もつながっていなければ空。O(log n)。"""
+        i = bisect_right(self.starts, t) - 1
+        if i < 0 or t >= self.ends[i]:
+            return ()
+        return self.partitions[i]
+
+    def changes(self, t_from: float, t_to: float) -> list[dict[str, Any]]:
+        """
+        (t_from, t_to] でグループ構成が変わった時刻と、変わった後のグループ。
+        formed は新しくできたグループ、dissolved はなくなったグループ。O(log n + k)。
+        """
+        result: list[dict[str, Any]] = []
+        previous = self.snapshot(t_from)
+        # 区間は最初の接触から最後の接触まで隙間なく並ぶ（誰もいない間は空のグループ）ので、
+        # 変化点は各区間の始まりと、最後の区間の終わり
+        lo = bisect_right(self.starts, t_from)
+        hi = bisect_right(self.starts, t_to)
+        points: list[tuple[float, Partition]] = [(self.starts[i], self.partitions[i]) for i in range(lo, hi)]
+        if self.ends and t_from < self.ends[-1] <= t_to:
+            points.append((self.ends[-1], ()))
+        for at, groups in points:
+            if groups == previous:
+                continue
+            before, after = set(previous), set(groups)
+            result.append({
+                "at": at,
+                "groups": groups,
+                "formed": [g for g in groups if g not in before],
+                "dissolved": [g for g in previous if g not in after],
+            })
+            previous = groups
+        return result
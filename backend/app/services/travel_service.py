@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+場所間の最短移動時間（全点対最短路）。
+
+Location.adjacent の辺（一方通行でなければ両向き）から隣接行列を作り、
+numpy で Floyd–Warshall（経由地 k ごとに dist = min(dist, dist[:, k] + dist[k, :])）を回して
+L × L の秒数行列を作っておく。作った後の「A から B まで何秒か」は辞書1回と配列参照1回。
+
+辺を1本も持たない（どこからも辺が張られていない）場所は「移動時間が分からない」扱いで seconds は None、
+辺のある場所どうしで道がなければ math.inf（移動できない）。
+"""
+from typing import Iterable
+
+import numpy as np
+
+from app.models import Location
+
+
+class TravelMatrix:
+    """ids[i] から ids[j] への最短移動秒数 dist[i, j]。"""
+
+    def __init__(self, locations: Iterable[Location]) -> None:
+        locations = list(locations)
+        known = {loc.id for loc in locations}
+        edges: list[tuple[str, str, float]] = []
+        for loc in locations:
+            for edge in loc.adjacent:
+                if edge.to_location_id not in known or edge.to_location_id == loc.id:
+                    continue
+                edges.append((loc.id, edge.to_location_id, edge.travel_seconds))
+                if not edge.one_way:
+                    edges.append((edge.to_location_id, loc.id, edge.travel_seconds))
+        self.ids = sorted({x for a, b, _ in edges for x in (a, b)})
+        self.index = {location_id: i for i, location_id in enumerate(self.ids)}
+        n = len(self.ids)
+        dist = np.full((n, n), np.inf)
+        np.fill_diagonal(dist, 0.0)
+        for a, b, seconds in edges:
+            i, j = self.index[a], self.index[b]
+            dist[i, j] = min(dist[i, j], seconds)
+        for k in range(n):
+            np.minimum(dist, dist[:, k, None] + dist[None, k, :], out=dist)
+        self.dist = dist
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def seconds(self, from_location_id: str, to_location_id: str) -> float | None:
+        """from から to への最短移動秒数。移動できなければ math.inf、移動時間が分からなければ None。"""
+        if from_location_id == to_location_id:
+            return 0.0
+        i = self.index.get(from_location_id)
+        j = self.index.get(to_location_id)
+        if i is None or j is None:
+            return None
+        return float(self.dist[i, j])
+
+    def matrix(self, location_ids: list[str]) -> np.ndarray:
+        """
+        location_ids の順に並べた秒数行列。移動時間が分からない組は 0（制約なし）、
+        移動できない組は inf。DerivedEngine.compute の travel にそのまま渡せる。
+        """
+        idx = np.array([self.index.get(location_id, -1) for location_id in location_ids], dtype=np.int64)
+        known = idx >= 0
+        result = np.zeros((len(idx), len(idx)))
+        result[np.ix_(known, known)] = self.dist[np.ix_(idx[known], idx[known])]
+        np.fill_diagonal(result, 0.0)
+        return result
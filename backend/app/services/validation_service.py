@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+タイムラインの整合性チェック（スイープライン）。
+
+全キャラクターの TimeBlock と、Event の参加者ごとの (参加者, time_range) を
+(キャラクター, 開始時刻) の順に1回ソートし、キャラクターごとに時刻順に走査する。
+走査中は「まだ終わっていないブロック / イベント」を終了時刻のヒープで持ち、
+新しい区間が始まったときに残っているものだけが重なる相手になる。
+残っているブロックは場所ごと、イベントは場所の集合ごとにまとめておき、新しい区間では矛盾になりうるまとまり
+（ブロックなら別の場所、イベントなら自分の場所を含まない集合）の中だけを見る。
+1件あたりのコストは O(log n + 同時に開いているまとまりの数 + 見つかった矛盾の数)。
+同じ場所で重なっているだけのブロックが多くても走査は増えない。
+
+見つける矛盾（details の kind）:
+- location_overlap: 同じ人物が重なる時間に別の場所にいる
+- event_participant_elsewhere: イベントの参加者が、その時間に自分のタイムラインでは別の場所にいる
+- impossible_transition: 連続するブロックの間の時間が、場所の間の移動時間より短い、または道がない（travel を渡したときだけ）
+"""
+import heapq
+import math
+from typing import Any, Callable, Iterable
+
+from app.models import CharacterTimeline, Event
+
+_BLOCK = 0
+_EVENT = 1
+
+
+def find_timeline_conflicts(
+    timelines: Iterable[CharacterTimeline],
+    events: Iterable[Event] = (),
+    travel: Callable[[str, str], float | None] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    矛盾の一覧。各要素は { kind, character_id, ... }（block_ids / event_id などで該当箇所を指す）。
+    travel(a, b) は場所 a から b への移動に必要な秒数（移動できなければ math.inf、分からなければ None）。
+    """
+    items: list[tuple[str, float, int, float, Any]] = []
+    for tl in timelines:
+        for block in tl.time_blocks:
+            start, end = block.time_range.start.timestamp(), block.time_range.end.timestamp()
+            items.append((tl.character_id, start, _BLOCK, end, block))
+    for event in events:
+        start, end = event.time_range.start.timestamp(), event.time_range.end.timestamp()
+        if not event.location_ids:
+            continue
+        for participant in dict.fromkeys(event.participants):
+            items.append((participant, start, _EVENT, end, event))
+    items.sort(key=lambda x: (x[0], x[1], x[2]))
+
+    conflicts: list[dict[str, Any]] = []
+    i = 0
+    while i < len(items):
+        character_id = items[i][0]
+        j = i
+        while j < len(items) and items[j][0] == character_id:
+            j += 1
+        _sweep(character_id, items[i:j], travel, conflicts)
+        i = j
+    return conflicts
+
+
+class _Active:
+    """まだ終わっていない区間を、キー（場所 / イベントの場所の集合）ごとにまとめて持つ。"""
+
+    __slots__ = ("_heap", "groups")
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, int, Any]] = []  # (終了時刻, 通し番号, キー)
+        self.groups: dict[Any, dict[int, tuple[float, Any]]] = {}  # キー -> 通し番号 -> (開始時刻, ブロック / イベント)
+
+    def expire(self, t: float) -> None:
+        while self._heap and self._heap[0][0] <= t:
+            _, n, key = heapq.heappop(self._heap)
+            group = self.groups[key]
+            del group[n]
+            if not group:
+                del self.groups[key]
+
+    def add(self, key: Any, n: int, start: float, end: float, obj: Any) -> None:
+        heapq.heappush(self._heap, (end, n, key))
+        self.groups.setdefault(key, {})[n] = (start, obj)
+
+
+def _sweep(
+    character_id: str,
+    items: list[tuple[str, float, int, float, Any]],
+    travel: Callable[[str, str], float | None] | None,
+    conflicts: list[dict[str, Any]],
+) -> None:
+    """1人分（開始時刻順）の走査。"""
+    active_blocks = _Active()  # location_id ごと
+    active_events = _Active()  # frozenset(location_ids) ごと
+    previous: tuple[float, Any] | None = None  # 直前（開始時刻順）のブロック
+    for n, (_, start, kind, end, obj) in enumerate(items):
+        active_blocks.expire(start)
+        active_events.expire(start)
+        if kind == _BLOCK:
+            block = obj
+            # 残っているものは other_start <= start < other_end。長さ 0 の区間は開始が同時なら重ならない
+            for location_id, group in active_blocks.groups.items():
+                if location_id == block.location_id:
+                    continue
+                for other_start, other in group.values():
+                    if other_start < end:
+                        conflicts.append({
+                            "kind": "location_overlap",
+                            "character_id": character_id,
+                            "block_ids": [other.block_id, block.block_id],
+                            "location_ids": [other.location_id, block.location_id],
+                            "start": block.time_range.start.isoformat(),
+                            "end": min(block.time_range.end, other.time_range.end).isoformat(),
+                        })
+            for location_ids, group in active_events.groups.items():
+                if block.location_id in location_ids:
+                    continue
+                for event_start, event in group.values():
+                    if event_start < end:
+                        _check_event(character_id, event, block, conflicts)
+            if previous is not None and travel is not None:
+                _check_transition(character_id, previous, block, start, travel, conflicts)
+            previous = (end, block)
+            if end > start:
+                active_blocks.add(block.location_id, n, start, end, block)
+        else:
+            event = obj
+            location_ids = frozenset(event.location_ids)
+            for location_id, group in active_blocks.groups.items():
+                if location_id in location_ids:
+                    continue
+                for block_start, block in group.values():
+                    if block_start < end:
+                        _check_event(character_id, event, block, conflicts)
+            if end > start:
+                active_events.add(location_ids, n, start, end, event)
+
+
+def _check_event(character_id: str, event: Event, block: Any, conflicts: list[dict[str, Any]]) -> None:
+    if block.location_id not in event.location_ids:
+        conflicts.append({
+            "kind": "event_participant_elsewhere",
+            "character_id": character_id,
+            "event_id": event.id,
+            "block_id": block.block_id,
+            "location_id": block.location_id,
+            "event_location_ids": list(event.location_ids),
+        })
+
+
+def _check_transition(
+    character_id: str,
+    previous: tuple[float, Any],
+    block: Any,
+    start: float,
+    travel: Callable[[str, str], float | None],
+    conflicts: list[dict[str, Any]],
+) -> None:
+    prev_end, prev = previous
+    gap = start - prev_end
+    # 重なっている場合は location_overlap として報告済み
+    if prev.location_id == block.location_id or gap < 0:
+        return
+    required = travel(prev.location_id, block.location_id)
+    if required is not None and gap < required:
+        conflicts.append({
+            "kind": "impossible_transition",
+            "character_id": character_id,
+            "block_ids": [prev.block_id, block.block_id],
+            "from_location_id": prev.location_id,
+            "to_location_id": block.location_id,
+            "gap_seconds": gap,
+            "required_seconds": None if math.isinf(required) else required,
+        })
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+接触CSVの一括取り込み（POST /api/import/csv/batch と同じ処理）と、同じ行を1ファイルにして
+parse_bt_contacts_stream（POST /api/import/csv と同じ処理）で取り込んだ場合の比較ベンチマーク。
+
+    cd backend
+    PYTHONPATH=. python benchmarks/bench_contact_batch.py --rows 2000000 --files 8
+
+CSV は一時ディレクトリに書き出し、どちらもファイルから読む（アップロードの受信は含まない）。
+一括はワーカー（spawn）の起動を含めない。--workers 1 ならワーカーを使わず1プロセスで順に読む。
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from app.services.import_service import (
+    build_contact_timeline_from_files,
+    iter_file_chunks,
+    parse_bt_contact_file,
+    parse_bt_contacts_stream,
+)
+
+HEADER = "user_id,user_id_display_name,contacted_user_id,contacted_user_id_display_name,timestamp,is_contacted\n"
+STEPS = [0, 0, 0, 1, 1, 2, 3, 5, 12, 40]
+
+
+def write_files(directory: str, rows: int, files: int, users: int, seed: int) -> tuple[str, list[str]]:
+    """同じ行を、全部入りの1ファイルと、行を files 個に振り分けた（端末ごとのような）ファイルに書く。"""
+    rnd = random.Random(seed)
+    ids = [f"user{i:04d}" for i in range(users)]
+    t = datetime(2025, 12, 30, 5, 0, 0, tzinfo=timezone.utc)
+    single_path = os.path.join(directory, "all.csv")
+    paths = [os.path.join(directory, f"part{i}.csv") for i in range(files)]
+    outs = [open(p, "w", encoding="utf-8") for p in paths]
+    with open(single_path, "w", encoding="utf-8") as single:
+        for out in [single, *outs]:
+            out.write(HEADER)
+        for _ in range(rows):
+            t += timedelta(seconds=rnd.choice(STEPS), microseconds=rnd.randrange(100_000))
+            u, v = rnd.sample(ids, 2)
+            line = f"{u},{u},{v},{v},{t.isoformat()},true\n"
+            single.write(line)
+            outs[rnd.randrange(files)].write(line)
+    for out in outs:
+        out.close()
+    return single_path, paths
+
+
+def _canon(timeline: list[dict]) -> list[tuple]:
+    return [(b["start"], b["end"], sorted(sorted(g) for g in b["groups"])) for b in timeline]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    ap.add_argument("--files", type=int, default=8)
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        single_path, paths = write_files(directory, args.rows, args.files, args.users, args.seed)
+        print(f"rows={args.rows:,} files={args.files} workers={args.workers} cpus={os.cpu_count()}")
+
+        t0 = time.perf_counter()
+        with open(single_path, "rb") as f:
+            single = parse_bt_contacts_stream(iter_file_chunks(f))
+        single_time = time.perf_counter() - t0
+        print(f"single: {single_time:.2f}s blocks={len(single['contact_timeline']):,}")
+
+        t0 = time.perf_counter()
+        if args.workers > 1:
+            with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                list(pool.map(int, range(args.workers)))  # ワーカーの起動を済ませておく
+                t0 = time.perf_counter()
+                parsed = list(pool.map(parse_bt_contact_file, paths))
+        else:
+            parsed = [parse_bt_contact_file(p) for p in paths]
+        t1 = time.perf_counter()
+        batch = build_contact_timeline_from_files(parsed)
+        t2 = time.perf_counter()
+        print(f" batch: {t2 - t0:.2f}s (parse {t1 - t0:.2f}s + merge {t2 - t1:.2f}s) "
+              f"blocks={len(batch['contact_timeline']):,}")
+        print(f"speedup: {single_time / (t2 - t0):.1f}x")
+        same = _canon(single["contact_timeline"]) == _canon(batch["contact_timeline"])
+        print("outputs match" if same else "OUTPUTS DIFFER")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+build_contact_timeline の python / numpy エンジン比較ベンチマーク。
+
+    cd backend
+    PYTHONPATH=. python benchmarks/bench_contact_timeline.py --rows 10000000
+
+行はジェネレータで流すので、入力 CSV 全体をメモリに載せない（取り込み時と同じ条件）。
+--check を付けると両エンジンの出力（ブロック境界とグループの集合）が一致するかも確かめる。
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator
+
+from app.services.import_service import build_contact_timeline
+
+# 同時刻に複数の接触が記録され、ときどき長い空白が入る分布
+STEPS = [0, 0, 0, 1, 1, 2, 3, 5, 12, 40]
+
+
+def gen_rows(n: int, users: int, seed: int) -> Iterator[dict[str, Any]]:
+    rnd = random.Random(seed)
+    ids = [f"user{i:04d}" for i in range(users)]
+    t = datetime(2025, 12, 30, 5, 0, 0, tzinfo=timezone.utc)
+    for _ in range(n):
+        t += timedelta(seconds=rnd.choice(STEPS), microseconds=rnd.randrange(100_000))
+        u, v = rnd.sample(ids, 2)
+        yield {"user_id": u, "contacted_user_id": v, "timestamp": t.isoformat()}
+
+
+def _normalize(blocks: list[dict[str, Any]]) -> list[tuple]:
+    return [(b["start"], b["end"], frozenset(frozenset(g) for g in b["groups"])) for b in blocks]
+
+
+def run(engine: str, rows: int, users: int, seed: int) -> tuple[float, list[dict[str, Any]]]:
+    t0 = time.perf_counter()
+    blocks = build_contact_timeline(gen_rows(rows, users, seed), gap_minutes=0.5, engine=engine)
+    return time.perf_counter() - t0, blocks
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--engines", default="python,numpy")
+    ap.add_argument("--check", action="store_true")
+    args = ap.parse_args()
+
+    # 生成コストを差し引くため、ジェネレータだけを回した時間も測る
+    t0 = time.perf_counter()
+    for _ in gen_rows(args.rows, args.users, args.seed):
+        pass
+    gen_time = time.perf_counter() - t0
+    print(f"rows={args.rows:,} users={args.users} generator={gen_time:.2f}s")
+
+    results: dict[str, list[dict[str, Any]]] = {}
+    times: dict[str, float] = {}
+    for engine in args.engines.split(","):
+        elapsed, blocks = run(engine, args.rows, args.users, args.seed)
+        times[engine] = elapsed - gen_time
+        print(f"{engine:>7}: {times[engine]:.2f}s (+generator) blocks={len(blocks):,}")
+        if args.check:
+            results[engine] = blocks
+        del blocks
+
+    if "python" in times and "numpy" in times:
+        print(f"speedup: {times['python'] / times['numpy']:.1f}x")
+    if args.check and len(results) == 2:
+        a, b = results.values()
+        print("outputs match" if _normalize(a) == _normalize(b) else "OUTPUTS DIFFER")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import os
+
+# テストは常にインメモリ（.env の STORAGE_DIR を使わない）
+os.environ["STORAGE_DIR"] = ""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import (
+    background,
+    characters,
+    claims,
+    events,
+    evidence,
+    graph,
+    locations,
+    scenarios,
+    secrets,
+    timeline,
+)
+from app.main import app
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """各テストを空のデータから始める。"""
+    for table in (
+        background._backgrounds,
+        characters._characters,
+        claims._claims,
+        events._events,
+        evidence._evidence,
+        graph._nodes,
+        graph._edges,
+        graph._logics,
+        locations._locations,
+        scenarios._scenarios,
+        secrets._secrets,
+        timeline._timelines,
+    ):
+        table.clear()
+    graph.rebuild_indexes()
+    timeline.rebuild_indexes()
+    locations.reset_travel()
+    yield
+
+
+@pytest.fixture
+def client() -> TestClient:
+    return TestClient(app)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta
+
+from app.services.contact_index_service import ContactTimelineIndex, parse_time
+from app.services.import_service import build_contact_timeline, canonical_groups, extend_contact_timeline
+
+_T0 = datetime(2024, 1, 1, 9, 0, 0)
+
+
+def _rows(rnd: random.Random, n: int, people: int = 7) -> list[dict]:
+    rows = []
+    t = _T0
+    for _ in range(n):
+        t += timedelta(seconds=rnd.choice([0, 1, 3, 8, 12, 40, 90, 400]))
+        u, v = rnd.sample([f"u{i}" for i in range(people)], 2)
+        rows.append({"user_id": u, "contacted_user_id": v, "timestamp": t.isoformat()})
+    return rows
+
+
+def _window(rnd: random.Random, timeline: list[dict]) -> tuple[float | None, float | None]:
+    lo, hi = parse_time(timeline[0]["start"]) - 60, parse_time(timeline[-1]["end"]) + 60
+    t_from = rnd.choice([None, rnd.uniform(lo, hi)])
+    t_to = rnd.choice([None, rnd.uniform(t_from or lo, hi)])
+    return t_from, t_to
+
+
+def _overlaps(block: dict, t_from: float | None, t_to: float | None) -> bool:
+    return ((t_from is None or parse_time(block["end"]) >= t_from)
+            and (t_to is None or parse_time(block["start"]) <= t_to))
+
+
+def _state(index: ContactTimelineIndex) -> tuple:
+    def postings(d):
+        return {k: (p.blocks, p.groups, p.starts, p.ends) for k, p in d.items()}
+    return (
+        index.starts,
+        index.ends,
+        postings(index.by_character),
+        postings(index.by_pair),
+        {size: (level.keys, level.buckets) for size, level in index.levels.items()},
+    )
+
+
+def test_time_range_query_matches_scan():
+    rnd = random.Random(13)
+    for _ in range(20):
+        timeline = build_contact_timeline(_rows(rnd, rnd.randrange(1, 200)), 0.5, 10.0)
+        index = ContactTimelineIndex()
+        index.rebuild(timeline)
+        for _ in range(20):
+            t_from, t_to = _window(rnd, timeline)
+            lo, hi = index.overlapping(t_from, t_to)
+            assert list(range(lo, hi)) == [i for i, b in enumerate(timeline) if _overlaps(b, t_from, t_to)]
+
+
+def test_append_rebuild_matches_full_rebuild():
+    rnd = random.Random(14)
+    for _ in range(20):
+        rows = _rows(rnd, rnd.randrange(2, 300))
+        cut = rnd.randrange(1, len(rows))
+        old = build_contact_timeline(rows[:cut], 0.5, 10.0)
+        index = ContactTimelineIndex()
+        index.rebuild(old)
+        # 取り込みと同じく、最後のブロック以降だけを作り直す
+        new = extend_contact_timeline(list(old), rows[cut:], 0.5, 10.0)
+        index.rebuild(new, len(old) - 1)
+
+        fresh = ContactTimelineIndex()
+        fresh.rebuild(new)
+        assert _state(index) == _state(fresh)
+
+
+def test_character_and_pair_queries_match_scan():
+    rnd = random.Random(15)
+    people = [f"u{i}" for i in range(7)]
+    for _ in range(15):
+        timeline = build_contact_timeline(_rows(rnd, rnd.randrange(1, 200)), 0.5, 10.0)
+        index = ContactTimelineIndex()
+        index.rebuild(timeline)
+        for _ in range(10):
+            t_from, t_to = _window(rnd, timeline)
+            hits = [(i, b) for i, b in enumerate(timeline) if _overlaps(b, t_from, t_to)]
+            a, c = rnd.sample(people, 2)
+
+            presence = [(i, g) for i, b in hits for g, group in enumerate(b["groups"]) if a in group]
+            assert index.presence(a, t_from, t_to) == presence
+
+            companions: dict[str, dict[str, float]] = {}
+            for i, g in presence:
+                for other in timeline[i]["groups"][g]:
+                    if other != a:
+                        entry = companions.setdefault(other, {"blocks": 0, "seconds": 0.0})
+                        entry["blocks"] += 1
+                        entry["seconds"] += index.seconds(i, t_from, t_to)
+            assert index.companions(a, t_from, t_to) == companions
+
+            together = [i for i, b in hits if any(a in g and c in g for g in b["groups"])]
+            assert index.together(a, c, t_from, t_to) == together
+
+            before = [i for i, b in enumerate(timeline)
+                      if (t_to is None or parse_time(b["start"]) <= t_to) and any(a in g and c in g for g in b["groups"])]
+            assert index.last_together(a, c, t_to) == (before[-1] if before else None)
+
+
+def test_pyramid_buckets_match_scan():
+    rnd = random.Random(16)
+    for _ in range(10):
+        timeline = build_contact_timeline(_rows(rnd, rnd.randrange(1, 200), people=4), 0.5, 10.0)
+        index = ContactTimelineIndex()
+        index.rebuild(timeline)
+        for size, level in index.levels.items():
+            expected: dict[int, dict[tuple, list[float]]] = {}
+            for block in timeline:
+                start, end = parse_time(block["start"]), parse_time(block["end"])
+                config = tuple(tuple(g) for g in canonical_groups(block["groups"]))
+                for key in range(int(start // size), int(end // size) + 1):
+                    entry = expected.setdefault(key, {}).setdefault(config, [0.0, 0])
+                    entry[0] += max(0.0, min(end, (key + 1) * size) - max(start, key * size))
+                    entry[1] += 1
+            assert level.keys == sorted(expected)
+            for key, bucket in zip(level.keys, level.buckets):
+                configs = expected[key]
+                covered = sum(v[0] for v in configs.values())
+                assert bucket["blocks"] == sum(v[1] for v in configs.values())
+                assert bucket["coverage"] == round(min(covered / size, 1.0), 4)
+                dominant = configs[tuple(tuple(g) for g in bucket["groups"])]
+                assert dominant[0] == max(v[0] for v in configs.values())
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.services.contact_index_service import parse_time
+from app.services.copresence_service import CopresenceMatrix
+from app.services.import_service import build_contact_timeline, compact_contact_timeline, expand_compacted_block
+
+
+def _timeline(rnd: random.Random) -> list[dict]:
+    t = datetime(2024, 1, 1, 9, 0, 0)
+    rows = []
+    for _ in range(rnd.randrange(1, 200)):
+        t += timedelta(seconds=rnd.choice([0, 1, 3, 8, 12, 40, 90]))
+        u, v = rnd.sample([f"u{i}" for i in range(5)], 2)
+        rows.append({"user_id": u, "contacted_user_id": v, "timestamp": t.isoformat()})
+    return build_contact_timeline(rows, 0.5, 10.0)
+
+
+def _brute(timeline: list[dict], ids: list[str], t_from: float | None, t_to: float | None):
+    n = len(ids)
+    code = {cid: i for i, cid in enumerate(ids)}
+    seconds, blocks = np.zeros((n, n)), np.zeros((n, n), dtype=np.int64)
+    for block in (p for b in timeline for p in expand_compacted_block(b)):
+        start, end = parse_time(block["start"]), parse_time(block["end"])
+        if (t_from is not None and end < t_from) or (t_to is not None and start > t_to):
+            continue
+        lo = start if t_from is None else max(start, t_from)
+        hi = end if t_to is None else min(end, t_to)
+        weight = max(0.0, hi - lo)
+        for group in block["groups"]:
+            for a in group:
+                for b in group:
+                    seconds[code[a], code[b]] += weight
+                    blocks[code[a], code[b]] += 1
+    return seconds, blocks
+
+
+def test_copresence_matrix_matches_per_block_sum():
+    rnd = random.Random(18)
+    for _ in range(20):
+        timeline = _timeline(rnd)
+        if rnd.random() < 0.5:
+            compact_contact_timeline(timeline, 30.0)
+        matrix = CopresenceMatrix(timeline)
+        lo, hi = parse_time(timeline[0]["start"]) - 30, parse_time(timeline[-1]["end"]) + 30
+        for _ in range(5):
+            t_from = rnd.choice([None, rnd.uniform(lo, hi)])
+            t_to = rnd.choice([None, rnd.uniform(t_from or lo, hi)])
+            seconds, blocks = matrix.compute(t_from, t_to)
+            expected_seconds, expected_blocks = _brute(timeline, matrix.ids, t_from, t_to)
+            assert np.allclose(seconds, expected_seconds)
+            assert (blocks == expected_blocks).all()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import random
+
+from app.api import graph as graph_api
+
+
+def _node(node_id: str, node_type: str = "Evidence") -> dict:
+    return {"node_id": node_id, "node_type": node_type, "reference_id": node_id}
+
+
+def _edge(edge_id: str, source: str, target: str, edge_type: str = "supports") -> dict:
+    return {"edge_id": edge_id, "source_node_id": source, "target_node_id": target, "edge_type": edge_type}
+
+
+def _partition(mapping: dict[str, str]) -> set[frozenset[str]]:
+    groups: dict[str, set[str]] = {}
+    for node_id, label in mapping.items():
+        groups.setdefault(label, set()).add(node_id)
+    return {frozenset(g) for g in groups.values()}
+
+
+def _brute_components() -> set[frozenset[str]]:
+    adj: dict[str, set[str]] = {n: set() for n in graph_api._nodes}
+    for e in graph_api._edges.values():
+        adj.setdefault(e.source_node_id, set()).add(e.target_node_id)
+        adj.setdefault(e.target_node_id, set()).add(e.source_node_id)
+    seen: set[str] = set()
+    result: set[frozenset[str]] = set()
+    for start in graph_api._nodes:
+        if start in seen:
+            continue
+        stack, comp = [start], set()
+        while stack:
+            v = stack.pop()
+            if v in comp:
+                continue
+            comp.add(v)
+            stack.extend(adj.get(v, ()))
+        seen |= comp
+        result.add(frozenset(comp & set(graph_api._nodes)))
+    return result
+
+
+def test_connected_components_match_brute_force(client):
+    rnd = random.Random(2)
+    next_edge = 0
+    for _ in range(400):
+        op = rnd.random()
+        nodes = list(graph_api._nodes)
+        if op < 0.3 or len(nodes) < 2:
+            client.post("/api/graph/nodes", json=_node(f"n{rnd.randrange(30)}"))
+        elif op < 0.7:
+            a, b = rnd.sample(nodes, 2)
+            assert client.post("/api/graph/edges", json=_edge(f"e{next_edge}", a, b)).status_code == 201
+            next_edge += 1
+        elif op < 0.9 and graph_api._edges:
+            edge_id = rnd.choice(list(graph_api._edges))
+            assert client.delete(f"/api/graph/edges/{edge_id}").status_code == 204
+        else:
+            node_id = rnd.choice(nodes)
+            assert client.delete(f"/api/graph/nodes/{node_id}", params={"cascade": True}).status_code == 204
+        assert _partition(graph_api.compute_connected_components()) == _brute_components()
+
+
+def test_failed_json_import_leaves_graph_indexes_consistent(client):
+    for bad_graph in (None, {"nodes": [_node("x"), {"bad": 1}]}):
+        for node_id in ("a", "b"):
+            client.post("/api/graph/nodes", json=_node(node_id))
+        client.post("/api/graph/edges", json=_edge("e1", "a", "b"))
+
+        client.post("/api/import/json", json={"graph": bad_graph})
+        for node_id in ("a", "b"):
+            client.post("/api/graph/nodes", json=_node(node_id))
+
+        # 取り込み前の a-b のつながりが残っていない
+        assert _partition(graph_api.compute_connected_components()) == _brute_components()
+        res = client.get("/api/graph/nodes/a/edges")
+        assert res.status_code == 200
+        assert res.json() == []
+
+
+def test_logic_label_survives_edge_delete_and_re_add(client):
+    for node_id in ("A", "B"):
+        client.post("/api/graph/nodes", json=_node(node_id))
+    client.post("/api/graph/edges", json=_edge("e1", "A", "B"))
+    labels = client.post("/api/graph/compute-logics").json()["node_to_logic"]
+    logic_id = labels["A"]
+    assert labels["B"] == logic_id
+    client.put(f"/api/graph/logics/{logic_id}", json={"logic_id": logic_id, "name": "Main plot", "init_node_id": "B"})
+
+    client.delete("/api/graph/edges/e1")
+    # init_node_id のある側が元のラベルを名乗る
+    assert graph_api.compute_connected_components()["B"] == logic_id
+    client.post("/api/graph/edges", json=_edge("e1", "A", "B"))
+
+    res = client.post("/api/graph/compute-logics").json()
+    assert res["node_to_logic"] == {"A": logic_id, "B": logic_id}
+    assert [l["name"] for l in res["logics"]] == ["Main plot"]
+
+
+def test_split_keeps_label_on_init_node_side(client):
+    for node_id in ("A", "B", "C", "D"):
+        client.post("/api/graph/nodes", json=_node(node_id))
+    for i, (a, b) in enumerate([("A", "B"), ("B", "C"), ("C", "D")]):
+        client.post("/api/graph/edges", json=_edge(f"e{i}", a, b))
+    logic_id = client.post("/api/graph/compute-logics").json()["node_to_logic"]["A"]
+
+    # 大きい側が元のラベルを残す
+    client.delete("/api/graph/edges/e0")
+    labels = graph_api.compute_connected_components()
+    assert labels["B"] == labels["D"] == logic_id != labels["A"]
+
+    # init_node_id のある側は小さくても元のラベルを残す
+    client.post("/api/graph/edges", json=_edge("e0", "A", "B"))
+    client.put(f"/api/graph/logics/{logic_id}", json={"logic_id": logic_id, "name": "L", "init_node_id": "D"})
+    client.delete("/api/graph/edges/e2")
+    labels = graph_api.compute_connected_components()
+    assert labels["D"] == logic_id != labels["A"]
+    assert labels["A"] == labels["C"]
+
+
+def _ids(res) -> set[str]:
+    assert res.status_code == 200, res.text
+    return {e["edge_id"] for e in res.json()}
+
+
+def _check_node_edges(client, node_id: str) -> None:
+    out = {e.edge_id for e in graph_api._edges.values() if e.source_node_id == node_id}
+    inc = {e.edge_id for e in graph_api._edges.values() if e.target_node_id == node_id}
+    base = f"/api/graph/nodes/{node_id}/edges"
+    assert _ids(client.get(base, params={"direction": "out"})) == out
+    assert _ids(client.get(base, params={"direction": "in"})) == inc
+    assert _ids(client.get(base)) == out | inc
+
+
+def test_node_edges_match_edge_scan(client):
+    rnd = random.Random(3)
+    nodes = [f"n{i}" for i in range(10)]
+    for node_id in nodes:
+        client.post("/api/graph/nodes", json=_node(node_id))
+    for _ in range(300):
+        op = rnd.random()
+        if op < 0.5:
+            # 同じ edge_id で付け替えることもある
+            a, b = rnd.sample(nodes, 2)
+            client.post("/api/graph/edges", json=_edge(f"e{rnd.randrange(40)}", a, b))
+        elif op < 0.75 and graph_api._edges:
+            client.delete(f"/api/graph/edges/{rnd.choice(list(graph_api._edges))}")
+        elif op < 0.85:
+            node_id = rnd.choice(nodes)
+            if node_id in graph_api._nodes:
+                assert client.delete(f"/api/graph/nodes/{node_id}", params={"cascade": True}).status_code == 204
+                assert all(node_id not in (e.source_node_id, e.target_node_id) for e in graph_api._edges.values())
+        else:
+            client.post("/api/graph/nodes", json=_node(rnd.choice(nodes)))
+        if graph_api._nodes:
+            _check_node_edges(client, rnd.choice(list(graph_api._nodes)))
+    for node_id in graph_api._nodes:
+        _check_node_edges(client, node_id)
+
+
+def _fresh_layout(client) -> dict:
+    graph_api._layout_cache.clear()
+    graph_api._layout_response = None
+    return client.get("/api/graph/layout").json()
+
+
+def test_cached_layout_matches_fresh_layout(client):
+    rnd = random.Random(4)
+    nodes = [f"n{i}" for i in range(12)]
+    for _ in range(120):
+        op = rnd.random()
+        if op < 0.3:
+            node = _node(rnd.choice(nodes)) | {"event_id": rnd.choice([None, "ev1", "ev2"])}
+            client.post("/api/graph/nodes", json=node)
+        elif op < 0.6 and len(graph_api._nodes) >= 2:
+            a, b = rnd.sample(list(graph_api._nodes), 2)
+            client.post("/api/graph/edges", json=_edge(f"e{rnd.randrange(30)}", a, b))
+        elif op < 0.75 and graph_api._edges:
+            client.delete(f"/api/graph/edges/{rnd.choice(list(graph_api._edges))}")
+        elif op < 0.85 and graph_api._nodes:
+            node_id = rnd.choice(list(graph_api._nodes))
+            client.delete(f"/api/graph/nodes/{node_id}", params={"cascade": rnd.random() < 0.5})
+        elif graph_api._nodes:
+            # event_id だけ変えても、そのロジックのレイアウトは作り直す
+            node_id = rnd.choice(list(graph_api._nodes))
+            client.put(f"/api/graph/nodes/{node_id}", json=_node(node_id) | {"event_id": rnd.choice([None, "ev1", "ev2"])})
+        cached = client.get("/api/graph/layout").json()
+        assert cached == _fresh_layout(client)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import random
+
+from app.services.graph_service import DerivationIndex, ReachabilityIndex, find_contradictions
+
+
+def _reaching_brute(sources: set[str], edges: list[tuple[str, str]], nodes: list[str]) -> dict[str, set[str]]:
+    succ: dict[str, list[str]] = {}
+    for u, v in edges:
+        succ.setdefault(u, []).append(v)
+    result: dict[str, set[str]] = {v: set() for v in nodes}
+    for s in sources:
+        stack, seen = [s], {s}
+        while stack:
+            u = stack.pop()
+            result[u].add(s)
+            for v in succ.get(u, ()):
+                if v not in seen:
+                    seen.add(v)
+                    stack.append(v)
+    return result
+
+
+def test_reachability_index_matches_search():
+    rnd = random.Random(5)
+    nodes = [f"n{i}" for i in range(14)]
+    index = ReachabilityIndex()
+    edges: list[tuple[str, str]] = []
+    sources: set[str] = set()
+    for _ in range(600):
+        op = rnd.random()
+        if op < 0.45:
+            # 多重辺・閉路も作る
+            edge = (rnd.choice(nodes), rnd.choice(nodes))
+            edges.append(edge)
+            index.add_edge(*edge)
+        elif op < 0.75 and edges:
+            edge = edges.pop(rnd.randrange(len(edges)))
+            index.remove_edge(*edge)
+        else:
+            v = rnd.choice(nodes)
+            on = rnd.random() < 0.5
+            if on:
+                sources.add(v)
+            else:
+                sources.discard(v)
+            index.set_source(v, on)
+        expected = _reaching_brute(sources, edges, nodes)
+        assert {v: set(index.sources_reaching(v)) for v in nodes} == expected
+        assert {v for v in nodes if index.is_reached(v)} == {v for v in nodes if expected[v]}
+
+
+def _derive_brute(base: dict[str, int], edges: list[tuple[str, str, str]]) -> tuple[dict, dict]:
+    est = dict(base)
+    changed = True
+    while changed:
+        changed = False
+        for u, v, kind in edges:
+            if kind == DerivationIndex.DERIVE and u in est and (v not in est or est[u] < est[v]):
+                est[v] = est[u]
+                changed = True
+    ref: dict[str, int] = {}
+    for u, v, kind in edges:
+        if kind == DerivationIndex.REFUTE and u in est and (v not in ref or est[u] < ref[v]):
+            ref[v] = est[u]
+    return est, ref
+
+
+def test_derivation_index_matches_naive_fixpoint():
+    rnd = random.Random(6)
+    nodes = [f"n{i}" for i in range(12)]
+    index = DerivationIndex()
+    edges: list[tuple[str, str, str]] = []
+    base: dict[str, int] = {}
+    for _ in range(600):
+        op = rnd.random()
+        if op < 0.4:
+            edge = (rnd.choice(nodes), rnd.choice(nodes), rnd.choice([DerivationIndex.DERIVE] * 3 + [DerivationIndex.REFUTE]))
+            edges.append(edge)
+            index.add_edge(*edge)
+        elif op < 0.7 and edges:
+            edge = edges.pop(rnd.randrange(len(edges)))
+            index.remove_edge(*edge)
+        else:
+            v = rnd.choice(nodes)
+            phase = rnd.choice([None, 1, 2, 3, 4])
+            if phase is None:
+                base.pop(v, None)
+            else:
+                base[v] = phase
+            index.set_base(v, phase)
+        est, ref = _derive_brute(base, edges)
+        assert {v: index.established(v) for v in nodes if index.established(v) is not None} == est
+        assert {v: index.refuted(v) for v in nodes if index.refuted(v) is not None} == ref
+
+
+def _reach(succ: dict[str, list[str]], start: str) -> set[str]:
+    stack, seen = [start], {start}
+    while stack:
+        for w in succ.get(stack.pop(), ()):
+            if w not in seen:
+                seen.add(w)
+                stack.append(w)
+    return seen
+
+
+def _is_path(succ: dict[str, list[str]], path: list[str]) -> bool:
+    return all(b in succ.get(a, ()) for a, b in zip(path, path[1:]))
+
+
+def test_find_contradictions_matches_reachability():
+    rnd = random.Random(7)
+    for _ in range(60):
+        nodes = [f"n{i}" for i in range(rnd.randrange(2, 12))]
+        succ: dict[str, list[str]] = {}
+        for _ in range(rnd.randrange(len(nodes) * 2)):
+            succ.setdefault(rnd.choice(nodes), []).append(rnd.choice(nodes))
+        refutes = [(f"r{i}", *rnd.sample(nodes, 2)) for i in range(rnd.randrange(4))]
+        contradicts = [(f"c{i}", *rnd.sample(nodes, 2)) for i in range(rnd.randrange(4))]
+        reach = {v: _reach(succ, v) for v in nodes}
+        result = find_contradictions(succ, refutes, contradicts)
+
+        expected = {eid for eid, a, y in refutes if any(a in reach[x] and y in reach[x] for x in nodes)}
+        assert {r["edge_id"] for r in result["support_refute"]} == expected
+        for r in result["support_refute"]:
+            x, y = r["node_id"], r["target_node_id"]
+            assert r["support_path"][0] == x and r["support_path"][-1] == y and _is_path(succ, r["support_path"])
+            assert r["refute_path"][0] == x and r["refute_path"][-1] == y and _is_path(succ, r["refute_path"][:-1])
+
+        expected = {eid for eid, a, b in contradicts if b in reach[a] and a in reach[b]}
+        assert {r["edge_id"] for r in result["contradicts_in_cycle"]} == expected
+        for r in result["contradicts_in_cycle"]:
+            path = r["path"]
+            assert path[0] == path[-1] == r["source_node_id"] and r["target_node_id"] in path
+            assert _is_path(succ, path)
+
+        cycles = {
+            frozenset(w for w in reach[v] if v in reach[w])
+            for v in nodes
+            if any(v in reach[w] for w in succ.get(v, ()))
+        }
+        assert {frozenset(r["node_ids"]) for r in result["cycle"]} == cycles
+        for r in result["cycle"]:
+            assert r["path"][0] == r["path"][-1] and _is_path(succ, r["path"])
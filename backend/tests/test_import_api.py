@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import io
+import random
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.api import characters
+from app.api import import_api
+from app.api import timeline as timeline_api
+from app.services.contact_index_service import ContactTimelineIndex
+from app.services.import_service import PairIntervals, canonical_groups
+
+_HEADER = "user_id,user_id_display_name,contacted_user_id,contacted_user_id_display_name,timestamp,is_contacted\n"
+
+
+@pytest.fixture(autouse=True)
+def contact_state(monkeypatch):
+    """接触タイムラインを空にし、contact_data.json には書かない。"""
+    monkeypatch.setattr(import_api, "_contact_timeline", [])
+    monkeypatch.setattr(import_api, "_name_map", {})
+    monkeypatch.setattr(import_api, "_contact_index", ContactTimelineIndex())
+    monkeypatch.setattr(import_api, "_pair_intervals", PairIntervals())
+    monkeypatch.setattr(import_api, "_temporal", None)
+    monkeypatch.setattr(import_api, "_copresence", None)
+    monkeypatch.setattr(import_api, "_save_contact_data", lambda: None)
+
+
+def _csv_lines(n: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+    t = datetime(2024, 1, 1, 9, 0, 0)
+    lines = []
+    for _ in range(n):
+        t += timedelta(seconds=rnd.choice([0, 2, 5, 12, 45]))
+        u, v = rnd.sample(["a", "b", "c", "d", "e"], 2)
+        lines.append(f"{u},{u.upper()},{v},{v.upper()},{t.isoformat()}Z,{rnd.choice(['true', 'true', 'false'])}\n")
+    return lines
+
+
+def _upload(client, lines: list[str], append: bool):
+    body = (_HEADER + "".join(lines)).encode()
+    res = client.post("/api/import/csv", params={"append": append}, files={"file": ("c.csv", body, "text/csv")})
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def _canon(timeline: list[dict]) -> list[tuple]:
+    return [(b["start"], b["end"], canonical_groups(b["groups"])) for b in timeline]
+
+
+def test_csv_append_matches_single_import(client):
+    lines = _csv_lines(400, seed=10)
+    _upload(client, lines, append=False)
+    full = _canon(import_api._contact_timeline)
+
+    import_api._contact_timeline = []
+    for i in range(0, len(lines), 90):
+        before = import_api._contact_timeline
+        snapshot = list(before)
+        summary = _upload(client, lines[i:i + 90], append=i > 0)["summary"]
+        # 追記は新しいリストに作られ、元のリストは書き換えない
+        assert before == snapshot
+        if i > 0:
+            assert summary["late_rows"] == 0
+    assert _canon(import_api._contact_timeline) == full
+
+    res = client.get("/api/import/contact-timeline")
+    assert _canon(res.json()["timeline"]) == full
+
+
+def test_csv_import_keeps_existing_characters(client):
+    client.post("/api/characters", json={"id": "a", "name": "Alice", "role": "culprit", "secret_ids": ["s1"]})
+    _upload(client, _csv_lines(50, seed=11), append=False)
+    _upload(client, _csv_lines(50, seed=12), append=True)
+
+    a = characters._characters["a"]
+    assert (a.name, a.role.value, a.secret_ids) == ("Alice", "culprit", ["s1"])
+    assert {"b", "c", "d", "e"} <= set(characters._characters)
+
+
+def test_csv_batch_matches_single_import(client):
+    lines = _csv_lines(600, seed=13)
+    _upload(client, lines, append=False)
+    full = _canon(import_api._contact_timeline)
+
+    # 端末ごとに分かれたファイル（最初の半分は1つ目のアップロード、残りは zip にまとめて追記）
+    import_api._contact_timeline = []
+    parts = [lines[i::3] for i in range(3)]
+    first = [("f%d.csv" % i, (_HEADER + "".join(p[:100])).encode()) for i, p in enumerate(parts)]
+    res = client.post("/api/import/csv/batch", files=[("files", (name, body, "text/csv")) for name, body in first])
+    assert res.status_code == 200, res.text
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for i, p in enumerate(parts):
+            zf.writestr(f"dev{i}.csv", _HEADER + "".join(p[100:]))
+    res = client.post(
+        "/api/import/csv/batch",
+        params={"append": True},
+        files=[("files", ("logs.zip", buf.getvalue(), "application/zip"))],
+    )
+    assert res.status_code == 200, res.text
+    assert res.json()["summary"]["files"] == 3
+    assert res.json()["summary"]["late_rows"] == 0
+    assert _canon(import_api._contact_timeline) == full
+
+
+def _gps_csv(rows: list[tuple[str, str, str, str]]) -> bytes:
+    return ("user_id,timestamp,lat,lng\n" + "".join(f"{u},{t},{la},{ln}\n" for u, t, la, ln in rows)).encode()
+
+
+def test_gps_import_skips_non_finite_coordinates(client):
+    client.post("/api/locations", json={"id": "hall", "name": "Hall", "geofence": {"lat": 35.0, "lng": 139.0, "radius_m": 50}})
+    t = datetime(2024, 1, 1, 9, 0, 0)
+    rows = [("a", (t + timedelta(seconds=30 * i)).isoformat(), "35.0", "139.0") for i in range(5)]
+    rows[2] = ("a", rows[2][1], "nan", "139.0")
+    rows[3] = ("a", rows[3][1], "35.0", "inf")
+    res = client.post("/api/import/gps", files={"file": ("gps.csv", _gps_csv(rows), "text/csv")})
+    assert res.status_code == 200, res.text
+    assert res.json()["summary"]["fixes"] == 3
+    assert [b.location_id for b in timeline_api._timelines["a"].time_blocks] == ["hall"]
+
+
+def test_gps_import_does_not_mutate_stored_blocks(client):
+    client.post("/api/locations", json={"id": "hall", "name": "Hall", "geofence": {"lat": 35.0, "lng": 139.0, "radius_m": 50}})
+    block = {
+        "block_id": "manual",
+        "time_range": {"start": "2024-01-01T09:00:00", "end": "2024-01-01T10:00:00"},
+        "location_id": "hall",
+    }
+    client.post("/api/timeline", json={"character_id": "a", "time_blocks": [block]})
+    before = timeline_api._timelines["a"]
+    stored = before.time_blocks[0]
+
+    t = datetime(2024, 1, 1, 9, 10, 0)
+    rows = [("a", (t + timedelta(seconds=30 * i)).isoformat(), "35.0", "139.0") for i in range(5)]
+    res = client.post("/api/import/gps", files={"file": ("gps.csv", _gps_csv(rows), "text/csv")})
+    assert res.status_code == 200, res.text
+    assert res.json()["summary"]["updated"] == 1
+
+    assert stored.observations.presence is None
+    assert before.time_blocks == [stored]
+    assert timeline_api._timelines["a"].time_blocks[0].observations.presence.source == "gps"
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta
+
+from app.models import CharacterTimeline, Observations, PresenceObservation, TimeBlock, TimeRange
+
+from app.services.import_service import (
+    CONTACT_GAP_MINUTES,
+    PairIntervals,
+    _connected_components,
+    build_contact_timeline,
+    build_contact_timeline_from_files,
+    canonical_groups,
+    compact_contact_timeline,
+    contact_append_cutoff,
+    expand_compacted_block,
+    extend_contact_timeline,
+    gps_block_id,
+    merge_gps_dwells,
+    parse_bt_contact_file,
+    parse_bt_contacts_stream,
+)
+
+_T0 = datetime(2024, 1, 1, 9, 0, 0)
+
+
+def _rows(rnd: random.Random, n: int, people: int = 8) -> list[dict]:
+    rows = []
+    t = _T0
+    for _ in range(n):
+        t += timedelta(seconds=rnd.choice([0, 1, 3, 8, 12, 40, 90]))
+        u, v = rnd.sample([f"u{i}" for i in range(people)], 2)
+        rows.append({"user_id": u, "contacted_user_id": v, "timestamp": t.isoformat()})
+    return rows
+
+
+def _reference(rows: list[dict], gap_minutes: float, window_seconds: float) -> list[tuple]:
+    """全行を時刻順に並べて「差 > min(gap, window)」で切り、ブロックごとに連結成分を取る。"""
+    threshold = min(timedelta(minutes=gap_minutes), timedelta(seconds=window_seconds))
+    edges = sorted(
+        ((datetime.fromisoformat(r["timestamp"]), r["user_id"], r["contacted_user_id"]) for r in rows),
+        key=lambda x: x[0],
+    )
+    blocks: list[list[tuple]] = []
+    for e in edges:
+        if blocks and e[0] - blocks[-1][-1][0] <= threshold:
+            blocks[-1].append(e)
+        else:
+            blocks.append([e])
+    return [
+        (b[0][0].isoformat(), b[-1][0].isoformat(), canonical_groups(_connected_components([(u, v) for _, u, v in b])))
+        for b in blocks
+    ]
+
+
+def _canon(timeline: list[dict]) -> list[tuple]:
+    return [(b["start"], b["end"], canonical_groups(b["groups"])) for b in timeline]
+
+
+def test_streaming_contact_timeline_matches_sorted_reference():
+    rnd = random.Random(8)
+    for _ in range(30):
+        rows = _rows(rnd, rnd.randrange(1, 300))
+        gap, window = rnd.choice([(0.5, 10.0), (1.0, 10.0), (0.1, 30.0)])
+        expected = _reference(rows, gap, window)
+        assert _canon(build_contact_timeline(rows, gap, window, engine="python")) == expected
+        assert _canon(build_contact_timeline(rows, gap, window, engine="numpy")) == expected
+        # 順序が乱れた入力でも、並べ直して作った結果と同じ
+        rnd.shuffle(rows)
+        assert _canon(build_contact_timeline(rows, gap, window, engine="python")) == expected
+
+
+def test_extend_contact_timeline_matches_full_rebuild():
+    rnd = random.Random(9)
+    for engine in ("python", "numpy"):
+        for _ in range(30):
+            rows = _rows(rnd, rnd.randrange(2, 300))
+            cut = rnd.randrange(1, len(rows))
+            head, tail = rows[:cut], rows[cut:]
+            rnd.shuffle(tail)
+            timeline = build_contact_timeline(head, 0.5, 10.0, engine=engine)
+            stats: dict[str, int] = {}
+            extend_contact_timeline(timeline, tail, 0.5, 10.0, engine=engine, stats=stats)
+            assert stats["late_rows"] == 0
+            assert _canon(timeline) == _reference(rows, 0.5, 10.0)
+
+
+def _write_csv_text(rows: list[dict]) -> str:
+    lines = ["user_id,contacted_user_id,timestamp,is_contacted\n"]
+    lines += [f"{r['user_id']},{r['contacted_user_id']},{r['timestamp']},true\n" for r in rows]
+    return "".join(lines)
+
+
+def _write_csv(path, rows: list[dict]) -> str:
+    path.write_text(_write_csv_text(rows))
+    return str(path)
+
+
+def test_contact_files_match_single_import(tmp_path):
+    rnd = random.Random(11)
+    reopened = 0
+    for n in range(20):
+        rows = _rows(rnd, rnd.randrange(2, 300))
+        cut = rnd.randrange(1, len(rows))
+        head, tail = rows[:cut], rows[cut:]
+        files = [head[i::3] for i in range(3)]
+        parsed = [parse_bt_contact_file(_write_csv(tmp_path / f"{n}h{i}.csv", f)) for i, f in enumerate(files)]
+        timeline = build_contact_timeline_from_files(parsed)["contact_timeline"]
+        assert _canon(timeline) == _reference(head, CONTACT_GAP_MINUTES, 10.0)
+
+        since = contact_append_cutoff(timeline)
+        files = [tail[i::2] for i in range(2)]
+        parsed = [parse_bt_contact_file(_write_csv(tmp_path / f"{n}t{i}.csv", f), since) for i, f in enumerate(files)]
+        result = build_contact_timeline_from_files(parsed, timeline)
+        assert result["append"]["late_rows"] == 0
+        assert _canon(result["contact_timeline"]) == _reference(rows, CONTACT_GAP_MINUTES, 10.0)
+        reopened += result["append"]["reopened_rows"]
+    # 最後のブロックに合流する場合も通っている
+    assert reopened > 0
+
+
+def test_append_skips_late_rows_in_pair_intervals():
+    rnd = random.Random(17)
+    rows = _rows(rnd, 200)
+    timeline = build_contact_timeline(rows[:150], CONTACT_GAP_MINUTES, 10.0)
+    # 最後のブロックより前の行（late）を混ぜて追記する
+    late = rows[:20]
+    body = _write_csv_text(late + rows[150:])
+    result = parse_bt_contacts_stream([body.encode()], timeline)
+    assert result["append"]["late_rows"] == len(late)
+
+    expected = PairIntervals()
+    for r in rows[150:]:
+        expected.add(r["user_id"], r["contacted_user_id"], datetime.fromisoformat(r["timestamp"]))
+    assert sorted(result["pair_intervals"].intervals()) == sorted(expected.intervals())
+
+
+def _seconds_between(a: str, b: str) -> float:
+    return (datetime.fromisoformat(b) - datetime.fromisoformat(a)).total_seconds()
+
+
+def test_compaction_round_trips_and_appends_like_full_import():
+    rnd = random.Random(15)
+    gap = 30.0
+    for _ in range(20):
+        rows = _rows(rnd, rnd.randrange(2, 300), people=3)
+        full = build_contact_timeline(rows, CONTACT_GAP_MINUTES, 10.0)
+        compacted = list(full)
+        compact_contact_timeline(compacted, gap)
+        # 展開すると元に戻り、まだまとめられる隣り合うブロックは残っていない
+        assert _canon([p for b in compacted for p in expand_compacted_block(b)]) == _canon(full)
+        for a, b in zip(compacted, compacted[1:]):
+            assert a["groups"] != b["groups"] or _seconds_between(a["end"], b["start"]) >= gap
+
+        # 圧縮済みのタイムラインへの追記は、全部を取り込んでから圧縮したものと同じ
+        cut = rnd.randrange(1, len(rows))
+        head = parse_bt_contacts_stream([_write_csv_text(rows[:cut]).encode()], compact_gap_seconds=gap)
+        appended = parse_bt_contacts_stream(
+            [_write_csv_text(rows[cut:]).encode()], list(head["contact_timeline"]), compact_gap_seconds=gap,
+        )
+        assert appended["contact_timeline"] == compacted
+
+
+def _merge_dwells_reference(timeline: CharacterTimeline, character_id: str, dwells: list[dict]) -> tuple[list, dict]:
+    """滞在ごとに既存ブロックを全部見て、重なるものを探す。"""
+    existing = sorted(timeline.time_blocks, key=lambda b: b.time_range.start)
+    stats = {"added": 0, "updated": 0, "conflicts": 0}
+    added = []
+    for d in dwells:
+        block_id = gps_block_id(character_id, d["start"])
+        presence = PresenceObservation(confidence=d["confidence"], source="gps")
+        overlap = [
+            k for k, b in enumerate(existing)
+            if b.time_range.start <= d["end"] and b.time_range.end >= d["start"] and b.block_id != block_id
+        ]
+        same = [k for k in overlap if existing[k].location_id == d["location_id"]]
+        own = [k for k, b in enumerate(existing) if b.block_id == block_id]
+        if own:
+            old = existing[own[0]]
+            existing[own[0]] = old.model_copy(update={
+                "time_range": TimeRange(start=d["start"], end=d["end"]),
+                "location_id": d["location_id"],
+                "observations": old.observations.model_copy(update={"presence": presence}),
+            })
+            stats["updated"] += 1
+        elif same:
+            old = existing[same[0]]
+            if old.observations.presence is None or old.observations.presence.confidence < d["confidence"]:
+                existing[same[0]] = old.model_copy(update={
+                    "observations": old.observations.model_copy(update={"presence": presence}),
+                })
+                stats["updated"] += 1
+        else:
+            added.append((d["start"], block_id, d["location_id"]))
+            stats["added"] += 1
+            stats["conflicts"] += len(overlap) > len(same)
+    blocks = [(b.time_range.start, b.block_id, b.location_id, b.time_range.end, b.observations.presence) for b in existing]
+    return sorted(blocks + [(s, i, loc, None, None) for s, i, loc in added], key=lambda x: (x[0], x[1])), stats
+
+
+def test_merge_gps_dwells_matches_full_scan():
+    rnd = random.Random(19)
+    places = ["hall", "library", "garden"]
+    for _ in range(40):
+        blocks = []
+        for n in range(rnd.randrange(30)):
+            start = _T0 + timedelta(minutes=rnd.randrange(600))
+            # ときどき長いブロック（以前は左端に残ってそれ以降を毎回見直していた）
+            length = rnd.choice([5, 20, 60, 600])
+            blocks.append(TimeBlock(
+                block_id=f"b{n}",
+                time_range=TimeRange(start=start, end=start + timedelta(minutes=rnd.randrange(length))),
+                location_id=rnd.choice(places),
+                observations=Observations(presence=PresenceObservation(confidence=rnd.random(), source="manual")),
+            ))
+        timeline = CharacterTimeline(character_id="a", time_blocks=blocks)
+        dwells = []
+        # 滞在の開始は分単位で重ならない（同じ開始なら同じ block_id になる）
+        for minute in sorted(rnd.sample(range(600), rnd.randrange(30))):
+            start = _T0 + timedelta(minutes=minute)
+            dwells.append({
+                "start": start,
+                "end": start + timedelta(minutes=rnd.randrange(1, 90)),
+                "location_id": rnd.choice(places),
+                "confidence": rnd.random(),
+            })
+        # 2回目は前回の GPS ブロックを置き換える（一部は場所・長さを変える）
+        for _ in range(2):
+            expected, expected_stats = _merge_dwells_reference(timeline, "a", dwells)
+            timeline, stats = merge_gps_dwells(timeline, "a", dwells)
+            got = sorted(
+                (b.time_range.start, b.block_id, b.location_id, b.time_range.end, b.observations.presence)
+                for b in timeline.time_blocks
+            )
+            assert [g[:3] for g in got] == [e[:3] for e in expected]
+            assert [(g[3], g[4]) for g, e in zip(got, expected) if e[3] is not None] == [
+                (e[3], e[4]) for e in expected if e[3] is not None
+            ]
+            assert stats == expected_stats
+            for d in dwells:
+                if rnd.random() < 0.3:
+                    d["end"] = d["start"] + timedelta(minutes=rnd.randrange(1, 90))
+                    d["location_id"] = rnd.choice(places)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.models import CharacterTimeline, TimeBlock
+from app.services.inference_service import DerivedEngine, SuspectRanking
+
+_T0 = datetime(2024, 1, 1, 20, 0, 0)
+_WINDOW = ("2024-01-01T21:00:00", "2024-01-01T22:00:00")
+
+
+def _travel(location_ids: list[str]) -> np.ndarray:
+    n = len(location_ids)
+    return np.full((n, n), 600.0) - np.eye(n) * 600.0
+
+
+def _timeline(rnd: random.Random, cid: str) -> CharacterTimeline:
+    blocks = []
+    t = _T0 + timedelta(minutes=rnd.randrange(30))
+    for i in range(rnd.randrange(0, 6)):
+        end = t + timedelta(minutes=rnd.randrange(5, 40))
+        blocks.append(TimeBlock(
+            block_id=f"{cid}-{i}",
+            time_range={"start": t, "end": end},
+            location_id=rnd.choice(["hall", "library", "garden", "cellar", "attic"]),
+        ))
+        t = end + timedelta(minutes=rnd.randrange(0, 20))
+    return CharacterTimeline(character_id=cid, time_blocks=blocks)
+
+
+def test_derived_engine_incremental_matches_fresh_engine():
+    rnd = random.Random(20)
+    ids = [f"c{i}" for i in range(7)]
+    timelines = {cid: _timeline(rnd, cid) for cid in ids}
+    revisions = {cid: i + 1 for i, cid in enumerate(ids)}
+    rev = len(ids)
+    engine = DerivedEngine()
+    for _ in range(60):
+        cid = rnd.choice(ids)
+        rev += 1
+        timelines[cid] = _timeline(rnd, cid)
+        revisions[cid] = rev
+        changed = engine.compute(timelines, revisions, "c0", _WINDOW, _travel, travel_key=1)
+        assert cid in changed
+
+        fresh = DerivedEngine().compute(timelines, revisions, "c0", _WINDOW, _travel, travel_key=1)
+        assert {k: v[1] for k, v in engine._results.items()} == fresh
+
+
+def test_derived_endpoint_does_not_mutate_engine_results(client, monkeypatch):
+    from app.api import timeline as timeline_api
+
+    monkeypatch.setattr(timeline_api, "_derived", DerivedEngine())
+    for cid, loc in (("victim", "hall"), ("a", "hall"), ("b", "library")):
+        block = {
+            "block_id": f"{cid}-0",
+            "time_range": {"start": "2024-01-01T21:00:00", "end": "2024-01-01T21:30:00"},
+            "location_id": loc,
+        }
+        client.post("/api/timeline", json={"character_id": cid, "time_blocks": [block]})
+
+    params = {"victim": "victim", "window_start": _WINDOW[0], "window_end": _WINDOW[1]}
+    res = client.post("/api/timeline/derived", params=params)
+    assert res.status_code == 200, res.text
+    assert res.json()["derived"]["a"]["suspect_score_total"] > 0
+    # エンジンが覚えている結果は書き換えない
+    for cid, (_, stats) in timeline_api._derived._results.items():
+        assert stats.suspect_score_total == 0.0
+        assert stats is not timeline_api._timelines[cid].derived
+
+
+def test_suspect_ranking_top_matches_sort():
+    rnd = random.Random(21)
+    ranking = SuspectRanking()
+    scores: dict[str, float] = {}
+    people = [f"c{i}" for i in range(30)]
+    for _ in range(3000):
+        cid = rnd.choice(people)
+        op = rnd.random()
+        if op < 0.4:
+            # 同じスコアで積み直すこともある
+            score = rnd.randrange(6) / 2
+            ranking.set(cid, score)
+            scores[cid] = score
+        elif op < 0.7:
+            ranking.add(cid, 0.5)
+            scores[cid] = scores.get(cid, 0.0) + 0.5
+        elif op < 0.85:
+            ranking.remove(cid)
+            scores.pop(cid, None)
+        else:
+            k = rnd.randrange(1, 12)
+            exclude = set(rnd.sample(people, rnd.randrange(4)))
+            expected = sorted((-s, c) for c, s in scores.items() if c not in exclude)[:k]
+            assert ranking.top(k, exclude) == [(c, -s) for s, c in expected]
+        assert len(ranking) == len(scores)
+    assert len(ranking._heap) <= 2 * len(scores) + 65
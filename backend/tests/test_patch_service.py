@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import copy
+
+import pytest
+
+from app.models import Event, Location
+from app.services.patch_service import PatchError, apply_patch, apply_patch_logged
+from app.services.storage_service import replay_patch_log
+
+_EVENT = Event.model_validate({
+    "id": "e1",
+    "title": "dinner",
+    "time_range": {"start": "2024-01-01T19:00:00", "end": "2024-01-01T20:00:00"},
+    "location_ids": ["hall", "kitchen"],
+    "participants": ["a", "b", "c"],
+    "payload": {"menu": {"main": "fish", "dessert": "cake"}, "guests": 3},
+    "links": {"claim_ids": ["c1"]},
+})
+
+
+def _merge_reference(target, patch):
+    """RFC 7396 をそのまま JSON に当てる。"""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = _merge_reference(result.get(key), value)
+    return result
+
+
+def _json_patch_reference(doc, operations):
+    """RFC 6902 をそのまま JSON に当てる（パスは ~ / / を含まないものだけ）。"""
+    doc = copy.deepcopy(doc)
+
+    def walk(path):
+        tokens = path[1:].split("/")
+        parent = doc
+        for t in tokens[:-1]:
+            parent = parent[int(t)] if isinstance(parent, list) else parent[t]
+        return parent, tokens[-1]
+
+    def get(path):
+        parent, t = walk(path)
+        return parent[int(t)] if isinstance(parent, list) else parent[t]
+
+    def remove(path):
+        parent, t = walk(path)
+        return parent.pop(int(t) if isinstance(parent, list) else t)
+
+    def add(path, value):
+        parent, t = walk(path)
+        if isinstance(parent, list):
+            parent.insert(len(parent) if t == "-" else int(t), value)
+        else:
+            parent[t] = value
+
+    for op in operations:
+        name = op["op"]
+        if name == "add":
+            add(op["path"], copy.deepcopy(op["value"]))
+        elif name == "remove":
+            remove(op["path"])
+        elif name == "replace":
+            remove(op["path"])
+            add(op["path"], copy.deepcopy(op["value"]))
+        elif name == "move":
+            add(op["path"], remove(op["from"]))
+        elif name == "copy":
+            add(op["path"], copy.deepcopy(get(op["from"])))
+        elif name == "test":
+            assert get(op["path"]) == op["value"]
+    return doc
+
+
+def _dump(model):
+    return model.model_dump(mode="json")
+
+
+_MERGE_PATCHES = [
+    {"title": "supper"},
+    {"payload": {"menu": {"main": None, "drink": "wine"}, "guests": 4}},
+    {"payload": {"menu": "none"}},
+    {"time_range": {"end": "2024-01-01T21:00:00"}, "location_ids": ["hall"]},
+    {"links": {"claim_ids": None}, "content": "x"},
+]
+
+_JSON_PATCHES = [
+    [{"op": "replace", "path": "/title", "value": "supper"}],
+    [{"op": "add", "path": "/participants/1", "value": "d"}, {"op": "remove", "path": "/participants/0"}],
+    [{"op": "add", "path": "/location_ids/-", "value": "garden"}],
+    [{"op": "move", "from": "/payload/menu/main", "path": "/payload/main"}],
+    [{"op": "copy", "from": "/participants/2", "path": "/links/claim_ids/0"}],
+    [{"op": "test", "path": "/payload/guests", "value": 3}, {"op": "replace", "path": "/payload/guests", "value": 4}],
+    [{"op": "replace", "path": "/time_range/start", "value": "2024-01-01T18:30:00"}],
+]
+
+
+@pytest.mark.parametrize("patch", _MERGE_PATCHES)
+def test_merge_patch_matches_reference(patch):
+    expected = Event.model_validate(_merge_reference(_dump(_EVENT), patch))
+    assert _dump(apply_patch(_EVENT, patch)) == _dump(expected)
+
+
+@pytest.mark.parametrize("operations", _JSON_PATCHES)
+def test_json_patch_matches_reference(operations):
+    expected = Event.model_validate(_json_patch_reference(_dump(_EVENT), operations))
+    assert _dump(apply_patch(_EVENT, operations)) == _dump(expected)
+
+
+@pytest.mark.parametrize("patch", _MERGE_PATCHES + _JSON_PATCHES + [
+    [{"op": "remove", "path": "/payload"}, {"op": "add", "path": "/participants/-", "value": "z"}],
+    [{"op": "replace", "path": "", "value": {**_dump(_EVENT), "id": "e2", "participants": []}}, {"op": "add", "path": "/content", "value": "y"}],
+])
+def test_patch_log_replays_to_same_document(patch):
+    # WAL に書く変更ログを元の JSON に当て直すと、パッチを当てたモデルと同じになる
+    patched, log = apply_patch_logged(_EVENT, patch)
+    replayed = replay_patch_log(_dump(_EVENT), copy.deepcopy(log))
+    assert replayed == _dump(patched)
+
+
+def test_failed_json_patch_leaves_original():
+    before = _dump(_EVENT)
+    with pytest.raises(PatchError):
+        apply_patch(_EVENT, [
+            {"op": "remove", "path": "/participants/0"},
+            {"op": "test", "path": "/title", "value": "lunch"},
+        ])
+    assert _dump(_EVENT) == before
+
+
+_LOCATION = {
+    "id": "hall",
+    "name": "Hall",
+    "geofence": {"lat": 35.0, "lng": 139.0, "radius_m": 50},
+    "adjacent": [{"to_location_id": "kitchen", "travel_seconds": 30}],
+}
+
+
+@pytest.mark.parametrize("patch", [
+    {"geofence": {"lat": 500}},
+    {"geofence": {"radius_m": -3}},
+    {"geofence": {"lat": 500, "radius_m": -3}},
+    [{"op": "replace", "path": "/adjacent/0/travel_seconds", "value": -100}],
+    [{"op": "add", "path": "/adjacent/-", "value": {"to_location_id": "x", "travel_seconds": -1}}],
+    [{"op": "replace", "path": "/geofence/lng", "value": 181}],
+])
+def test_patch_rejects_what_put_rejects(client, patch):
+    client.post("/api/locations", json=_LOCATION)
+    if isinstance(patch, dict):
+        put_body = _merge_reference(_LOCATION, patch)
+    else:
+        put_body = _json_patch_reference(_LOCATION, patch)
+    assert client.put("/api/locations/hall", json=put_body).status_code == 422
+
+    res = client.patch("/api/locations/hall", json=patch)
+    assert res.status_code == 400, res.text
+    assert client.get("/api/locations/hall").json() == _dump(Location.model_validate(_LOCATION))
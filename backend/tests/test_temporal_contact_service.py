@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import random
+
+from app.services.temporal_contact_service import TemporalConnectivity
+
+
+def _brute_snapshot(intervals: list[tuple[str, str, float, float]], t: float) -> tuple:
+    parent: dict[str, str] = {}
+
+    def find(x: str) -> str:
+        while parent[x] != x:
+            x = parent[x]
+        return x
+
+    for a, b, s, e in intervals:
+        if s <= t < e:
+            parent.setdefault(a, a)
+            parent.setdefault(b, b)
+            parent[find(a)] = find(b)
+    comps: dict[str, list[str]] = {}
+    for x in parent:
+        comps.setdefault(find(x), []).append(x)
+    groups = [tuple(sorted(g)) for g in comps.values() if len(g) > 1]
+    return tuple(sorted(groups, key=lambda g: (-len(g), g)))
+
+
+def test_snapshot_matches_brute_force():
+    rnd = random.Random(17)
+    people = [f"p{i}" for i in range(10)]
+    for _ in range(100):
+        intervals = []
+        for _ in range(rnd.randrange(1, 60)):
+            a, b = rnd.sample(people, 2)
+            s = float(rnd.randrange(100))
+            intervals.append((a, b, s, s + rnd.randrange(1, 30)))
+        index = TemporalConnectivity(intervals)
+        for t in [x / 2 for x in range(-4, 270)]:
+            assert index.snapshot(t) == _brute_snapshot(intervals, t)
+        # 隣り合う区間は構成が違う
+        for i in range(1, len(index)):
+            assert index.partitions[i] != index.partitions[i - 1]
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import copy
+import random
+from datetime import datetime, timedelta
+
+from app.api import timeline as timeline_api
+from app.services.inference_service import suspect_score
+from app.services.storage_service import StorageEngine, replay_patch_log
+
+_T0 = datetime(2024, 1, 1, 20, 0, 0)
+_PLACES = ["hall", "library", "garden"]
+
+
+def _block(rnd: random.Random, block_id: str) -> dict:
+    start = _T0 + timedelta(minutes=rnd.randrange(240))
+    return {
+        "block_id": block_id,
+        "time_range": {
+            "start": start.isoformat(),
+            "end": (start + timedelta(minutes=rnd.randrange(0, 60))).isoformat(),
+        },
+        "location_id": rnd.choice(_PLACES),
+        # 0.25 刻みなら足す順番によらず合計が一致する
+        "interpretation": {"suspicion_delta": rnd.randrange(8) / 4, "alibi_strength": rnd.randrange(4) / 4},
+    }
+
+
+def _timeline(rnd: random.Random, character_id: str) -> dict:
+    return {
+        "character_id": character_id,
+        "time_blocks": [_block(rnd, f"{character_id}-{i}") for i in range(rnd.randrange(5))],
+    }
+
+
+def test_suspect_ranking_matches_sorted_scores(client):
+    rnd = random.Random(21)
+    people = [f"c{i}" for i in range(8)]
+    n = 0
+    for _ in range(200):
+        cid = rnd.choice(people)
+        exists = cid in timeline_api._timelines
+        op = rnd.random()
+        if not exists or op < 0.2:
+            assert client.post("/api/timeline", json=_timeline(rnd, cid)).status_code == 201
+        elif op < 0.5:
+            n += 1
+            res = client.post(f"/api/timeline/{cid}/blocks", params={"allow_overlap": True}, json=_block(rnd, f"x{n}"))
+            assert res.status_code == 201
+        elif op < 0.7 and timeline_api._timelines[cid].time_blocks:
+            patch = [{"op": "replace", "path": "/time_blocks/0/interpretation/suspicion_delta", "value": rnd.randrange(8) / 4}]
+            assert client.patch(f"/api/timeline/{cid}", json=patch).status_code == 204
+        elif op < 0.8:
+            assert client.put(f"/api/timeline/{cid}", json=_timeline(rnd, cid)).status_code == 200
+        else:
+            assert client.delete(f"/api/timeline/{cid}").status_code == 204
+
+        expected = sorted((-suspect_score(tl), c) for c, tl in timeline_api._timelines.items())
+        res = client.get("/api/inference/suspects", params={"k": len(people)})
+        assert [(r["character_id"], r["score"]) for r in res.json()] == [(c, round(-s, 3)) for s, c in expected]
+
+
+def _ts(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def test_block_insert_and_range_query_match_scan(client):
+    rnd = random.Random(24)
+    # 並んでいないブロックで作っても開始時刻順に並べ直す
+    body = {"character_id": "a", "time_blocks": [_block(rnd, f"init{i}") for i in range(5)]}
+    assert client.post("/api/timeline", json=body).status_code == 201
+    for n in range(150):
+        block = _block(rnd, f"b{n}")
+        start, end = _ts(block["time_range"]["start"]), _ts(block["time_range"]["end"])
+        current = timeline_api._timelines["a"].time_blocks
+        clash = any(
+            b.location_id != block["location_id"]
+            and b.time_range.start.timestamp() < end and start < b.time_range.end.timestamp()
+            for b in current
+        )
+        allow = rnd.random() < 0.3
+        res = client.post("/api/timeline/a/blocks", params={"allow_overlap": allow}, json=block)
+        assert res.status_code == (400 if clash and not allow else 201), res.text
+
+        blocks = timeline_api._timelines["a"].time_blocks
+        starts = [b.time_range.start for b in blocks]
+        assert starts == sorted(starts)
+
+        t_from = _T0 + timedelta(minutes=rnd.randrange(-30, 300))
+        t_to = t_from + timedelta(minutes=rnd.randrange(0, 90))
+        res = client.get("/api/timeline/a/blocks", params={"from": t_from.isoformat(), "to": t_to.isoformat()})
+        expected = [b.block_id for b in blocks if b.time_range.end >= t_from and b.time_range.start <= t_to]
+        assert [b["block_id"] for b in res.json()] == expected
+
+
+class _RecordingEngine(StorageEngine):
+    """WAL に書くはずのレコードを覚えておく。"""
+
+    def __init__(self):
+        self.records: list[tuple] = []
+
+    def record_set(self, table, key, value):
+        self.records.append(("set", key, value.model_dump(mode="json")))
+
+    def record_patch(self, table, key, log):
+        self.records.append(("patch", key, copy.deepcopy(log)))
+
+    def record_delete(self, table, key):
+        self.records.append(("del", key, None))
+
+
+def test_wal_records_replay_to_timelines(client, monkeypatch):
+    rnd = random.Random(1)
+    engine = _RecordingEngine()
+    monkeypatch.setattr(timeline_api._timelines, "_engine", engine)
+    for cid in ("a", "b"):
+        assert client.post("/api/timeline", json=_timeline(rnd, cid)).status_code == 201
+    for n in range(120):
+        cid = rnd.choice(["a", "b"])
+        op = rnd.random()
+        if op < 0.6:
+            start = len(engine.records)
+            res = client.post(f"/api/timeline/{cid}/blocks", params={"allow_overlap": True}, json=_block(rnd, f"x{n}"))
+            assert res.status_code == 201
+            # ブロックの追加はタイムライン全体ではなく挿入したブロックだけを記録する
+            [(kind, _, log)] = engine.records[start:]
+            assert kind == "patch" and [o["op"] for o in log] == ["insert"]
+        elif op < 0.8 and timeline_api._timelines[cid].time_blocks:
+            i = rnd.randrange(len(timeline_api._timelines[cid].time_blocks))
+            patch = rnd.choice([
+                [{"op": "replace", "path": f"/time_blocks/{i}/interpretation/alibi_strength", "value": 0.5}],
+                [{"op": "remove", "path": f"/time_blocks/{i}"}],
+                # 開始時刻が変わって並べ替えが起きることがある
+                [{"op": "replace", "path": f"/time_blocks/{i}/time_range/start", "value": _T0.isoformat()}],
+            ])
+            assert client.patch(f"/api/timeline/{cid}", json=patch).status_code == 204
+        else:
+            assert client.put(f"/api/timeline/{cid}", json=_timeline(rnd, cid)).status_code == 200
+
+    replayed: dict[str, dict] = {}
+    for kind, key, value in engine.records:
+        if kind == "set":
+            replayed[key] = value
+        elif kind == "patch":
+            replayed[key] = replay_patch_log(replayed[key], value)
+        else:
+            replayed.pop(key, None)
+    assert replayed == {cid: tl.model_dump(mode="json") for cid, tl in timeline_api._timelines.items()}
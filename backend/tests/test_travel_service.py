@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import heapq
+import math
+import random
+
+from app.models import Location
+from app.services.travel_service import TravelMatrix
+
+
+def _dijkstra(locations: list[Location], source: str) -> dict[str, float]:
+    known = {loc.id for loc in locations}
+    adj: dict[str, list[tuple[str, float]]] = {}
+    for loc in locations:
+        for e in loc.adjacent:
+            if e.to_location_id in known:
+                adj.setdefault(loc.id, []).append((e.to_location_id, e.travel_seconds))
+                if not e.one_way:
+                    adj.setdefault(e.to_location_id, []).append((loc.id, e.travel_seconds))
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for v, w in adj.get(u, ()):
+            if d + w < dist.get(v, math.inf):
+                dist[v] = d + w
+                heapq.heappush(heap, (d + w, v))
+    return dist
+
+
+def test_travel_matrix_matches_dijkstra():
+    rnd = random.Random(23)
+    for _ in range(30):
+        ids = [f"p{i}" for i in range(rnd.randrange(1, 9))]
+        locations = [
+            Location(id=location_id, name=location_id, adjacent=[
+                {
+                    # 存在しない場所への辺は無視される
+                    "to_location_id": rnd.choice(ids + ["missing"]),
+                    "travel_seconds": rnd.randrange(0, 300),
+                    "one_way": rnd.random() < 0.3,
+                }
+                for _ in range(rnd.randrange(3))
+            ])
+            for location_id in ids
+        ]
+        travel = TravelMatrix(locations)
+        for a in ids:
+            dist = _dijkstra(locations, a)
+            for b in ids:
+                seconds = travel.seconds(a, b)
+                if a == b:
+                    assert seconds == 0.0
+                elif a not in travel.index or b not in travel.index:
+                    # 辺が1本もない場所は移動時間が分からない
+                    assert seconds is None
+                else:
+                    assert seconds == dist.get(b, math.inf)
+        # DerivedEngine に渡す行列: 分からない組は 0
+        matrix = travel.matrix(ids)
+        for i, a in enumerate(ids):
+            for j, b in enumerate(ids):
+                assert matrix[i, j] == (travel.seconds(a, b) or 0.0)
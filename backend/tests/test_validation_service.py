@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta
+
+from app.models import CharacterTimeline, Event, TimeBlock
+from app.services.validation_service import find_timeline_conflicts
+
+_T0 = datetime(2024, 1, 1, 20, 0, 0)
+_PLACES = ["hall", "library", "garden", "cellar"]
+
+
+def _range(rnd: random.Random) -> dict:
+    start = _T0 + timedelta(minutes=rnd.randrange(120))
+    return {"start": start, "end": start + timedelta(minutes=rnd.randrange(1, 40))}
+
+
+def _overlaps(a, b) -> bool:
+    return max(a.start, b.start) < min(a.end, b.end)
+
+
+def _brute(timelines: list[CharacterTimeline], events: list[Event]) -> set[tuple]:
+    found = set()
+    for tl in timelines:
+        blocks = tl.time_blocks
+        for i, a in enumerate(blocks):
+            for b in blocks[i + 1:]:
+                if a.location_id != b.location_id and _overlaps(a.time_range, b.time_range):
+                    found.add(("location_overlap", tl.character_id, frozenset((a.block_id, b.block_id))))
+            for event in events:
+                if (tl.character_id in event.participants and event.location_ids
+                        and a.location_id not in event.location_ids and _overlaps(a.time_range, event.time_range)):
+                    found.add(("event_participant_elsewhere", tl.character_id, event.id, a.block_id))
+    return found
+
+
+def _canon(conflicts: list[dict]) -> set[tuple]:
+    found = set()
+    for c in conflicts:
+        if c["kind"] == "location_overlap":
+            found.add((c["kind"], c["character_id"], frozenset(c["block_ids"])))
+        else:
+            found.add((c["kind"], c["character_id"], c["event_id"], c["block_id"]))
+    assert len(found) == len(conflicts)
+    return found
+
+
+def test_conflicts_match_pairwise_check():
+    rnd = random.Random(22)
+    people = ["a", "b", "c"]
+    for _ in range(40):
+        timelines = [
+            CharacterTimeline(character_id=cid, time_blocks=[
+                TimeBlock(block_id=f"{cid}{i}", time_range=_range(rnd), location_id=rnd.choice(_PLACES))
+                for i in range(rnd.randrange(12))
+            ])
+            for cid in people
+        ]
+        events = [
+            Event(
+                id=f"e{i}",
+                time_range=_range(rnd),
+                location_ids=rnd.sample(_PLACES, rnd.randrange(3)),
+                participants=rnd.sample(people, rnd.randrange(1, 3)),
+            )
+            for i in range(rnd.randrange(5))
+        ]
+        assert _canon(find_timeline_conflicts(timelines, events)) == _brute(timelines, events)
@@ -204,13 +204,8 @@ export default function EditCharacterModal({
   const handleDeleteFromGraph = async () => {
     if (!confirm("グラフからこの人物を削除しますか？")) return;
     try {
-      const connected = graphEdges.filter(
-        (e) => e.source_node_id === node.node_id || e.target_node_id === node.node_id
-      );
-      for (const e of connected) {
-        await fetch(`/api/graph/edges/${e.edge_id}`, { method: "DELETE" });
-      }
-      await fetch(`/api/graph/nodes/${node.node_id}`, { method: "DELETE" });
+      // 接続エッジはサーバー側でまとめて削除
+      await fetch(`/api/graph/nodes/${node.node_id}?cascade=true`, { method: "DELETE" });
       onDeletedFromGraph();
       onClose();
     } catch (e) {
@@ -1369,25 +1369,15 @@ const GraphTab: React.FC<GraphTabProps> = ({
     // #endregion
 
     try {
+      // 接続するエッジはサーバー側でまとめて削除する（ノード1つにつきリクエスト1回）
       const deleteNode = async (nodeId: string) => {
-        const res = await fetch(`/api/graph/nodes/${nodeId}`, { method: "DELETE" });
+        const res = await fetch(`/api/graph/nodes/${nodeId}?cascade=true`, { method: "DELETE" });
         if (!res.ok) throw new Error(`ノード削除失敗: ${nodeId}`);
       };
-      const deleteEdge = async (edgeId: string) => {
-        const res = await fetch(`/api/graph/edges/${edgeId}`, { method: "DELETE" });
-        if (!res.ok) throw new Error(`エッジ削除失敗: ${edgeId}`);
-      };
 
       let wasLastRepresentation: boolean;
       if (editEventLogicId != null && editEventLogicId !== "") {
         if (containedNodes.length > 0) {
-          const edgeIds = new Set<string>();
-          for (const n of containedNodes) {
-            graphEdges.forEach((e) => {
-              if (e.source_node_id === n.node_id || e.target_node_id === n.node_id) edgeIds.add(e.edge_id);
-            });
-          }
-          for (const eid of edgeIds) await deleteEdge(eid);
           for (const n of containedNodes) await deleteNode(n.node_id);
         } else {
           setEmptyEventInstances((prev) =>
@@ -1410,13 +1400,6 @@ const GraphTab: React.FC<GraphTabProps> = ({
         wasLastRepresentation = otherNodes.length === 0 && otherEmpties.length === 0;
       } else {
         const nodesToRemove = graphNodes.filter((n) => n.event_id === editEventId);
-        const edgeIds = new Set<string>();
-        for (const n of nodesToRemove) {
-          graphEdges.forEach((e) => {
-            if (e.source_node_id === n.node_id || e.target_node_id === n.node_id) edgeIds.add(e.edge_id);
-          });
-        }
-        for (const eid of edgeIds) await deleteEdge(eid);
         for (const n of nodesToRemove) await deleteNode(n.node_id);
         setEmptyEventInstances((prev) => prev.filter((p) => p.eventId !== editEventId));
         wasLastRepresentation = true;
@@ -1442,7 +1425,6 @@ const GraphTab: React.FC<GraphTabProps> = ({
     editInstanceId,
     containedNodes,
     graphNodes,
-    graphEdges,
     emptyEventInstances,
     nodeToLogic,
     refreshGraph,